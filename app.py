@@ -1,36 +1,288 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, g, Response
 from flask_socketio import SocketIO, emit, join_room, leave_room
-from datetime import datetime
+import json
+import logging
+import os
 import sqlite3
-from werkzeug.security import generate_password_hash, check_password_hash
 import secrets
 import re
 from functools import wraps
 
+from pool import PoolConexiones
+from ejecutor import EjecutorDB, EjecutorOcupado
+from db import migrar
+import busqueda
+import cambios
+from archivo import ArchivoMensajes, carpeta_por_defecto
+from claves import HasherClaves, LimitadorIntentos, ServicioOcupado
+import conversaciones
+import votos
+from bus import opciones_socketio
+from presencia import PresenciaCompartida, PresenciaLocal
+from cache import CachePerfiles, CacheVersionada
+import bitacora
+from metricas import Perfilador, Registro, fabrica_conexion, instrumentar_flask, instrumentar_socketio
+from difusion import NAMESPACE_PROYECTOS, DifusionProyectos, DifusionSalas, instalar_umbral_deflate
+from escribiendo import AgregadorEscritura
+from escritura import ColaLlena, EscrituraDiferida, fecha_actual
+from recibos import RecibosPrivados
+from salas import SQL_PAGINA_SALA, HistorialSalas, mensaje_de_fila
+from consultas import (SQL_COMENTARIOS_PROYECTO, SQL_ENTREGAS_PENDIENTES, SQL_FEED_PROYECTOS,
+                       SQL_HAY_MAS_MENSAJES, SQL_MARCAR_LEIDOS, SQL_PAGINA_MENSAJES)
+from sesiones import COOKIE_SESION, FirmadorSesiones, token_de
+from paginacion import CursorInvalido, codificar_cursor, decodificar_cursor, limite_pagina
+
 
 #Nombre de la base de datos
-DB_PATH = "BaseDatos_TP.db"
+DB_PATH = os.environ.get("TECHPAINT_DB", "BaseDatos_TP.db")
+DB_POOL_SIZE = int(os.environ.get("TECHPAINT_DB_POOL", "8"))
+# Cola para repartir emits entre workers (ver bus.py); vacío = un solo proceso
+MQ_URL = os.environ.get("TECHPAINT_MQ", "")
+
+# Logs JSON por una cola con un hilo escritor (ver bitacora.py)
+bitacora.configurar(os.environ.get("TECHPAINT_LOG_NIVEL", "INFO"),
+                    maximo=int(os.environ.get("TECHPAINT_LOG_COLA", "10000")))
+log = bitacora.Bitacora(
+    "techpaint.app",
+    niveles=bitacora.leer_pares(os.environ.get("TECHPAINT_LOG_EVENTOS"), bitacora.nivel),
+    muestreo=bitacora.leer_pares(os.environ.get("TECHPAINT_LOG_MUESTREO"), float),
+)
 
 
 app = Flask(__name__)
 #PARTE CRITICA, ESTO CAMBIA LA CLAVE DE UNA ALEATEORIA Y SEGURA
-app.config['SECRET_KEY'] = secrets.token_hex(32)
+# Con varios workers (o para que las sesiones sobrevivan un reinicio) fijar TECHPAINT_SECRETO
+app.config['SECRET_KEY'] = os.environ.get("TECHPAINT_SECRETO") or secrets.token_hex(32)
 app.config['SESSION_COOKIE_SECURE'] = True # SOLO HTTPS en produccion
 app.config['SESSION_COOKIE_HTTPONLY'] = True # PROTEGE CONTRA XSS   
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
-socketio = SocketIO(app, cors_allowed_origins="*")
-
+socketio = SocketIO(app, cors_allowed_origins="*", **opciones_socketio(MQ_URL))
+
+# Latencia de rutas, eventos y SQL para /metrics; socketio.on queda envuelto
+# antes de que se registren los handlers de abajo
+metricas = Registro()
+instrumentar_flask(app, metricas)
+instrumentar_socketio(socketio, metricas)
+
+# SQLite en hilos del sistema: varios lectores y un escritor por vez (ver ejecutor.py)
+db_ejecutor = EjecutorDB(
+    lectores=int(os.environ.get("TECHPAINT_DB_LECTORES", "4")),
+    max_cola=int(os.environ.get("TECHPAINT_DB_COLA", "256")),
+    timeout=float(os.environ.get("TECHPAINT_DB_TIMEOUT", "10")),
+    modo=socketio.async_mode,
+)
+
+# Un pool por worker; en modo eventlet la espera cede el hub en vez de bloquearlo
+db_pool = PoolConexiones(DB_PATH, tamano_max=DB_POOL_SIZE, modo=socketio.async_mode,
+                         factory=fabrica_conexion(metricas), ejecutor=db_ejecutor)
+
+# Llevar el esquema a la última versión antes de atender requests. Con una
+# conexión propia y no del pool: un backfill largo no puede quedar cortado
+# por el timeout por sentencia del ejecutor (TECHPAINT_DB_TIMEOUT)
+conn = sqlite3.connect(DB_PATH, timeout=db_pool.timeout)
+try:
+    migrar(conn)
+finally:
+    conn.close()
 
 
 def get_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON")
-    return conn
-
-# Almacenar usuarios conectados en memoria
-connected_users = {}
-active_rooms = {}
+    """Conexión del pool asociada al request o evento de Socket.IO actual"""
+    if 'db' not in g:
+        g.db = db_pool.obtener()
+    return g.db
+
+@app.teardown_appcontext
+def liberar_db(exc):
+    conn = g.pop('db', None)
+    if conn is not None:
+        db_pool.liberar(conn)
+
+@app.errorhandler(EjecutorOcupado)
+def base_ocupada(e):
+    respuesta = jsonify({"success": False, "message": "Servidor ocupado, intenta de nuevo"})
+    respuesta.headers['Retry-After'] = '1'
+    return respuesta, 503
+
+@app.errorhandler(sqlite3.OperationalError)
+def consulta_cortada(e):
+    # Cortada por TECHPAINT_DB_TIMEOUT: misma respuesta que sin turno
+    if "interrupted" in str(e):
+        return base_ocupada(e)
+    raise e
+
+# Contraseñas: hash en un pool de hilos acotado, fuera del event loop
+hasher = HasherClaves(
+    metodo=os.environ.get("TECHPAINT_HASH", "scrypt:32768:8:1"),
+    hilos=int(os.environ.get("TECHPAINT_HASH_HILOS", "2")),
+    max_cola=int(os.environ.get("TECHPAINT_HASH_COLA", "64")),
+    modo=socketio.async_mode,
+)
+# Login: fallos por email y por IP antes de responder 429
+fallos_por_email = LimitadorIntentos(max_fallos=int(os.environ.get("TECHPAINT_LOGIN_FALLOS_EMAIL", "5")))
+fallos_por_ip = LimitadorIntentos(max_fallos=int(os.environ.get("TECHPAINT_LOGIN_FALLOS_IP", "20")))
+
+# Sesiones: token firmado con la SECRET_KEY, se verifica sin ir a la base
+sesiones = FirmadorSesiones(app.config['SECRET_KEY'],
+                            duracion=int(os.environ.get("TECHPAINT_SESION_HORAS", "12")) * 3600)
+# Perfiles de usuarios: las consultas calientes no hacen JOIN con usuarios
+perfiles = CachePerfiles(max_entradas=int(os.environ.get("TECHPAINT_PERFILES", "10000")),
+                         ttl=float(os.environ.get("TECHPAINT_PERFILES_TTL", "300")))
+# sid -> id del usuario autenticado al conectar el socket
+usuario_por_sid = {}
+
+
+def usuario_actual():
+    """Id del usuario de la sesión del request, o None"""
+    if 'usuario_id' not in g:
+        g.usuario_id = sesiones.verificar(token_de(request))
+    return g.usuario_id
+
+
+def requiere_sesion(vista):
+    @wraps(vista)
+    def con_sesion(*args, **kwargs):
+        if usuario_actual() is None:
+            return jsonify({"success": False, "message": "Sesión requerida"}), 401
+        return vista(*args, **kwargs)
+    return con_sesion
+
+
+def es_otro_usuario(user_id):
+    """Las rutas con el id en la URL sólo las puede leer ese usuario"""
+    return user_id != usuario_actual()
+
+
+# Usuarios conectados: en memoria con un solo worker, en SQLite si hay varios
+presencia = PresenciaCompartida(db_pool) if MQ_URL else PresenciaLocal()
+presencia.iniciar(socketio)
+
+# Mensajes privados: se entregan al instante y se guardan en lotes en segundo plano
+escritura = EscrituraDiferida(
+    db_pool,
+    al_guardar=lambda sid, aviso: socketio.emit('private_message_saved', aviso, to=sid),
+    maximo=int(os.environ.get("TECHPAINT_COLA_MENSAJES", "10000")),
+)
+escritura.iniciar(socketio)
+
+# Historial de salas: buffer circular por sala en memoria + mensajes_sala en lotes
+historial_salas = HistorialSalas(
+    db_pool,
+    max_mensajes=int(os.environ.get("TECHPAINT_SALA_MENSAJES", "100")),
+    max_bytes_sala=int(os.environ.get("TECHPAINT_SALA_KB", "64")) * 1024,
+    compartido=bool(MQ_URL),
+)
+historial_salas.iniciar(socketio)
+
+
+def emitir_a_usuario(usuario_id, evento, datos):
+    """Emite a todas las sesiones privadas abiertas del usuario (pestañas, equipos)"""
+    sids = presencia.sids_privados(usuario_id)
+    if sids:
+        socketio.emit(evento, datos, to=sids)
+
+
+def emitir_escribiendo_privado(destinatario_id, usuarios, origen):
+    emitir_a_usuario(destinatario_id, 'private_typing', {'userIds': usuarios, 'origen': origen})
+
+
+# Acks de entrega y lecturas: un UPDATE y un frame por remitente cada medio segundo
+recibos = RecibosPrivados(
+    db_pool, lambda remitente_id, datos: emitir_a_usuario(remitente_id, 'private_receipts', datos))
+recibos.iniciar(socketio)
+# Mensajes sin entregar que se mandan juntos al abrir el chat privado
+PENDIENTES_MAX = int(os.environ.get("TECHPAINT_PENDIENTES", "500"))
+
+
+# Compactación periódica del registro de cambios de /api/sync
+CAMBIOS_MAX = int(os.environ.get("TECHPAINT_CAMBIOS_MAX", "100000"))
+CAMBIOS_HORAS = float(os.environ.get("TECHPAINT_CAMBIOS_HORAS", "72"))
+
+
+def compactar_cambios_periodicamente(intervalo=3600):
+    while True:
+        socketio.sleep(intervalo)
+        try:
+            with db_pool.conexion() as conn:
+                borrados = cambios.compactar(conn, CAMBIOS_MAX, CAMBIOS_HORAS)
+                conn.commit()
+            log.evento('cambios_compactados', logging.DEBUG, borrados=borrados)
+        except Exception:
+            log.evento('error_compactar_cambios', logging.ERROR, exc=True)
+
+
+socketio.start_background_task(compactar_cambios_periodicamente)
+
+# Mensajes privados viejos a bases por año (archivo.py) y vacuum incremental de la viva
+archivo = ArchivoMensajes(
+    carpeta_por_defecto(DB_PATH),
+    dias=float(os.environ.get("TECHPAINT_ARCHIVO_DIAS", "180")),
+    paginas_vacuum=int(os.environ.get("TECHPAINT_VACUUM_PAGINAS", "1000")),
+)
+ARCHIVO_INTERVALO = float(os.environ.get("TECHPAINT_ARCHIVO_INTERVALO", "3600"))
+
+
+def archivar_periodicamente():
+    # Con varios workers cada uno corre el job: mover un mensaje dos veces no hace nada
+    while True:
+        socketio.sleep(ARCHIVO_INTERVALO)
+        try:
+            with db_pool.conexion() as conn:
+                movidos = archivo.archivar(conn, pausa=socketio.sleep)
+                liberadas = archivo.vacuum(conn, pausa=socketio.sleep)
+            log.evento('mensajes_archivados', logging.INFO, movidos=movidos,
+                       paginas_liberadas=liberadas)
+        except Exception:
+            log.evento('error_archivar', logging.ERROR, exc=True)
+
+
+if archivo.dias > 0 and ARCHIVO_INTERVALO > 0:
+    socketio.start_background_task(archivar_periodicamente)
+
+
+# "Está escribiendo": un evento por sala (o destinatario) cada medio segundo como máximo
+escribiendo_salas = AgregadorEscritura(
+    lambda sala, usuarios, origen: socketio.emit(
+        'room_typing', {'users': usuarios, 'origen': origen}, to=sala))
+escribiendo_privado = AgregadorEscritura(emitir_escribiendo_privado)
+escribiendo_salas.iniciar(socketio)
+escribiendo_privado.iniciar(socketio)
+
+# Mensajes de sala: con TECHPAINT_LOTE_MS > 0 se agrupan en frames new_messages
+difusion_salas = DifusionSalas(socketio, ventana_ms=float(os.environ.get("TECHPAINT_LOTE_MS", "0")))
+# Feed de proyectos en vivo (namespace /proyectos); votos agrupados por TECHPAINT_VOTOS_MS
+difusion_proyectos = DifusionProyectos(socketio,
+                                       ventana_ms=float(os.environ.get("TECHPAINT_VOTOS_MS", "250")))
+# permessage-deflate sólo para frames grandes (0 = comprimir todo, como eventlet)
+DEFLATE_MIN = int(os.environ.get("TECHPAINT_DEFLATE_MIN", "1024"))
+if socketio.async_mode == "eventlet" and DEFLATE_MIN > 0:
+    instalar_umbral_deflate(DEFLATE_MIN)
+
+metricas.medidor("techpaint_sockets_conectados", "Sockets de Engine.IO abiertos en este worker",
+                 lambda: len(socketio.server.eio.sockets))
+metricas.medidor("techpaint_usuarios_en_salas", "Usuarios unidos a alguna sala", presencia.total)
+metricas.medidor("techpaint_sesiones_privadas", "Sockets con el chat privado abierto",
+                 presencia.total_privados)
+metricas.medidor("techpaint_db_conexiones_en_uso", "Conexiones del pool prestadas",
+                 lambda: db_pool.metricas()["en_uso"])
+metricas.medidor("techpaint_archivo_viejos_en_base", "Mensajes más viejos que el corte en la base viva",
+                 lambda: archivo.metricas()["viejos_en_base"])
+metricas.medidor("techpaint_db_paginas_libres", "Páginas libres de la base viva tras el último vacuum",
+                 lambda: archivo.metricas()["paginas_libres"] or 0)
+metricas.medidor("techpaint_db_esperando", "Consultas esperando turno en el ejecutor",
+                 lambda: db_ejecutor.metricas()["esperando"])
+metricas.medidor("techpaint_mensajes_privados_pendientes", "Mensajes privados sin guardar",
+                 lambda: escritura.metricas()["pendientes"])
+metricas.medidor("techpaint_logs_descartados", "Registros de log descartados con la cola llena",
+                 bitacora.descartados)
+
+# Perfilador por muestreo: TECHPAINT_PERFILADOR=ruta lo deja listo (SIGUSR2
+# lo prende y apaga); TECHPAINT_PERFILADOR_ACTIVO=1 arranca muestreando
+PERFILADOR_RUTA = os.environ.get("TECHPAINT_PERFILADOR", "")
+if PERFILADOR_RUTA:
+    perfilador = Perfilador(PERFILADOR_RUTA,
+                            intervalo=float(os.environ.get("TECHPAINT_PERFILADOR_MS", "10")) / 1000)
+    perfilador.iniciar(activo=os.environ.get("TECHPAINT_PERFILADOR_ACTIVO") == "1")
 
 # RUTAS WEB
 @app.route('/')
@@ -99,18 +351,22 @@ def register_user():
         if "@techpaint.com" not in email:
             return jsonify({"success": False, "message": "Debes usar email corporativo"}), 400
 
+        password_hash = hasher.generar(password)
+
         conn = get_db()
         cur = conn.cursor()
         cur.execute("INSERT INTO usuarios (nombre, email, password, area, github_username) VALUES (?, ?, ?, ?, ?)",
-            (nombre, email, password, area, github))
+            (nombre, email, password_hash, area, github))
         
         conn.commit()
         user_id = cur.lastrowid
-        conn.close()
+        perfiles.invalidar()
 
         return jsonify({"success": True, "message": "Usuario creado exitosamente", "user_id": user_id})
     except sqlite3.IntegrityError:
         return jsonify({"success": False, "message": "El correo ya está registrado"}), 409
+    except ServicioOcupado:
+        return jsonify({"success": False, "message": "Servidor ocupado, intenta de nuevo"}), 503
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
 
@@ -123,16 +379,32 @@ def login_user():
         email = data.get("email", "").strip().lower()
         password = data.get("password", "")
 
+        ip = request.remote_addr or ""
+        espera = max(fallos_por_email.bloqueado(email), fallos_por_ip.bloqueado(ip))
+        if espera:
+            respuesta = jsonify({"success": False, "message": "Demasiados intentos, espera unos minutos"})
+            respuesta.headers["Retry-After"] = str(int(espera) + 1)
+            return respuesta, 429
+
         conn = get_db()
         cur = conn.cursor()
-        cur.execute("SELECT * FROM usuarios WHERE email=? AND password=?", (email, password))
+        cur.execute("SELECT * FROM usuarios WHERE email=?", (email,))
         user = cur.fetchone()
-        conn.close()
-
-        if user:
-            return jsonify({
+        valida, nuevo_hash = hasher.verificar(user["password"] if user else None, password)
+
+        if valida:
+            if nuevo_hash:
+                # Texto plano heredado u otro costo: se reescribe con el hash actual
+                cur.execute("UPDATE usuarios SET password = ? WHERE id = ? AND password = ?",
+                            (nuevo_hash, user["id"], user["password"]))
+                conn.commit()
+            fallos_por_email.exito(email)
+            perfiles.guardar(user)
+            token = sesiones.emitir(user["id"])
+            respuesta = jsonify({
                 "success": True,
                 "message": "Login exitoso",
+                "token": token,
                 "user": {
                     "id": user["id"],
                     "nombre": user["nombre"],
@@ -141,40 +413,92 @@ def login_user():
                     "github_username": user["github_username"]
                 }
             })
+            # El navegador la manda sola en cada fetch y en el handshake de Socket.IO
+            respuesta.set_cookie(COOKIE_SESION, token, max_age=sesiones.duracion, httponly=True,
+                                 samesite='Lax', secure=request.is_secure)
+            return respuesta
         else:
+            fallos_por_email.fallo(email)
+            fallos_por_ip.fallo(ip)
             return jsonify({"success": False, "message": "Credenciales incorrectas"}), 401
+    except ServicioOcupado:
+        return jsonify({"success": False, "message": "Servidor ocupado, intenta de nuevo"}), 503
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
 
 
+@app.route('/api/logout', methods=['POST'])
+def logout_user():
+    respuesta = jsonify({"success": True})
+    respuesta.delete_cookie(COOKIE_SESION)
+    return respuesta
+
+
+# Feed de proyectos paginado por (fecha_publicacion, id)
+PROYECTOS_POR_PAGINA = 20
+PROYECTOS_POR_PAGINA_MAX = 100
+CURSOR_FEED_INICIO = ("9999-12-31 23:59:59", 2**63 - 1)
+
+# Páginas del feed ya serializadas; se invalidan al crear, votar o comentar.
+# Con varios workers además se comparan con el último cambio público de la base
+feed_cache = CacheVersionada()
+
+
 @app.route('/api/proyectos', methods=['GET'])
 def get_proyectos():
-    """Obtener todos los proyectos con info de usuario"""
-    conn = get_db()
-    cur = conn.cursor()
-    
-    cur.execute("""
-        SELECT p.*, u.nombre as usuario_nombre, u.area as usuario_area,
-               (SELECT COUNT(*) FROM votos WHERE proyecto_id = p.id AND tipo = 'like') as likes,
-               (SELECT COUNT(*) FROM votos WHERE proyecto_id = p.id AND tipo = 'dislike') as dislikes
-        FROM proyectos p
-        JOIN usuarios u ON p.usuario_id = u.id
-        ORDER BY p.fecha_publicacion DESC
-    """)
-    proyectos = cur.fetchall()
-    conn.close()
-    
-    return jsonify({
-        "success": True,
-        "proyectos": [dict(proj) for proj in proyectos]
-    })
+    """Página del feed de proyectos, filtrable por área del autor y tecnología"""
+    limite = limite_pagina(request.args.get('limit', type=int),
+                           PROYECTOS_POR_PAGINA, PROYECTOS_POR_PAGINA_MAX)
+    cursor = request.args.get('cursor') or None
+    area = request.args.get('area') or None
+    tecnologia = (request.args.get('tecnologia') or '').replace(' ', '').lower() or None
+
+    clave = (limite, cursor, area, tecnologia)
+    if MQ_URL:
+        # Votos, proyectos y comentarios que entraron por otro worker
+        feed_cache.sincronizar(cambios.version_publica(get_db()))
+    entrada = feed_cache.obtener(clave)
+    if entrada is None:
+        version = feed_cache.version
+        try:
+            desde = decodificar_cursor(cursor, 2) if cursor else CURSOR_FEED_INICIO
+        except CursorInvalido as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        conn = get_db()
+        cur = conn.cursor()
+        
+        cur.execute(SQL_FEED_PROYECTOS, (*desde, area, area, tecnologia, tecnologia, limite + 1))
+        proyectos = [dict(proj) for proj in cur.fetchmany(limite + 1)]
+        perfiles.hidratar(conn, proyectos, 'usuario_id', usuario_nombre='nombre', usuario_area='area')
+
+        siguiente = None
+        if len(proyectos) > limite:
+            proyectos.pop()
+            ultimo = proyectos[-1]
+            siguiente = codificar_cursor(ultimo['fecha_publicacion'], ultimo['id'])
+
+        cuerpo = json.dumps({
+            "success": True,
+            "proyectos": proyectos,
+            "siguiente": siguiente
+        })
+        entrada = feed_cache.guardar(clave, cuerpo, version)
+
+    # ETag fuerte + no-cache: el navegador revalida y recibe 304 si nada cambió
+    etag, cuerpo = entrada
+    respuesta = Response(cuerpo, mimetype='application/json')
+    respuesta.set_etag(etag)
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta.make_conditional(request)
 
 @app.route('/api/proyectos', methods=['POST'])
+@requiere_sesion
 def crear_proyecto():
     """Crear nuevo proyecto"""
     try:
         data = request.get_json()
-        user_id = data.get('usuario_id')
+        user_id = usuario_actual()
         titulo = data.get('titulo')
         descripcion = data.get('descripcion')
         github_url = data.get('github_url')
@@ -185,61 +509,44 @@ def crear_proyecto():
         cur.execute("""
             INSERT INTO proyectos (usuario_id, titulo, descripcion, github_url, tecnologias)
             VALUES (?, ?, ?, ?, ?)
+            RETURNING *
         """, (user_id, titulo, descripcion, github_url, tecnologias))
+        proyecto = dict(cur.fetchall()[0])
         
         conn.commit()
-        proyecto_id = cur.lastrowid
-        conn.close()
+        feed_cache.invalidar()
+        perfiles.hidratar(conn, [proyecto], 'usuario_id', usuario_nombre='nombre', usuario_area='area')
+        difusion_proyectos.proyecto_creado(proyecto)
         
-        return jsonify({"success": True, "proyecto_id": proyecto_id})
+        return jsonify({"success": True, "proyecto_id": proyecto['id']})
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
     
 
 @app.route('/api/proyectos/<int:proyecto_id>/votar', methods=['POST'])
+@requiere_sesion
 def votar_proyecto(proyecto_id):
     """Like/Dislike a proyecto"""
     try:
         data = request.get_json()
-        usuario_id = data.get('usuario_id')
+        usuario_id = usuario_actual()
         tipo = data.get('tipo')  # 'like' o 'dislike'
         
-        conn = get_db()
-        cur = conn.cursor()
-        
-        # Verificar si ya votó
-        cur.execute("SELECT id, tipo FROM votos WHERE proyecto_id = ? AND usuario_id = ?", 
-                   (proyecto_id, usuario_id))
-        voto_existente = cur.fetchone()
-        
-        if voto_existente:
-            if voto_existente['tipo'] == tipo:
-                # Quitar voto
-                cur.execute("DELETE FROM votos WHERE id = ?", (voto_existente['id'],))
-            else:
-                # Cambiar voto
-                cur.execute("UPDATE votos SET tipo = ? WHERE id = ?", (tipo, voto_existente['id']))
-        else:
-            # Nuevo voto
-            cur.execute("INSERT INTO votos (proyecto_id, usuario_id, tipo) VALUES (?, ?, ?)",
-                       (proyecto_id, usuario_id, tipo))
+        if tipo not in ('like', 'dislike'):
+            return jsonify({"success": False, "message": "Tipo de voto inválido"}), 400
         
+        # Un solo upsert; los triggers actualizan los contadores del proyecto
+        conn = get_db()
+        likes, dislikes, user_vote = votos.votar(conn, proyecto_id, usuario_id, tipo)
         conn.commit()
-        
-        # Obtener conteos actualizados
-        cur.execute("SELECT COUNT(*) as count FROM votos WHERE proyecto_id = ? AND tipo = 'like'", (proyecto_id,))
-        likes = cur.fetchone()['count']
-        
-        cur.execute("SELECT COUNT(*) as count FROM votos WHERE proyecto_id = ? AND tipo = 'dislike'", (proyecto_id,))
-        dislikes = cur.fetchone()['count']
-        
-        conn.close()
+        feed_cache.invalidar()
+        difusion_proyectos.votos(proyecto_id, likes, dislikes)
         
         return jsonify({
             "success": True, 
             "likes": likes, 
             "dislikes": dislikes,
-            "user_vote": tipo if not voto_existente or voto_existente['tipo'] != tipo else None
+            "user_vote": user_vote
         })
         
     except Exception as e:
@@ -253,53 +560,42 @@ def get_comentarios(proyecto_id):
     conn = get_db()
     cur = conn.cursor()
     
-    cur.execute("""
-        SELECT c.*, u.nombre as usuario_nombre
-        FROM comentarios c
-        JOIN usuarios u ON c.usuario_id = u.id
-        WHERE c.proyecto_id = ?
-        ORDER BY c.fecha ASC
-    """, (proyecto_id,))
+    cur.execute(SQL_COMENTARIOS_PROYECTO, (proyecto_id,))
     
-    comentarios = cur.fetchall()
-    conn.close()
+    comentarios = [dict(com) for com in cur.fetchall()]
+    perfiles.hidratar(conn, comentarios, 'usuario_id', usuario_nombre='nombre')
     
     return jsonify({
         "success": True,
-        "comentarios": [dict(com) for com in comentarios]
+        "comentarios": comentarios
     })
 
 
 
 
 @app.route('/api/proyectos/<int:proyecto_id>/comentarios', methods=['POST'])
+@requiere_sesion
 def agregar_comentario(proyecto_id):
     """Agregar comentario a proyecto"""
     try:
         data = request.get_json()
-        usuario_id = data.get('usuario_id')
+        usuario_id = usuario_actual()
         comentario = data.get('comentario')
         
         conn = get_db()
         cur = conn.cursor()
+        # RETURNING devuelve la fila tal como quedó (fecha por defecto incluida)
         cur.execute("""
             INSERT INTO comentarios (proyecto_id, usuario_id, comentario)
             VALUES (?, ?, ?)
+            RETURNING *
         """, (proyecto_id, usuario_id, comentario))
+        nuevo_comentario = dict(cur.fetchall()[0])
         
         conn.commit()
-        comentario_id = cur.lastrowid
-        
-        # Obtener info del comentario recién creado
-        cur.execute("""
-            SELECT c.*, u.nombre as usuario_nombre
-            FROM comentarios c
-            JOIN usuarios u ON c.usuario_id = u.id
-            WHERE c.id = ?
-        """, (comentario_id,))
-        
-        nuevo_comentario = dict(cur.fetchone())
-        conn.close()
+        feed_cache.invalidar()
+        perfiles.hidratar(conn, [nuevo_comentario], 'usuario_id', usuario_nombre='nombre')
+        difusion_proyectos.comentario_agregado(nuevo_comentario)
         
         return jsonify({
             "success": True, 
@@ -315,116 +611,385 @@ def agregar_comentario(proyecto_id):
 
 @app.route('/api/usuarios')
 def get_usuarios():
-    """Obtener todos los usuarios excepto el actual"""
-    exclude_id = request.args.get('exclude')
-    conn = get_db()
-    cur = conn.cursor()
-    
-    query = "SELECT id, nombre, email, area FROM usuarios"
-    params = []
-    
-    if exclude_id:
-        query += " WHERE id != ?"
-        params.append(exclude_id)
-    
-    cur.execute(query, params)
-    usuarios = cur.fetchall()
-    conn.close()
-    
-    return jsonify({
-        "success": True,
-        "usuarios": [dict(user) for user in usuarios]
-    })
+    """Todos los usuarios (o todos menos `exclude`) desde la lista cacheada.
+
+    La lista completa sale ya serializada; con ETag el navegador revalida y
+    recibe 304 mientras no se registre nadie.
+    """
+    exclude_id = request.args.get('exclude', type=int)
+    etag, cuerpo, usuarios = perfiles.lista(get_db())
+
+    if exclude_id is not None:
+        etag = f"{etag}-{exclude_id}"
+        if request.if_none_match.contains(etag):
+            cuerpo = ''
+        else:
+            cuerpo = json.dumps({
+                "success": True,
+                "usuarios": [u for u in usuarios if u['id'] != exclude_id]
+            })
+
+    respuesta = Response(cuerpo, mimetype='application/json')
+    respuesta.set_etag(etag)
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta.make_conditional(request)
 
-# Mantén este endpoint y elimina el duplicado
 @app.route('/api/conversaciones/<int:user_id>')
+@requiere_sesion
 def get_conversaciones(user_id):
-    """Obtener conversaciones del usuario"""
+    """Obtener conversaciones del usuario desde el resumen de la bandeja"""
+    if es_otro_usuario(user_id):
+        return jsonify({"success": False, "message": "No autorizado"}), 403
     conn = get_db()
     cur = conn.cursor()
     
-    cur.execute("""
-        SELECT DISTINCT 
-            CASE 
-                WHEN mp.remitente_id = ? THEN mp.destinatario_id
-                ELSE mp.remitente_id
-            END as id,
-            u.nombre as nombre,
-            u.area as area,
-            (SELECT mensaje FROM mensajes_privados 
-             WHERE ((remitente_id = ? AND destinatario_id = id) 
-                    OR (remitente_id = id AND destinatario_id = ?))
-             ORDER BY fecha DESC LIMIT 1) as ultimo_mensaje,
-            (SELECT COUNT(*) FROM mensajes_privados 
-             WHERE destinatario_id = ? AND remitente_id = id AND leido = 0) as no_leidos
-        FROM mensajes_privados mp
-        JOIN usuarios u ON u.id = CASE 
-            WHEN mp.remitente_id = ? THEN mp.destinatario_id
-            ELSE mp.remitente_id
-        END
-        WHERE mp.remitente_id = ? OR mp.destinatario_id = ?
-        GROUP BY id
-        ORDER BY (SELECT fecha FROM mensajes_privados 
-                 WHERE ((remitente_id = ? AND destinatario_id = id) 
-                        OR (remitente_id = id AND destinatario_id = ?))
-                 ORDER BY fecha DESC LIMIT 1) DESC
-    """, (user_id, user_id, user_id, user_id, user_id, user_id, user_id, user_id, user_id))
+    cur.execute(conversaciones.SQL_BANDEJA, (user_id,))
     
-    conversaciones = cur.fetchall()
-    conn.close()
+    conversaciones_usuario = [dict(conv) for conv in cur.fetchall()]
+    perfiles.hidratar(conn, conversaciones_usuario, 'id', nombre='nombre', area='area', email='email')
     
     return jsonify({
         "success": True,
-        "conversaciones": [dict(conv) for conv in conversaciones]
+        "conversaciones": conversaciones_usuario
     })
 
+# Paginación por clave (fecha, id) del historial privado
+MENSAJES_POR_PAGINA = 50
+MENSAJES_POR_PAGINA_MAX = 200
+FILAS_POR_LOTE = 64
+# Cursor que queda después de cualquier mensaje: primera página = la más reciente
+CURSOR_FINAL = ("9999-12-31 23:59:59", 2**63 - 1)
+
+def lotes_de(cur, tamano):
+    while True:
+        filas = cur.fetchmany(tamano)
+        if not filas:
+            return
+        yield filas
+
+
+def leer_pagina_mensajes(conn, user_id, contacto_id, limite, cursor, hacia_atras):
+    """Lotes de filas de la página en orden cronológico, de la base viva y del archivo.
+
+    Sin particiones en el rango del cursor (lo común: páginas recientes) la
+    página se lee de a FILAS_POR_LOTE con fetchmany. Si hay particiones, las
+    filas de todas las bases se juntan en memoria para descartar repetidas y
+    ordenarlas: a lo sumo `limite` filas por base. Se recorren de la más
+    cercana al cursor a la más lejana y se dejan de leer cuando la página
+    está llena y la siguiente ya no puede tener mensajes más cercanos.
+    """
+    op, orden = ('<', 'DESC') if hacia_atras else ('>', 'ASC')
+    params = (user_id, contacto_id, *cursor, limite,
+              contacto_id, user_id, *cursor, limite, limite)
+
+    def pagina(tabla):
+        return conn.execute(SQL_PAGINA_MENSAJES.format(op=op, orden=orden, tabla=tabla), params)
+
+    particiones = archivo.particiones(conn, user_id, contacto_id, cursor[0], hacia_atras)
+    cur = pagina('mensajes_privados')
+    if not particiones:
+        return lotes_de(cur, FILAS_POR_LOTE)
+
+    filas = cur.fetchall()
+    for particion in particiones:
+        if len(filas) >= limite:
+            borde = filas[0]['fecha'] if hacia_atras else filas[-1]['fecha']
+            if (particion['hasta'] < borde) if hacia_atras else (particion['desde'] > borde):
+                break
+        tabla = archivo.tabla(conn, particion)
+        if tabla is None:
+            continue
+        # Un archivado cortado a la mitad puede dejar la misma fila en las dos bases
+        unicas = {fila['id']: fila for fila in filas + pagina(tabla).fetchall()}
+        filas = sorted(unicas.values(), key=lambda fila: (fila['fecha'], fila['id']))
+        filas = filas[-limite:] if hacia_atras else filas[:limite]
+    return iter([filas] if filas else [])
+
+
+def hay_mensajes_anteriores(conn, user_id, contacto_id, primera):
+    params = (user_id, contacto_id, *primera, contacto_id, user_id, *primera)
+    if conn.execute(SQL_HAY_MAS_MENSAJES.format(op='<', tabla='mensajes_privados'),
+                    params).fetchone()[0]:
+        return True
+    for particion in archivo.particiones(conn, user_id, contacto_id, primera[0], True):
+        tabla = archivo.tabla(conn, particion)
+        if tabla and conn.execute(SQL_HAY_MAS_MENSAJES.format(op='<', tabla=tabla),
+                                  params).fetchone()[0]:
+            return True
+    return False
+
+
+def stream_pagina_mensajes(conn, nombres, lotes, user_id, contacto_id, cursor, hacia_atras):
+    """Genera el JSON de una página, serializando lote por lote.
+
+    La conexión y la primera lectura vienen de la vista: un EjecutorOcupado
+    o un timeout ahí todavía se responde con 503 y no con un JSON cortado.
+    """
+    yield '{"success": true, "mensajes": ['
+    primera = ultima = None
+    for filas in lotes:
+        trozo = ','.join(json.dumps({**fila, 'remitente_nombre': nombres.get(fila['remitente_id'])})
+                         for fila in filas)
+        yield trozo if primera is None else ',' + trozo
+        if primera is None:
+            primera = (filas[0]['fecha'], filas[0]['id'])
+        ultima = (filas[-1]['fecha'], filas[-1]['id'])
+
+    # Cursores de los extremos de la página para pedir la anterior/siguiente
+    anterior = siguiente = None
+    if primera is not None:
+        siguiente = codificar_cursor(*ultima)
+        if hay_mensajes_anteriores(conn, user_id, contacto_id, primera):
+            anterior = codificar_cursor(*primera)
+    elif not hacia_atras:
+        siguiente = codificar_cursor(*cursor)
+
+    yield '], "anterior": %s, "siguiente": %s}' % (json.dumps(anterior), json.dumps(siguiente))
+
+
 @app.route('/api/mensajes/<int:user_id>/<int:contacto_id>')
+@requiere_sesion
 def get_mensajes_privados(user_id, contacto_id):
-    """Obtener mensajes entre dos usuarios"""
-    conn = get_db()
-    cur = conn.cursor()
-    
-    cur.execute("""
-        SELECT mp.*, u.nombre as remitente_nombre
-        FROM mensajes_privados mp
-        JOIN usuarios u ON mp.remitente_id = u.id
-        WHERE (mp.remitente_id = ? AND mp.destinatario_id = ?)
-           OR (mp.remitente_id = ? AND mp.destinatario_id = ?)
-        ORDER BY mp.fecha ASC
-    """, (user_id, contacto_id, contacto_id, user_id))
-    
-    mensajes = cur.fetchall()
-    conn.close()
-    
-    return jsonify({
-        "success": True,
-        "mensajes": [dict(msg) for msg in mensajes]
-    })
+    """Página de mensajes entre dos usuarios.
+
+    Sin cursor devuelve la página más reciente; `before` trae mensajes más
+    viejos y `after` los más nuevos. Siempre en orden cronológico.
+    """
+    if es_otro_usuario(user_id):
+        return jsonify({"success": False, "message": "No autorizado"}), 403
+    limite = limite_pagina(request.args.get('limit', type=int),
+                           MENSAJES_POR_PAGINA, MENSAJES_POR_PAGINA_MAX)
+    before = request.args.get('before')
+    after = request.args.get('after')
+    try:
+        if after:
+            cursor, hacia_atras = decodificar_cursor(after, 2), False
+        elif before:
+            cursor, hacia_atras = decodificar_cursor(before, 2), True
+        else:
+            cursor, hacia_atras = CURSOR_FINAL, True
+    except CursorInvalido as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    # Conexión propia: el generador corre después de que termina la vista, y
+    # se devuelve al pool cuando el servidor cierra la respuesta
+    conn = db_pool.obtener()
+    try:
+        # Los remitentes posibles son sólo los dos de la conversación
+        nombres = {usuario_id: perfil['nombre'] for usuario_id, perfil
+                   in perfiles.varios(conn, (user_id, contacto_id)).items()}
+        lotes = leer_pagina_mensajes(conn, user_id, contacto_id, limite, cursor, hacia_atras)
+    except Exception:
+        db_pool.liberar(conn)
+        raise
+    respuesta = Response(stream_pagina_mensajes(conn, nombres, lotes, user_id, contacto_id,
+                                                cursor, hacia_atras),
+                         mimetype='application/json')
+    respuesta.call_on_close(lambda: db_pool.liberar(conn))
+    return respuesta
 
 @app.route('/api/mensajes/leer', methods=['POST'])
+@requiere_sesion
 def marcar_mensajes_leidos():
     """Marcar mensajes como leídos"""
     try:
         data = request.get_json()
-        usuario_id = data.get('usuario_id')
+        usuario_id = usuario_actual()
         remitente_id = data.get('remitente_id')
         
         conn = get_db()
         cur = conn.cursor()
-        cur.execute("""
-            UPDATE mensajes_privados 
-            SET leido = 1 
-            WHERE destinatario_id = ? AND remitente_id = ? AND leido = 0
-        """, (usuario_id, remitente_id))
+        cur.execute(SQL_MARCAR_LEIDOS, (usuario_id, remitente_id))
+        leidos = cur.fetchall()
+        conversaciones.marcar_leida(conn, usuario_id, remitente_id)
         
         conn.commit()
-        conn.close()
+        recibos.leidos(usuario_id, leidos)
         
         return jsonify({"success": True})
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
 
 
+# Búsqueda de texto completo
+RESULTADOS_BUSQUEDA = 20
+RESULTADOS_BUSQUEDA_MAX = 50
+TIPOS_BUSQUEDA = ('proyectos', 'comentarios', 'mensajes')
+
+
+@app.route('/api/buscar')
+def buscar():
+    """Buscar en proyectos, comentarios y mensajes privados (ordenado por bm25).
+
+    Los mensajes sólo se buscan con sesión y se limitan a las conversaciones
+    del usuario de la sesión.
+    """
+    consulta = busqueda.consulta_fts(request.args.get('q'))
+    if consulta is None:
+        return jsonify({"success": False, "message": "Falta el texto a buscar"}), 400
+
+    limite = limite_pagina(request.args.get('limit', type=int),
+                           RESULTADOS_BUSQUEDA, RESULTADOS_BUSQUEDA_MAX)
+    usuario_id = usuario_actual()
+    tipos = request.args.get('tipo', ','.join(TIPOS_BUSQUEDA)).split(',')
+
+    conn = get_db()
+    resultados = {}
+    if 'proyectos' in tipos:
+        resultados['proyectos'] = busqueda.buscar_proyectos(conn, consulta, limite)
+    if 'comentarios' in tipos:
+        resultados['comentarios'] = busqueda.buscar_comentarios(conn, consulta, limite)
+    if 'mensajes' in tipos and usuario_id is not None:
+        resultados['mensajes'] = busqueda.buscar_mensajes(conn, consulta, usuario_id, limite)
+
+    return jsonify({"success": True, "resultados": resultados})
+
+
+# Sincronización por deltas desde el registro de cambios (ver cambios.py)
+CAMBIOS_POR_PAGINA = 500
+CAMBIOS_POR_PAGINA_MAX = 2000
+
+
+def filas_por_id(conn, tabla, ids):
+    """Filas actuales de `tabla` con esos ids (las borradas no vuelven)"""
+    ids = list(ids)
+    filas = []
+    for i in range(0, len(ids), CAMBIOS_POR_PAGINA):
+        lote = ids[i:i + CAMBIOS_POR_PAGINA]
+        marcas = ",".join("?" * len(lote))
+        filas += [dict(f) for f in conn.execute(
+            f"SELECT * FROM {tabla} WHERE id IN ({marcas})", lote)]
+    return filas
+
+
+@app.route('/api/sync')
+@requiere_sesion
+def sincronizar():
+    """Lo que cambió después de `since` para el usuario de la sesión.
+
+    Sin `since` devuelve sólo el seq actual: el cliente lo pide antes de la
+    carga completa y desde ahí pide deltas. Con `mas` hay otra página; con
+    `reiniciar` el registro ya se compactó y hay que recargar todo.
+    """
+    usuario_id = usuario_actual()
+    desde = request.args.get('since', type=int)
+    conn = get_db()
+    if desde is None:
+        return jsonify({"success": True, "seq": cambios.ultimo_seq(conn)})
+
+    limite = limite_pagina(request.args.get('limit', type=int),
+                           CAMBIOS_POR_PAGINA, CAMBIOS_POR_PAGINA_MAX)
+    leido = cambios.leer(conn, usuario_id, desde, limite)
+    if leido is None:
+        return jsonify({"success": True, "reiniciar": True, "seq": cambios.ultimo_seq(conn)})
+    hasta, mas, por_tabla = leido
+
+    def vigentes(tabla):
+        return [i for i, op in por_tabla.get(tabla, {}).items() if op != 'baja']
+
+    proyectos = filas_por_id(conn, 'proyectos', vigentes('proyectos'))
+    perfiles.hidratar(conn, proyectos, 'usuario_id', usuario_nombre='nombre', usuario_area='area')
+    comentarios = filas_por_id(conn, 'comentarios', vigentes('comentarios'))
+    perfiles.hidratar(conn, comentarios, 'usuario_id', usuario_nombre='nombre')
+    # El voto propio de cada proyecto tocado (tipo NULL = retirado)
+    proyectos_votados = list(por_tabla.get('votos', ()))
+    mis_votos = [dict(v) for v in conn.execute(f"""
+        SELECT proyecto_id, tipo FROM votos
+        WHERE usuario_id = ? AND proyecto_id IN ({",".join("?" * len(proyectos_votados))})
+    """, (usuario_id, *proyectos_votados))] if proyectos_votados else []
+    mensajes = filas_por_id(conn, 'mensajes_privados', vigentes('mensajes_privados'))
+    perfiles.hidratar(conn, mensajes, 'remitente_id', remitente_nombre='nombre')
+
+    # La fila de la bandeja de cada conversación tocada, ya con no_leidos
+    contactos = {m['destinatario_id'] if m['remitente_id'] == usuario_id else m['remitente_id']
+                 for m in mensajes}
+    bandeja = [dict(c) for c in conn.execute(f"""
+        SELECT contacto_id AS id, ultimo_mensaje, ultima_fecha, no_leidos
+        FROM conversaciones
+        WHERE usuario_id = ? AND contacto_id IN ({",".join("?" * len(contactos))})
+    """, (usuario_id, *contactos))] if contactos else []
+    perfiles.hidratar(conn, bandeja, 'id', nombre='nombre', area='area', email='email')
+
+    def borrados(tabla, vigentes_ids):
+        pedidos = set(por_tabla.get(tabla, ()))
+        return sorted(pedidos - {f['id'] for f in vigentes_ids})
+
+    return jsonify({
+        "success": True,
+        "seq": hasta,
+        "mas": mas,
+        "proyectos": proyectos,
+        "comentarios": comentarios,
+        "votos": mis_votos,
+        "mensajes": mensajes,
+        "conversaciones": bandeja,
+        "borrados": {
+            "proyectos": borrados('proyectos', proyectos),
+            "comentarios": borrados('comentarios', comentarios),
+            # Archivar no es borrar: un mensaje que falta sin una baja se movió al archivo
+            "mensajes": sorted(i for i, op in por_tabla.get('mensajes_privados', {}).items()
+                               if op == 'baja'),
+        },
+    })
+
+
+@app.route('/api/estado/db')
+def estado_db():
+    """Métricas del pool de conexiones (hits, misses, esperas)"""
+    return jsonify({
+        "success": True,
+        "pool": db_pool.metricas(),
+        "ejecutor": db_ejecutor.metricas(),
+        "feed_cache": feed_cache.metricas(),
+        "escritura_mensajes": escritura.metricas(),
+        "historial_salas": historial_salas.metricas(),
+        "escribiendo_salas": escribiendo_salas.metricas(),
+        "escribiendo_privado": escribiendo_privado.metricas(),
+        "recibos_privados": recibos.metricas(),
+        "difusion_salas": difusion_salas.metricas(),
+        "difusion_proyectos": difusion_proyectos.metricas(),
+        "claves": hasher.metricas(),
+        "perfiles": perfiles.metricas(),
+        "archivo": archivo.metricas(),
+    })
+
+
+@app.route('/metrics')
+def exportar_metricas():
+    """Métricas de este worker en formato de texto de Prometheus"""
+    return Response(metricas.exportar(), mimetype='text/plain; version=0.0.4')
+
+
+MENSAJES_SALA_POR_PAGINA = 50
+MENSAJES_SALA_POR_PAGINA_MAX = 200
+
+
+def cursor_anterior_sala(mensajes):
+    """Cursor para pedir lo anterior al primer mensaje; None si no hay"""
+    if not mensajes:
+        return None
+    return codificar_cursor(mensajes[0]['timestamp'], mensajes[0]['id'])
+
+
+@app.route('/api/salas/<sala>/mensajes')
+def get_mensajes_sala(sala):
+    """Historial de una sala, de a páginas hacia atrás con `before`"""
+    limite = limite_pagina(request.args.get('limit', type=int),
+                           MENSAJES_SALA_POR_PAGINA, MENSAJES_SALA_POR_PAGINA_MAX)
+    before = request.args.get('before')
+    try:
+        cursor = decodificar_cursor(before, 2) if before else CURSOR_FINAL
+    except CursorInvalido as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    conn = get_db()
+    filas = conn.execute(SQL_PAGINA_SALA, (sala, *cursor, limite)).fetchall()
+    mensajes = [mensaje_de_fila(fila) for fila in filas]
+    return jsonify({
+        "success": True,
+        "mensajes": mensajes,
+        "anterior": cursor_anterior_sala(mensajes) if len(mensajes) == limite else None,
+    })
 
 
 # ---------------------------
@@ -432,62 +997,76 @@ def marcar_mensajes_leidos():
 # ---------------------------
 
 @socketio.on('connect')
-def on_connect():
-    print(f'Cliente conectado: {request.sid}')
+def on_connect(auth=None):
+    # Una sola verificación por socket; los eventos usan usuario_por_sid
+    usuario_id = sesiones.verificar(token_de(request, auth))
+    if usuario_id is not None:
+        usuario_por_sid[request.sid] = usuario_id
+    log.evento('socket_conectado', logging.DEBUG, sid=request.sid)
     emit('system', {'message': 'Conectado al servidor de chat'})
 
 @socketio.on('disconnect')
 def on_disconnect():
-    user_id = request.sid
-    if user_id in connected_users:
-        user_data = connected_users[user_id]
-        username = user_data.get('username', 'Usuario')
-        room = user_data.get('room')
+    usuario_por_sid.pop(request.sid, None)
+    presencia.quitar_privado(request.sid)
+    user_data = presencia.salir_sala(request.sid)
+    if user_data:
+        username = user_data.username
+        room = user_data.room
         
         if room:
             leave_room(room)
             emit('system', {
                 'message': f'{username} se ha desconectado'
             }, to=room)
-        
-        del connected_users[user_id]
-    
-    print(f'Cliente desconectado: {request.sid}')
+            emitir_salida(user_data)
+
+    log.evento('socket_desconectado', logging.DEBUG, sid=request.sid)
+
+def emitir_salida(miembro, conn=None):
+    """Delta para el resto de la sala: sólo quién se fue y cuántos quedan"""
+    escribiendo_salas.marcar(miembro.room, miembro.username, False)
+    emit('user_left', {
+        'username': miembro.username,
+        'count': presencia.cantidad_en_sala(miembro.room, conn=conn)
+    }, to=miembro.room)
 
 @socketio.on('join_chat')
 def on_join(data):
     try:
-        print(f"=== JOIN_CHAT EVENT RECEIVED ===")
-        print(f"Data received: {data}")
-        print(f"Socket ID: {request.sid}")
-        print(f"Data type: {type(data)}")
-        
-        username = data.get('username', 'Anónimo')
         room = data.get('room', 'general')
-        
-        print(f"Username extracted: {username}")
-        print(f"Room extracted: {room}")
+        # Con sesión el nombre sale del perfil; las salas admiten anónimos con apodo
+        usuario_id = usuario_por_sid.get(request.sid)
+        # Una sola conexión para todo el join: perfil, presencia e historial
+        conn = get_db()
+        perfil = perfiles.obtener(conn, usuario_id) if usuario_id is not None else None
+        username = perfil['nombre'] if perfil else data.get('username', 'Anónimo')
         
         # Validar datos
         if not username or not room:
-            print("ERROR: Missing username or room")
+            log.evento('join_invalido', logging.WARNING, sid=request.sid)
             emit('error', {'message': 'Faltan datos de usuario o sala'})
             return
             
         sid = request.sid
 
         # Guardar usuario conectado
-        connected_users[sid] = {
-            'username': username, 
-            'room': room, 
-            'joined_at': datetime.now()
-        }
+        anterior = presencia.unir_sala(sid, username, room, conn=conn)
+        if anterior is not None and anterior.room != room:
+            leave_room(anterior.room)
+            emitir_salida(anterior, conn=conn)
         
         # Unirse a la sala
         join_room(room)
+
+        # Últimos mensajes de la sala, sin ir a la base
+        recientes = historial_salas.recientes(room, conn=conn)
+        emit('room_history', {
+            'mensajes': recientes,
+            'anterior': cursor_anterior_sala(recientes),
+        })
         
-        print(f" User {username} joined room {room}")
-        print(f"Total connected users: {len(connected_users)}")
+        log.evento('usuario_unido', sid=sid, username=username, room=room)
 
         # Notificar a la sala
         emit('system', {
@@ -499,29 +1078,27 @@ def on_join(data):
             'message': f'Conectado como {username} en la sala "{room}"'
         })
 
-        # Actualizar lista de usuarios en la sala
-        room_users = []
-        for uid, udata in connected_users.items():
-            if udata.get('room') == room:
-                room_users.append(udata.get('username'))
-        
-        print(f"Users in room {room}: {room_users}")
-        
-        emit('room_users', {'users': room_users}, to=room)
+        # Lista completa sólo para quien entra; al resto le llega el delta
+        room_users = presencia.usuarios_en_sala(room, conn=conn)
+        emit('room_users', {'users': room_users})
+        emit('user_joined', {
+            'username': username,
+            'count': len(room_users)
+        }, to=room, include_self=False)
         
     except Exception as e:
-        print(f" ERROR in join_chat: {str(e)}")
+        log.evento('error_join', logging.ERROR, exc=True)
         emit('error', {'message': f'Error al unirse: {str(e)}'})
 
 @socketio.on('send_message')
 def on_message(data):
     try:
         sid = request.sid
-        user_map = connected_users.get(sid)
+        user_map = presencia.usuario(sid)
         # Fallback: si no encontramos room en mapping, usar room enviado por cliente
         room = None
         if user_map:
-            room = user_map.get('room')
+            room = user_map.room
         if not room:
             room = data.get('room')  # fallback (no confíes en esto para seguridad)
         message_text = (data.get('message') or '').strip()
@@ -530,41 +1107,35 @@ def on_message(data):
             emit('error', {'message': 'Falta sid, sala o mensaje.'})
             return
 
-        username = user_map.get('username') if user_map else data.get('username', 'Anónimo')
-
-        message_data = {
-            'username': username,
-            'message': message_text,
-            'timestamp': datetime.now().isoformat(),
-            'sender_id': sid
-        }
-
-        print(f"[MSG] sid={sid} username={username} room={room} message={message_text}")
+        username = user_map.username if user_map else data.get('username', 'Anónimo')
 
-        emit('new_message', message_data, to=room)
+        if user_map:
+            escribiendo_salas.marcar(room, username, False)
+        message_data = historial_salas.registrar(room, username, message_text,
+                                                 fecha_actual(), sender_id=sid)
+        # Sin el texto: sólo el largo
+        log.evento('mensaje_sala', logging.DEBUG, sid=sid, username=username, room=room,
+                   largo=len(message_text))
+
+        difusion_salas.emitir(room, message_data)
     except Exception as e:
+        log.evento('error_mensaje_sala', logging.ERROR, exc=True)
         emit('error', {'message': f'Error enviando mensaje: {str(e)}'})
 
 @socketio.on('typing')
 def on_typing(data):
-    user_id = request.sid
-    if user_id in connected_users:
-        user_data = connected_users[user_id]
-        room = user_data.get('room')
-        username = user_data.get('username')
-        
-        emit('user_typing', {
-            'username': username,
-            'is_typing': data.get('is_typing', False)
-        }, to=room, include_self=False)
+    user_data = presencia.usuario(request.sid)
+    if user_data:
+        escribiendo_salas.marcar(user_data.room, user_data.username,
+                                 bool(data.get('is_typing', False)))
 
 @socketio.on('leave_room')
 def on_leave_room():
     user_id = request.sid
-    if user_id in connected_users:
-        user_data = connected_users[user_id]
-        username = user_data.get('username', 'Usuario')
-        room = user_data.get('room')
+    user_data = presencia.usuario(user_id)
+    if user_data:
+        username = user_data.username
+        room = user_data.room
         
         if room:
             # Salir de la sala
@@ -575,153 +1146,125 @@ def on_leave_room():
                 'message': f'{username} ha salido de la sala'
             }, to=room)
             
-            # Actualizar lista de usuarios en la sala
-            room_users = []
-            for uid, udata in connected_users.items():
-                if uid != user_id and udata.get('room') == room:
-                    room_users.append(udata.get('username'))
-            
-            emit('room_users', {'users': room_users}, to=room)
-            
-            # Remover usuario de la lista de conectados
-            del connected_users[user_id]
+            # Remover usuario de la lista de conectados y avisar el delta
+            presencia.salir_sala(user_id)
+            emitir_salida(user_data)
             
             # Confirmar al usuario que salió
             emit('left_room', {'message': 'Has salido de la sala exitosamente'})
             
-            print(f'{username} salió de la sala {room}')
+            log.evento('usuario_salio', sid=user_id, username=username, room=room)
     else:
         emit('error', {'message': 'No estás en ninguna sala'})
 
 
-# Agregar a app.py después de los otros eventos de socket
-connected_private_users = {}  # {user_id: sid}
+@socketio.on('get_room_users')
+def on_get_room_users():
+    """Snapshot completo bajo demanda (p. ej. al reconectar o si el cliente se desincroniza)"""
+    user_data = presencia.usuario(request.sid)
+    if user_data:
+        emit('room_users', {'users': presencia.usuarios_en_sala(user_data.room)})
+
+
+@socketio.on('connect', namespace=NAMESPACE_PROYECTOS)
+def on_connect_proyectos(auth=None):
+    # El feed es público: conectarse al namespace es suscribirse
+    log.evento('feed_suscrito', logging.DEBUG, sid=request.sid)
+
 
 @socketio.on('join_private_chat')
 def join_private_chat(data):
-    user_id = data.get('userId')
-    connected_private_users[user_id] = request.sid
-    print(f"Usuario {user_id} conectado al chat privado")
+    user_id = usuario_por_sid.get(request.sid)
+    if user_id is None:
+        emit('error', {'message': 'Inicia sesión para usar el chat privado'})
+        return
+    presencia.registrar_privado(user_id, request.sid)
+    log.evento('chat_privado_unido', logging.DEBUG, user_id=user_id)
+
+    # Lo que llegó mientras no había ninguna sesión abierta, en un solo frame
+    filas = get_db().execute(SQL_ENTREGAS_PENDIENTES, (user_id, PENDIENTES_MAX + 1)).fetchall()
+    if filas:
+        mensajes = [dict(fila) for fila in filas[:PENDIENTES_MAX]]
+        # Con más de PENDIENTES_MAX el cliente vuelve a pedir tras el ack
+        socketio.emit('pending_private_messages',
+                      {'mensajes': mensajes, 'mas': len(filas) > PENDIENTES_MAX},
+                      to=request.sid, callback=acuse_de(mensajes))
+
+
+def id_destinatario(data):
+    """destinatarioId del evento si es un id entero válido; si no, None"""
+    valor = data.get('destinatarioId') if isinstance(data, dict) else None
+    if isinstance(valor, int) and not isinstance(valor, bool) and valor > 0:
+        return valor
+    return None
+
+
+def acuse_de(mensajes):
+    """Callback del ack del cliente: los mensajes quedan como entregados"""
+    pares = [(m['id'], m['remitente_id']) for m in mensajes]
+    return lambda *_: recibos.entregado(pares)
 
 @socketio.on('send_private_message')
 def send_private_message(data):
-    remitente_id = data.get('remitenteId')
-    destinatario_id = data.get('destinatarioId')
-    mensaje = data.get('mensaje')
+    """Entrega el mensaje ya y lo deja en la cola de escritura.
+
+    El valor devuelto es el ack del emit (id y fecha asignados por el
+    servidor); 'private_message_saved' avisa cuando quedó en la base.
+    """
+    remitente_id = usuario_por_sid.get(request.sid)
+    if remitente_id is None:
+        return {"success": False, "error": "Sesión requerida"}
+    destinatario_id = id_destinatario(data)
+    mensaje = (data.get('mensaje') or '').strip()
+    if destinatario_id is None or not mensaje:
+        return {"success": False, "error": "Faltan datos del mensaje"}
 
-    # Guardar en DB
-    conn = get_db()
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO mensajes_privados(remitente_id, destinatario_id, mensaje)
-        VALUES (?, ?, ?)
-    """, (remitente_id, destinatario_id, mensaje))
-    conn.commit()
-    
-    # Obtener el ID del mensaje recién insertado
-    mensaje_id = cur.lastrowid
-    
-    # Obtener información completa del mensaje
-    cur.execute("""
-        SELECT mp.*, u.nombre as remitente_nombre
-        FROM mensajes_privados mp
-        JOIN usuarios u ON mp.remitente_id = u.id
-        WHERE mp.id = ?
-    """, (mensaje_id,))
-    
-    mensaje_completo = dict(cur.fetchone())
-    conn.close()
+    try:
+        escribiendo_privado.marcar(destinatario_id, remitente_id, False)
+        mensaje_data = escritura.encolar(remitente_id, destinatario_id, mensaje,
+                                         sid=request.sid, client_id=data.get('clientId'))
+    except ColaLlena:
+        return {"success": False, "error": "Servidor ocupado, intenta de nuevo"}
 
-    mensaje_data = {
-        "id": mensaje_completo['id'],
-        "remitente_id": remitente_id,
-        "destinatario_id": destinatario_id,
-        "mensaje": mensaje,
-        "fecha": mensaje_completo['fecha'],
-        "leido": mensaje_completo['leido']
-    }
+    # A cada sesión abierta del destinatario (no al remitente); el primer ack
+    # lo marca como entregado. Sin sesiones queda pendiente para join_private_chat
+    acuse = acuse_de([mensaje_data])
+    for sid in presencia.sids_privados(destinatario_id):
+        socketio.emit('new_private_message', mensaje_data, to=sid, callback=acuse)
 
-    # SOLUCIÓN: Enviar solo al destinatario, NO al remitente
-    sid_dest = connected_private_users.get(destinatario_id)
-    if sid_dest:
-        emit('new_private_message', mensaje_data, to=sid_dest)
+    return {"success": True, "id": mensaje_data['id'], "fecha": mensaje_data['fecha']}
 
 @socketio.on('typing_private')
 def typing_private(data):
-    user_id = data.get('userId')
-    destinatario_id = data.get('destinatarioId')
-    sid_dest = connected_private_users.get(destinatario_id)
-    if sid_dest:
-        emit('user_typing_private', {"userId": user_id}, to=sid_dest)
+    user_id = usuario_por_sid.get(request.sid)
+    destinatario_id = id_destinatario(data)
+    if user_id is not None and destinatario_id is not None:
+        escribiendo_privado.marcar(destinatario_id, user_id)
 
 @socketio.on('stop_typing_private')
 def stop_typing_private(data):
-    user_id = data.get('userId')
-    destinatario_id = data.get('destinatarioId')
-    sid_dest = connected_private_users.get(destinatario_id)
-    if sid_dest:
-        emit('user_stop_typing_private', {"userId": user_id}, to=sid_dest)
-
-# Obtener conversaciones del usuario
-@app.route("/api/conversaciones/<int:user_id>")
-def obtener_conversaciones(user_id):
-    try:
-        conn = get_db()
-        cur = conn.cursor()
-        # Último mensaje por cada contacto
-        cur.execute("""
-            SELECT u.id AS id, u.nombre, u.area, u.email,
-                   mp.mensaje AS ultimo_mensaje,
-                   SUM(CASE WHEN mp.leido = 0 AND mp.destinatario_id = ? THEN 1 ELSE 0 END) AS no_leidos
-            FROM usuarios u
-            LEFT JOIN mensajes_privados mp 
-                ON (u.id = mp.remitente_id AND mp.destinatario_id = ?)
-                OR (u.id = mp.destinatario_id AND mp.remitente_id = ?)
-            WHERE u.id != ?
-            GROUP BY u.id
-            ORDER BY MAX(mp.fecha) DESC
-        """, (user_id, user_id, user_id, user_id))
-        conversaciones = [dict(row) for row in cur.fetchall()]
-        conn.close()
-        return jsonify({"success": True, "conversaciones": conversaciones})
-    except Exception as e:
-        return jsonify({"success": False, "message": str(e)}), 500
-
-# Obtener mensajes de una conversación
-@app.route("/api/mensajes/<int:user_id>/<int:contacto_id>")
-def obtener_mensajes(user_id, contacto_id):
-    try:
-        conn = get_db()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT * FROM mensajes_privados
-            WHERE (remitente_id = ? AND destinatario_id = ?)
-               OR (remitente_id = ? AND destinatario_id = ?)
-            ORDER BY fecha ASC
-        """, (user_id, contacto_id, contacto_id, user_id))
-        mensajes = [dict(row) for row in cur.fetchall()]
-        conn.close()
-        return jsonify({"success": True, "mensajes": mensajes})
-    except Exception as e:
-        return jsonify({"success": False, "message": str(e)}), 500
+    user_id = usuario_por_sid.get(request.sid)
+    destinatario_id = id_destinatario(data)
+    if user_id is not None and destinatario_id is not None:
+        escribiendo_privado.marcar(destinatario_id, user_id, False)
 
 # Marcar mensajes como leídos
 @app.route("/api/marcar-leidos", methods=["POST"])
+@requiere_sesion
 def marcar_leidos():
     try:
         data = request.get_json()
-        usuario_id = data["usuarioId"]
+        usuario_id = usuario_actual()
         destinatario_id = data["destinatarioId"]
 
         conn = get_db()
         cur = conn.cursor()
-        cur.execute("""
-            UPDATE mensajes_privados
-            SET leido = 1
-            WHERE remitente_id = ? AND destinatario_id = ? AND leido = 0
-        """, (destinatario_id, usuario_id))
+        cur.execute(SQL_MARCAR_LEIDOS, (usuario_id, destinatario_id))
+        leidos = cur.fetchall()
+        conversaciones.marcar_leida(conn, usuario_id, destinatario_id)
         conn.commit()
-        conn.close()
+        # Al remitente le llega la marca de lectura en el próximo private_receipts
+        recibos.leidos(usuario_id, leidos)
         return jsonify({"success": True})
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
@@ -734,6 +1277,5 @@ def marcar_leidos():
 
 
 if __name__ == '__main__':
-    print("servidor TechPaint Flask...")
-    print("Chat disponible en: http://130.10.1.23:5050")
+    log.evento('servidor_iniciado', url='http://130.10.1.23:5050')
     socketio.run(app, debug=True, host='130.10.1.23', port=5050)
@@ -0,0 +1,308 @@
+"""Archivo de mensajes privados viejos en bases SQLite por año.
+
+Los mensajes con más de `dias` de antigüedad salen de la base viva hacia
+`carpeta/mensajes_AAAA.db` (una partición por año de la fecha del
+mensaje), así los índices calientes y el cache de páginas sólo cargan lo
+reciente. Por año y no por mes: una conexión puede tener a lo sumo 10 bases
+adjuntas, y un historial que recorre más particiones que eso las tendría que
+adjuntar y soltar en cada página. La tabla `archivos` de la base viva lista las particiones con su
+rango de fechas y `archivo_conversaciones` el rango de cada conversación
+dentro de cada partición; el historial adjunta con ATTACH sólo las que
+tienen mensajes de la conversación en el rango de la página (ver
+leer_pagina_mensajes en app.py).
+
+Sólo se archivan mensajes ya leídos y entregados que no son el último de su
+conversación: los contadores de no leídos, las entregas pendientes y el
+backfill de conversaciones siguen viendo todo lo que necesitan en la base
+viva. La búsqueda de texto completo cubre sólo la base viva.
+
+Cada lote se copia y se commitea en la partición antes de borrarlo de la
+base viva: con WAL una transacción sobre dos bases no es atómica entre ellas,
+y así un corte deja a lo sumo filas repetidas (el historial las descarta por
+id y la próxima corrida termina de moverlas), nunca filas perdidas.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+
+FORMATO_FECHA = "%Y-%m-%d %H:%M:%S"
+PREFIJO_ALIAS = "archivo_"
+COLUMNAS = "id, remitente_id, destinatario_id, mensaje, leido, fecha, entregado"
+
+# Misma forma que mensajes_privados e idx_mp_conversacion en la base viva
+ESQUEMA_PARTICION = [
+    """
+    CREATE TABLE IF NOT EXISTS {alias}.mensajes_privados(
+        id INTEGER PRIMARY KEY,
+        remitente_id INTEGER NOT NULL,
+        destinatario_id INTEGER NOT NULL,
+        mensaje TEXT NOT NULL,
+        leido BOOLEAN DEFAULT 0,
+        fecha TIMESTAMP,
+        entregado INTEGER NOT NULL DEFAULT 1
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS {alias}.idx_mp_conversacion "
+    "ON mensajes_privados(remitente_id, destinatario_id, fecha)",
+]
+
+# Recorre idx_mp_fecha por clave (fecha, id): los que no se pueden archivar
+# (no leídos, último de su conversación) no se vuelven a leer en cada lote
+SQL_CANDIDATOS = """
+    SELECT m.id, m.fecha FROM mensajes_privados m
+    WHERE m.fecha < ? AND (m.fecha, m.id) > (?, ?)
+      AND m.leido = 1 AND m.entregado = 1
+      AND NOT EXISTS (
+          SELECT 1 FROM conversaciones c
+          WHERE c.usuario_id = m.remitente_id AND c.contacto_id = m.destinatario_id
+            AND c.ultimo_mensaje_id = m.id
+      )
+    ORDER BY m.fecha, m.id
+    LIMIT ?
+"""
+
+# Una partición nueva nace indexada; una anterior a archivo_conversaciones
+# queda sin indexar hasta que indexar() recorre sus filas
+SQL_REGISTRAR_PARTICION = """
+    INSERT INTO archivos (particion, archivo, desde, hasta, filas, indexada)
+    VALUES (?, ?, ?, ?, ?, 1)
+    ON CONFLICT(particion) DO UPDATE SET
+        desde = min(desde, excluded.desde),
+        hasta = max(hasta, excluded.hasta),
+        filas = filas + excluded.filas
+"""
+
+# Rango de cada conversación (par de usuarios sin orden) entre las filas de `origen`
+SQL_REGISTRAR_CONVERSACIONES = """
+    INSERT INTO archivo_conversaciones (usuario_a, usuario_b, particion, desde, hasta)
+    SELECT min(remitente_id, destinatario_id), max(remitente_id, destinatario_id), ?,
+           MIN(fecha), MAX(fecha)
+    FROM {origen} WHERE {filtro}
+    GROUP BY 1, 2
+    ON CONFLICT(usuario_a, usuario_b, particion) DO UPDATE SET
+        desde = min(desde, excluded.desde),
+        hasta = max(hasta, excluded.hasta)
+"""
+
+# Particiones con mensajes de la conversación antes/después de la fecha, con
+# el rango de la conversación en vez del de toda la partición. Las no
+# indexadas no se pueden descartar y van con su rango completo
+SQL_PARTICIONES_ANTES = """
+    SELECT a.particion, a.archivo,
+           COALESCE(c.desde, a.desde) AS desde, COALESCE(c.hasta, a.hasta) AS hasta
+    FROM archivos a
+    LEFT JOIN archivo_conversaciones c
+        ON c.usuario_a = ? AND c.usuario_b = ? AND c.particion = a.particion
+    WHERE CASE WHEN a.indexada THEN c.desde <= ? ELSE a.desde <= ? END
+    ORDER BY hasta DESC
+"""
+SQL_PARTICIONES_DESPUES = """
+    SELECT a.particion, a.archivo,
+           COALESCE(c.desde, a.desde) AS desde, COALESCE(c.hasta, a.hasta) AS hasta
+    FROM archivos a
+    LEFT JOIN archivo_conversaciones c
+        ON c.usuario_a = ? AND c.usuario_b = ? AND c.particion = a.particion
+    WHERE CASE WHEN a.indexada THEN c.hasta >= ? ELSE a.hasta >= ? END
+    ORDER BY desde ASC
+"""
+
+
+def carpeta_por_defecto(ruta_db):
+    """TECHPAINT_ARCHIVO_DIR, o `archivo/` junto a la base viva"""
+    return os.environ.get("TECHPAINT_ARCHIVO_DIR",
+                          os.path.join(os.path.dirname(os.path.abspath(ruta_db)), "archivo"))
+
+
+class ArchivoMensajes:
+
+    def __init__(self, carpeta, dias=180, lote=500, max_adjuntas=8, paginas_vacuum=1000):
+        self.carpeta = carpeta
+        self.dias = dias
+        self.lote = lote                    # ids por IN (...): menos que el límite de parámetros
+        self.max_adjuntas = max_adjuntas    # particiones adjuntas por conexión (SQLite permite 10)
+        self.paginas_vacuum = paginas_vacuum
+        self._lock = threading.Lock()
+        self._metricas = {
+            "fase": None,              # archivando, vacuum o None entre corridas
+            "corridas": 0,
+            "movidos": 0,              # total desde que arrancó el worker
+            "movidos_corrida": 0,
+            "candidatos_corrida": 0,   # mensajes más viejos que el corte al empezar
+            "lotes": 0,
+            "paginas_liberadas": 0,
+            "paginas_libres": None,    # freelist tras el último vacuum
+            "ultima_corrida": None,
+            "segundos_ultima_corrida": None,
+            "adjuntadas": 0,
+        }
+
+    def _anotar(self, **valores):
+        with self._lock:
+            for clave, valor in valores.items():
+                if clave in ("corridas", "movidos", "lotes", "paginas_liberadas", "adjuntadas"):
+                    self._metricas[clave] += valor
+                else:
+                    self._metricas[clave] = valor
+
+    # --- lectura -----------------------------------------------------------
+
+    def particiones(self, conn, usuario_id, contacto_id, fecha, hacia_atras):
+        """Particiones que pueden tener mensajes de la conversación antes (o
+        después) de `fecha`, de la más cercana a la más lejana"""
+        par = (min(usuario_id, contacto_id), max(usuario_id, contacto_id))
+        sql = SQL_PARTICIONES_ANTES if hacia_atras else SQL_PARTICIONES_DESPUES
+        return conn.execute(sql, (*par, fecha, fecha)).fetchall()
+
+    def tabla(self, conn, particion):
+        """Nombre calificado de la tabla de la partición, adjuntándola si hace falta.
+
+        None si el archivo ya no está en la carpeta (se saltea la partición).
+        """
+        alias = self._adjuntar(conn, particion["particion"], particion["archivo"])
+        return None if alias is None else f"{alias}.mensajes_privados"
+
+    def _adjuntar(self, conn, particion, archivo, crear=False):
+        alias = PREFIJO_ALIAS + particion
+        adjuntas = [fila[0] for fila in conn.execute(
+            "SELECT name FROM pragma_database_list WHERE name LIKE ? ORDER BY seq",
+            (PREFIJO_ALIAS + "%",)).fetchall()]
+        if alias in adjuntas:
+            return alias
+        ruta = os.path.join(self.carpeta, archivo)
+        if crear:
+            os.makedirs(self.carpeta, exist_ok=True)
+        elif not os.path.exists(ruta):
+            return None
+        # Las más viejas primero: la conexión vuelve al pool con a lo sumo max_adjuntas
+        for viejo in adjuntas[:max(0, len(adjuntas) - self.max_adjuntas + 1)]:
+            conn.execute(f"DETACH DATABASE {viejo}")
+        conn.execute(f"ATTACH DATABASE ? AS {alias}", (ruta,))
+        self._anotar(adjuntadas=1)
+        if crear:
+            conn.execute(f"PRAGMA {alias}.journal_mode = WAL")
+            for sentencia in ESQUEMA_PARTICION:
+                conn.execute(sentencia.format(alias=alias))
+        return alias
+
+    def indexar(self, conn):
+        """Completa archivo_conversaciones con las particiones que no lo tienen.
+
+        Sólo hace algo con particiones archivadas antes de que existiera la
+        tabla; hasta entonces el historial las sigue recorriendo todas.
+        """
+        indexadas = 0
+        for fila in conn.execute(
+                "SELECT particion, archivo FROM archivos WHERE indexada = 0").fetchall():
+            tabla = self.tabla(conn, fila)
+            if tabla is None:
+                continue   # sin el archivo no hay filas que leer; queda para cuando vuelva
+            conn.execute(SQL_REGISTRAR_CONVERSACIONES.format(origen=tabla, filtro="1"),
+                         (fila["particion"],))
+            conn.execute("UPDATE archivos SET indexada = 1 WHERE particion = ?",
+                         (fila["particion"],))
+            conn.commit()
+            indexadas += 1
+        return indexadas
+
+    # --- archivado ---------------------------------------------------------
+
+    def archivar(self, conn, ahora=None, pausa=None):
+        """Mueve a las particiones los mensajes archivables más viejos que el corte.
+
+        `pausa(0)` se llama entre lotes (socketio.sleep para ceder el hub).
+        Devuelve cuántos mensajes salieron de la base viva.
+        """
+        ahora = ahora or datetime.now(timezone.utc)
+        self.indexar(conn)
+        corte = (ahora - timedelta(days=self.dias)).strftime(FORMATO_FECHA)
+        inicio = time.perf_counter()
+        candidatos = conn.execute(
+            "SELECT COUNT(*) FROM mensajes_privados WHERE fecha < ?", (corte,)).fetchone()[0]
+        self._anotar(fase="archivando", movidos_corrida=0, candidatos_corrida=candidatos)
+
+        movidos = 0
+        ultimo = ("", 0)
+        try:
+            while True:
+                filas = conn.execute(SQL_CANDIDATOS, (corte, *ultimo, self.lote)).fetchall()
+                if not filas:
+                    break
+                ultimo = (filas[-1][1], filas[-1][0])
+                por_particion = {}
+                for mensaje_id, fecha in filas:
+                    por_particion.setdefault(fecha[:4], []).append(mensaje_id)
+                for particion, ids in sorted(por_particion.items()):
+                    movidos += self._mover(conn, particion, ids)
+                self._anotar(movidos_corrida=movidos, lotes=1)
+                if pausa:
+                    pausa(0)
+        finally:
+            self._anotar(fase=None, movidos=movidos, corridas=1,
+                         ultima_corrida=ahora.strftime(FORMATO_FECHA),
+                         segundos_ultima_corrida=round(time.perf_counter() - inicio, 3))
+        return movidos
+
+    def _mover(self, conn, particion, ids):
+        archivo = f"mensajes_{particion}.db"
+        alias = self._adjuntar(conn, particion, archivo, crear=True)
+        marcas = ",".join("?" * len(ids))
+        desde, hasta = conn.execute(
+            f"SELECT MIN(fecha), MAX(fecha) FROM main.mensajes_privados WHERE id IN ({marcas})",
+            ids).fetchone()
+
+        # 1) Copia commiteada en la partición (los ya copiados por un corte se ignoran)
+        copiados = conn.execute(f"""
+            INSERT OR IGNORE INTO {alias}.mensajes_privados ({COLUMNAS})
+            SELECT {COLUMNAS} FROM main.mensajes_privados WHERE id IN ({marcas})
+        """, ids).rowcount
+        conn.commit()
+
+        # 2) Borrado en la base viva sin registrar bajas para /api/sync (ver cambios.py)
+        conn.execute(SQL_REGISTRAR_CONVERSACIONES.format(
+            origen="main.mensajes_privados", filtro=f"id IN ({marcas})"), (particion, *ids))
+        conn.execute("INSERT INTO archivando DEFAULT VALUES")
+        borrados = conn.execute(
+            f"DELETE FROM main.mensajes_privados WHERE id IN ({marcas})", ids).rowcount
+        conn.execute("DELETE FROM archivando")
+        conn.execute(SQL_REGISTRAR_PARTICION, (particion, archivo, desde, hasta, copiados))
+        conn.commit()
+        return borrados
+
+    # --- vacuum incremental ------------------------------------------------
+
+    def vacuum(self, conn, pausa=None):
+        """Devuelve al sistema las páginas libres de a `paginas_vacuum`.
+
+        Sólo con auto_vacuum = INCREMENTAL (bases nuevas, o `python db.py
+        activar-vacuum` sobre una existente). Devuelve las páginas liberadas.
+        """
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return 0
+        liberadas = 0
+        self._anotar(fase="vacuum")
+        try:
+            while True:
+                libres = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                self._anotar(paginas_libres=libres)
+                if not libres:
+                    break
+                paginas = min(libres, self.paginas_vacuum)
+                # executescript corre el PRAGMA hasta el final; execute libera una sola página
+                conn.executescript(f"PRAGMA incremental_vacuum({paginas})")
+                liberadas += paginas
+                self._anotar(paginas_liberadas=paginas)
+                if pausa:
+                    pausa(0)
+        finally:
+            self._anotar(fase=None)
+        return liberadas
+
+    def metricas(self):
+        with self._lock:
+            datos = dict(self._metricas)
+        # Al terminar quedan sólo los que no se pueden archivar (no leídos, últimos)
+        datos["viejos_en_base"] = max(datos["candidatos_corrida"] - datos["movidos_corrida"], 0)
+        datos["dias"] = self.dias
+        return datos
@@ -0,0 +1,84 @@
+"""Archivado de mensajes privados: velocidad, tamaño de la base viva e historial.
+
+Siembra una base temporal (un año de mensajes desde 2025-01-01), mide el
+historial reciente y el viejo, archiva lo anterior a `--dias` contado desde el
+fin del año sembrado, corre el vacuum incremental y vuelve a medir:
+
+    python benchmarks/bench_archivo.py --mensajes 500000 --dias 60
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bench_login import resumen  # noqa: E402
+from datos import INICIO, sembrar  # noqa: E402
+
+
+def tamano_mb(conn):
+    paginas = conn.execute("PRAGMA page_count").fetchone()[0]
+    return round(paginas * conn.execute("PRAGMA page_size").fetchone()[0] / 1e6, 1)
+
+
+def medir_historial(app, conn, pares, repeticiones, cursor):
+    tiempos = []
+    for _ in range(repeticiones):
+        user_id, contacto_id = random.choice(pares)
+        inicio = time.perf_counter()
+        list(app.leer_pagina_mensajes(conn, user_id, contacto_id, 50, cursor, True))
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return resumen(tiempos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--usuarios", type=int, default=1000)
+    parser.add_argument("--mensajes", type=int, default=300000)
+    parser.add_argument("--dias", type=float, default=60, help="TECHPAINT_ARCHIVO_DIAS")
+    parser.add_argument("--repeticiones", type=int, default=300)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        ruta = os.path.join(carpeta, "archivo.db")
+        conn = sqlite3.connect(ruta)
+        sembrar(conn, usuarios=args.usuarios, proyectos=10, votos=10, comentarios=10,
+                mensajes=args.mensajes)
+        conn.close()
+
+        os.environ.update(TECHPAINT_DB=ruta, TECHPAINT_ARCHIVO_DIAS=str(args.dias),
+                          TECHPAINT_ARCHIVO_INTERVALO="0", TECHPAINT_LOG_NIVEL="WARNING")
+        import app
+
+        random.seed(7)
+        with app.db_pool.conexion() as conn:
+            pares = [tuple(fila) for fila in conn.execute(
+                "SELECT usuario_id, contacto_id FROM conversaciones")]
+            recientes = app.CURSOR_FINAL
+            viejos = ("2025-02-01 00:00:00", 0)
+            print(f"base viva {tamano_mb(conn)} MB")
+            print(f"  historial reciente {medir_historial(app, conn, pares, args.repeticiones, recientes)}")
+            print(f"  historial de enero {medir_historial(app, conn, pares, args.repeticiones, viejos)}")
+
+            inicio = time.perf_counter()
+            movidos = app.archivo.archivar(conn, ahora=INICIO + timedelta(days=365))
+            segundos = time.perf_counter() - inicio
+            print(f"archivados {movidos} en {segundos:.1f}s ({movidos / segundos:,.0f} filas/s)")
+            inicio = time.perf_counter()
+            liberadas = app.archivo.vacuum(conn)
+            print(f"vacuum: {liberadas} páginas en {time.perf_counter() - inicio:.1f}s")
+
+            print(f"base viva {tamano_mb(conn)} MB, "
+                  f"{conn.execute('SELECT COUNT(*) FROM mensajes_privados').fetchone()[0]} mensajes")
+            print(f"  historial reciente {medir_historial(app, conn, pares, args.repeticiones, recientes)}")
+            print(f"  historial de enero {medir_historial(app, conn, pares, args.repeticiones, viejos)}")
+            print(f"  {app.archivo.metricas()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Latencia de /api/buscar sobre mensajes privados a gran escala.
+
+Crea una base temporal con el esquema migrado, carga N mensajes sintéticos
+(por defecto 1.000.000) y mide las consultas FTS5 de busqueda.py:
+
+    python benchmarks/bench_busqueda.py --mensajes 1000000 --repeticiones 50
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import busqueda  # noqa: E402
+from db import migrar  # noqa: E402
+
+VOCABULARIO = (
+    "hola proyecto pintura color flask python deploy servidor base datos "
+    "reunion cliente rojo azul verde lunes martes viernes revisar codigo "
+    "error prueba frontend backend diseño industrial digital mezcla tono"
+).split()
+RAROS = ["colorimetria", "electrostatica", "anodizado", "serigrafia"]
+
+
+def poblar(conn, usuarios, mensajes, semilla):
+    rnd = random.Random(semilla)
+    conn.executemany(
+        "INSERT INTO usuarios (id, nombre, email, password, area) VALUES (?, ?, ?, 'x', 'qa')",
+        ((i, f"Usuario {i}", f"u{i}@techpaint.com") for i in range(1, usuarios + 1)),
+    )
+
+    def filas():
+        for _ in range(mensajes):
+            remitente = rnd.randint(1, usuarios)
+            destinatario = rnd.randint(1, usuarios)
+            palabras = rnd.choices(VOCABULARIO, k=rnd.randint(3, 12))
+            if rnd.random() < 0.001:
+                palabras.append(rnd.choice(RAROS))
+            yield remitente, destinatario, " ".join(palabras)
+
+    conn.executemany(
+        "INSERT INTO mensajes_privados (remitente_id, destinatario_id, mensaje) VALUES (?, ?, ?)",
+        filas(),
+    )
+    conn.commit()
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    tiempos.sort()
+    return {
+        "p50_ms": round(statistics.median(tiempos), 3),
+        "p95_ms": round(tiempos[int(len(tiempos) * 0.95) - 1], 3),
+        "max_ms": round(tiempos[-1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mensajes", type=int, default=1_000_000)
+    parser.add_argument("--usuarios", type=int, default=2_000)
+    parser.add_argument("--repeticiones", type=int, default=50)
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        conn = sqlite3.connect(os.path.join(carpeta, "bench.db"))
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        migrar(conn)
+
+        inicio = time.perf_counter()
+        poblar(conn, args.usuarios, args.mensajes, args.semilla)
+        print(f"Carga de {args.mensajes} mensajes (con índice FTS): "
+              f"{time.perf_counter() - inicio:.1f}s")
+
+        usuario = 1
+        casos = {
+            "termino_raro": "electrostatica",
+            "termino_comun": "pintura",
+            "prefijo": "colori",
+            "dos_terminos": "revisar codigo",
+        }
+        for nombre, texto in casos.items():
+            consulta = busqueda.consulta_fts(texto)
+            resultado = medir(
+                lambda: busqueda.buscar_mensajes(conn, consulta, usuario, 20), args.repeticiones
+            )
+            print(f"{nombre:14} {texto!r:18} {resultado}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Generador de carga para la difusión de mensajes de sala.
+
+Levanta un worker real (trabajadores.py worker) sobre una base temporal,
+conecta N receptores y M emisores por WebSocket a la misma sala y manda
+ráfagas de mensajes. Compara emitir mensaje por mensaje con agrupar en
+frames new_messages (TECHPAINT_LOTE_MS):
+
+    python benchmarks/bench_difusion.py --receptores 50 --emisores 5 --tasa 400 --lotes 0 5 20
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import socketio
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def levantar_servidor(puerto, lote_ms, carpeta):
+    entorno = dict(os.environ,
+                   TECHPAINT_DB=os.path.join(carpeta, f"bench-{lote_ms}.db"),
+                   TECHPAINT_LOTE_MS=str(lote_ms))
+    entorno.pop("TECHPAINT_MQ", None)
+    proceso = subprocess.Popen(
+        [sys.executable, "trabajadores.py", "worker", "--puerto", str(puerto)],
+        cwd=RAIZ, env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{puerto}"
+    limite = time.time() + 15
+    while time.time() < limite:
+        try:
+            prueba = socketio.Client()
+            prueba.connect(url, transports=["websocket"])
+            prueba.disconnect()
+            return proceso, url
+        except socketio.exceptions.ConnectionError:
+            time.sleep(0.2)
+    proceso.kill()
+    raise RuntimeError("El servidor no arrancó")
+
+
+class Receptor:
+    def __init__(self, url, sala, nombre):
+        self.frames = 0
+        self.latencias = []
+        self.cliente = socketio.Client()
+        self.cliente.on("new_message", self._uno)
+        self.cliente.on("new_messages", self._lote)
+        self.cliente.connect(url, transports=["websocket"])
+        self.cliente.emit("join_chat", {"username": nombre, "room": sala})
+
+    def _registrar(self, mensaje):
+        enviado = float(mensaje["message"].split("|", 1)[0])
+        self.latencias.append((time.time() - enviado) * 1000)
+
+    def _uno(self, mensaje):
+        self.frames += 1
+        self._registrar(mensaje)
+
+    def _lote(self, datos):
+        self.frames += 1
+        for mensaje in datos["mensajes"]:
+            self._registrar(mensaje)
+
+
+def correr(url, receptores, emisores, tasa, segundos, relleno):
+    sala = "bench"
+    lista = [Receptor(url, sala, f"r{i}") for i in range(receptores)]
+    clientes = []
+    for i in range(emisores):
+        cliente = socketio.Client()
+        cliente.connect(url, transports=["websocket"])
+        cliente.emit("join_chat", {"username": f"e{i}", "room": sala})
+        clientes.append(cliente)
+    time.sleep(1)
+    for receptor in lista:
+        receptor.frames, receptor.latencias = 0, []
+
+    texto = "x" * relleno
+    por_emisor = tasa / emisores
+
+    def emitir(cliente):
+        proximo = time.perf_counter()
+        fin = proximo + segundos
+        while proximo < fin:
+            cliente.emit("send_message", {"message": f"{time.time()}|{texto}"})
+            proximo += 1 / por_emisor
+            espera = proximo - time.perf_counter()
+            if espera > 0:
+                time.sleep(espera)
+
+    hilos = [threading.Thread(target=emitir, args=(c,)) for c in clientes]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    time.sleep(2)  # que terminen de llegar
+    duracion = time.perf_counter() - inicio - 2
+
+    latencias = sorted(l for r in lista for l in r.latencias)
+    frames = sum(r.frames for r in lista)
+    for cliente in clientes + [r.cliente for r in lista]:
+        cliente.disconnect()
+    if not latencias:
+        return {"entregados": 0}
+    return {
+        "entregados": len(latencias),
+        "esperados": int(tasa * segundos) * receptores,
+        "entregas_por_s": round(len(latencias) / duracion),
+        "frames": frames,
+        "mensajes_por_frame": round(len(latencias) / max(frames, 1), 2),
+        "p50_ms": round(statistics.median(latencias), 2),
+        "p95_ms": round(latencias[int(len(latencias) * 0.95) - 1], 2),
+        "p99_ms": round(latencias[int(len(latencias) * 0.99) - 1], 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--receptores", type=int, default=50)
+    parser.add_argument("--emisores", type=int, default=5)
+    parser.add_argument("--tasa", type=float, default=200, help="mensajes por segundo en total")
+    parser.add_argument("--segundos", type=float, default=5)
+    parser.add_argument("--relleno", type=int, default=100, help="bytes extra por mensaje")
+    parser.add_argument("--lotes", type=float, nargs="+", default=[0, 5, 20],
+                        help="valores de TECHPAINT_LOTE_MS a comparar")
+    parser.add_argument("--puerto", type=int, default=5090)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        for lote_ms in args.lotes:
+            proceso, url = levantar_servidor(args.puerto, lote_ms, carpeta)
+            try:
+                resultado = correr(url, args.receptores, args.emisores, args.tasa,
+                                   args.segundos, args.relleno)
+            finally:
+                proceso.terminate()
+                proceso.wait()
+            print(f"lote {lote_ms:>5} ms  {resultado}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Latencia del chat mientras corren consultas largas a la base.
+
+Levanta un worker real (trabajadores.py worker) sobre una base con muchos
+comentarios y mensajes. Un socket mide el ida y vuelta de send_message
+mientras N hilos piden búsquedas que recorren decenas de miles de filas
+(/api/buscar con una palabra muy común). Con --lectores 0 cada consulta corre
+en el event loop, como antes del ejecutor:
+
+    python benchmarks/bench_ejecutor.py --concurrencia 8 --lectores 0 4
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bench_login import SondaChat, levantar_servidor, resumen  # noqa: E402
+from datos import sembrar  # noqa: E402
+
+
+def consultas_largas(url, concurrencia, segundos, texto):
+    latencias = []
+    codigos = {}
+    lock = threading.Lock()
+    fin = time.time() + segundos
+
+    def buscar():
+        sesion = requests.Session()
+        while time.time() < fin:
+            inicio = time.perf_counter()
+            respuesta = sesion.get(url + "/api/buscar",
+                                   params={"q": texto, "tipo": "proyectos,comentarios"})
+            with lock:
+                latencias.append((time.perf_counter() - inicio) * 1000)
+                codigos[respuesta.status_code] = codigos.get(respuesta.status_code, 0) + 1
+
+    hilos = [threading.Thread(target=buscar) for _ in range(concurrencia)]
+    for hilo in hilos:
+        hilo.start()
+    return hilos, latencias, codigos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--comentarios", type=int, default=200000)
+    parser.add_argument("--mensajes", type=int, default=100000)
+    parser.add_argument("--concurrencia", type=int, default=8, help="hilos con búsquedas")
+    parser.add_argument("--segundos", type=float, default=5)
+    parser.add_argument("--lectores", type=int, nargs="+", default=[0, 4],
+                        help="valores de TECHPAINT_DB_LECTORES a comparar")
+    parser.add_argument("--texto", default="hola", help="palabra a buscar")
+    parser.add_argument("--puerto", type=int, default=5092)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        # La misma base para todas las corridas: sólo cambia el ejecutor
+        ruta = os.path.join(carpeta, "ejecutor.db")
+        conn = sqlite3.connect(ruta)
+        sembrar(conn, usuarios=500, proyectos=2000, votos=1000,
+                comentarios=args.comentarios, mensajes=args.mensajes)
+        conn.close()
+
+        for lectores in args.lectores:
+            proceso, url = levantar_servidor(args.puerto, ruta,
+                                             TECHPAINT_DB_LECTORES=str(lectores))
+            try:
+                sonda = SondaChat(url)
+                reposo = sonda.medir(2)
+                corriendo, consultas, codigos = consultas_largas(
+                    url, args.concurrencia, args.segundos, args.texto)
+                chat = sonda.medir(args.segundos)
+                for hilo in corriendo:
+                    hilo.join()
+                sonda.cliente.disconnect()
+                ejecutor = requests.get(url + "/api/estado/db").json().get("ejecutor")
+            finally:
+                proceso.terminate()
+                proceso.wait()
+            print(f"lectores {lectores}: chat en reposo {reposo}")
+            print(f"            chat con consultas {chat}")
+            print(f"            búsquedas {resumen(consultas)}  "
+                  f"{len(consultas) / args.segundos:.1f} consultas/s  códigos {codigos}")
+            print(f"            ejecutor {ejecutor}")
+
+
+if __name__ == "__main__":
+    main()
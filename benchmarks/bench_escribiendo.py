@@ -0,0 +1,97 @@
+"""Emits de "está escribiendo" en una sala grande, antes y después de agrupar.
+
+Simula en tiempo virtual una sala de N usuarios donde una fracción escribe a
+la vez (ráfagas de teclas que terminan en un mensaje o se abandonan) y cuenta:
+
+    antes:   un emit a la sala por cada evento typing recibido
+    después: los room_typing que emite AgregadorEscritura
+
+    python benchmarks/bench_escribiendo.py --usuarios 500 --segundos 60
+"""
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from escribiendo import AgregadorEscritura  # noqa: E402
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 0.0
+
+    def __call__(self):
+        return self.ahora
+
+
+def simular(usuarios, segundos, activos, teclas_por_segundo, por_tecla, semilla):
+    rnd = random.Random(semilla)
+    reloj = Reloj()
+    emitidos = []
+    agregador = AgregadorEscritura(lambda canal, lista, origen: emitidos.append(len(lista)),
+                                   reloj=reloj)
+    paso = 0.01
+    proximo_publicar = agregador.intervalo
+    # usuario -> [fin de la ráfaga, próxima tecla, termina con mensaje, último aviso]
+    rafagas = {}
+    eventos = 0
+
+    while reloj.ahora < segundos:
+        reloj.ahora += paso
+        # Nuevas ráfagas hasta tener ~activos * usuarios escribiendo
+        objetivo = int(usuarios * activos)
+        while len(rafagas) < objetivo:
+            u = rnd.randrange(usuarios)
+            if u not in rafagas:
+                rafagas[u] = [reloj.ahora + rnd.uniform(2, 10), reloj.ahora, rnd.random() < 0.8, None]
+        for u, rafaga in list(rafagas.items()):
+            fin, tecla, con_mensaje, avisado = rafaga
+            if reloj.ahora >= fin:
+                if con_mensaje:
+                    # El mensaje enviado limpia el estado (y el cliente manda is_typing false)
+                    agregador.marcar("sala", u, False)
+                    eventos += 1
+                del rafagas[u]  # si se abandona, vence por TTL
+                continue
+            if reloj.ahora >= tecla:
+                # El cliente de salas avisa al empezar y renueva cada 2s; el privado, cada tecla
+                if por_tecla or avisado is None or reloj.ahora - avisado > 2:
+                    agregador.marcar("sala", u, True)
+                    eventos += 1
+                    rafaga[3] = reloj.ahora
+                rafaga[1] = tecla + rnd.expovariate(teclas_por_segundo)
+        if reloj.ahora >= proximo_publicar:
+            agregador.publicar()
+            proximo_publicar += agregador.intervalo
+
+    return eventos, emitidos, agregador.metricas()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--usuarios", type=int, default=500)
+    parser.add_argument("--segundos", type=float, default=60)
+    parser.add_argument("--activos", type=float, default=0.1,
+                        help="fracción de la sala escribiendo a la vez")
+    parser.add_argument("--teclas", type=float, default=5.0, help="teclas por segundo")
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args()
+
+    for por_tecla in (False, True):
+        eventos, emitidos, metricas = simular(args.usuarios, args.segundos, args.activos,
+                                              args.teclas, por_tecla, args.semilla)
+        # Cada emit a la sala se entrega a todos sus miembros
+        antes = eventos / args.segundos
+        despues = len(emitidos) / args.segundos
+        print(f"{'evento por tecla' if por_tecla else 'evento por ráfaga':18} "
+              f"antes {antes:8.1f} emits/s ({antes * (args.usuarios - 1):9.0f} entregas/s)  "
+              f"después {despues:5.1f} emits/s ({despues * args.usuarios:7.0f} entregas/s)  "
+              f"ahorro {100 * (1 - despues / antes):5.1f}%  "
+              f"lista media {sum(emitidos) / max(len(emitidos), 1):.1f}  "
+              f"expirados {metricas['expirados']}")
+
+
+if __name__ == "__main__":
+    main()
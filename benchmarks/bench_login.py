@@ -0,0 +1,162 @@
+"""Latencia de login y del chat durante una tormenta de logins.
+
+Levanta un worker real (trabajadores.py worker) sobre una base sembrada con
+contraseñas en texto plano (el primer login de cada usuario las migra a
+hash). Un socket mide el ida y vuelta de send_message mientras N hilos hacen
+login sin pausa. Con --hilos 0 el hash corre en el event loop, como quedaría
+sin el pool:
+
+    python benchmarks/bench_login.py --concurrencia 16 --hilos 0 2 4
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+import socketio
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from datos import PASSWORD, sembrar  # noqa: E402
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def levantar_servidor(puerto, ruta_db, hilos=0, metodo="scrypt:32768:8:1", **variables):
+    """Worker real; `variables` son TECHPAINT_* extra para el entorno"""
+    entorno = dict(os.environ, TECHPAINT_DB=ruta_db, TECHPAINT_HASH_HILOS=str(hilos),
+                   TECHPAINT_HASH=metodo, TECHPAINT_LOG_NIVEL="WARNING", **variables)
+    entorno.pop("TECHPAINT_MQ", None)
+    proceso = subprocess.Popen(
+        [sys.executable, "trabajadores.py", "worker", "--puerto", str(puerto)],
+        cwd=RAIZ, env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{puerto}"
+    limite = time.time() + 15
+    while time.time() < limite:
+        try:
+            requests.get(url + "/api/estado/db", timeout=1)
+            return proceso, url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    proceso.kill()
+    raise RuntimeError("El servidor no arrancó")
+
+
+def resumen(tiempos):
+    if not tiempos:
+        return {"n": 0}
+    tiempos = sorted(tiempos)
+    return {
+        "n": len(tiempos),
+        "p50_ms": round(statistics.median(tiempos), 1),
+        "p99_ms": round(tiempos[min(int(len(tiempos) * 0.99), len(tiempos) - 1)], 1),
+        "max_ms": round(tiempos[-1], 1),
+    }
+
+
+class SondaChat:
+    """Manda un mensaje a su propia sala cada `intervalo` y mide la vuelta"""
+
+    def __init__(self, url, intervalo=0.02):
+        self.intervalo = intervalo
+        self.latencias = []
+        self.activa = False
+        self.cliente = socketio.Client()
+        self.cliente.on("new_message", self._recibido)
+        self.cliente.connect(url, transports=["websocket"])
+        self.cliente.emit("join_chat", {"username": "sonda", "room": "bench-login"})
+        time.sleep(0.5)
+
+    def _recibido(self, mensaje):
+        if self.activa:
+            self.latencias.append((time.time() - float(mensaje["message"])) * 1000)
+
+    def medir(self, segundos, espera_max=15):
+        """Los que vuelven tarde también cuentan: se espera hasta espera_max"""
+        self.latencias = []
+        self.activa = True
+        enviados = 0
+        fin = time.time() + segundos
+        while time.time() < fin:
+            self.cliente.emit("send_message", {"message": str(time.time())})
+            enviados += 1
+            time.sleep(self.intervalo)
+        limite = time.time() + espera_max
+        while len(self.latencias) < enviados and time.time() < limite:
+            time.sleep(0.1)
+        self.activa = False
+        datos = resumen(self.latencias)
+        datos["perdidos"] = enviados - len(self.latencias)
+        return datos
+
+
+def tormenta(url, usuarios, concurrencia, segundos):
+    latencias = []
+    codigos = {}
+    lock = threading.Lock()
+    fin = time.time() + segundos
+
+    def login(indice):
+        sesion = requests.Session()
+        usuario = indice
+        while time.time() < fin:
+            usuario = usuario % usuarios + 1
+            inicio = time.perf_counter()
+            respuesta = sesion.post(url + "/api/login", json={
+                "email": f"usuario{usuario}@techpaint.com", "password": PASSWORD})
+            with lock:
+                latencias.append((time.perf_counter() - inicio) * 1000)
+                codigos[respuesta.status_code] = codigos.get(respuesta.status_code, 0) + 1
+            usuario += concurrencia
+
+    hilos = [threading.Thread(target=login, args=(i,)) for i in range(concurrencia)]
+    for hilo in hilos:
+        hilo.start()
+    return hilos, latencias, codigos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--usuarios", type=int, default=500)
+    parser.add_argument("--concurrencia", type=int, default=16, help="hilos haciendo login")
+    parser.add_argument("--segundos", type=float, default=5)
+    parser.add_argument("--hilos", type=int, nargs="+", default=[0, 2, 4],
+                        help="valores de TECHPAINT_HASH_HILOS a comparar")
+    parser.add_argument("--hash", default="scrypt:32768:8:1", help="TECHPAINT_HASH")
+    parser.add_argument("--puerto", type=int, default=5091)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        for hilos in args.hilos:
+            ruta = os.path.join(carpeta, f"login-{hilos}.db")
+            conn = sqlite3.connect(ruta)
+            sembrar(conn, usuarios=args.usuarios, proyectos=10, votos=10, comentarios=10, mensajes=100)
+            conn.close()
+
+            proceso, url = levantar_servidor(args.puerto, ruta, hilos, args.hash)
+            try:
+                sonda = SondaChat(url)
+                reposo = sonda.medir(2)
+                corriendo, logins, codigos = tormenta(url, args.usuarios, args.concurrencia,
+                                                      args.segundos)
+                chat = sonda.medir(args.segundos)
+                for hilo in corriendo:
+                    hilo.join()
+                sonda.cliente.disconnect()
+            finally:
+                proceso.terminate()
+                proceso.wait()
+            print(f"hilos {hilos}: chat en reposo {reposo}")
+            print(f"         chat con tormenta {chat}")
+            print(f"         login {resumen(logins)}  "
+                  f"{len(logins) / args.segundos:.1f} logins/s  códigos {codigos}")
+
+
+if __name__ == "__main__":
+    main()
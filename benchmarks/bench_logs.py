@@ -0,0 +1,111 @@
+"""Costo por mensaje del logging en el camino de send_message.
+
+Compara el print síncrono que había en on_message con bitacora.py en sus
+distintos modos (evento apagado, muestreado y registrado), más un
+StreamHandler JSON síncrono de referencia. La salida va a un archivo
+temporal, como stdout redirigido en producción, y después a una salida
+lenta (un pipe que el colector no vacía a tiempo):
+
+    python benchmarks/bench_logs.py --mensajes 200000
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import bitacora  # noqa: E402
+
+
+class SalidaLenta:
+    """Archivo que tarda `retardo` segundos por escritura (stdout a un pipe lleno)"""
+
+    def __init__(self, archivo):
+        self.archivo = archivo
+        self.retardo = 0.0
+
+    def write(self, texto):
+        if self.retardo:
+            time.sleep(self.retardo)
+        return self.archivo.write(texto)
+
+    def flush(self):
+        self.archivo.flush()
+
+
+def medir(funcion, mensajes):
+    inicio = time.perf_counter()
+    for i in range(mensajes):
+        funcion(i)
+    return (time.perf_counter() - inicio) / mensajes * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mensajes", type=int, default=200000)
+    parser.add_argument("--muestreo", type=float, default=0.01)
+    parser.add_argument("--lento-ms", type=float, default=1.0,
+                        help="demora por escritura de la salida lenta")
+    parser.add_argument("--mensajes-lento", type=int, default=2000)
+    args = parser.parse_args()
+
+    texto = "mensaje de benchmark " * 5
+    with tempfile.TemporaryDirectory() as carpeta:
+        archivo = SalidaLenta(open(os.path.join(carpeta, "salida.log"), "w", encoding="utf-8"))
+
+        def con_print(i):
+            print(f"[MSG] sid=abc{i} username=ana room=general message={texto}", file=archivo)
+
+        bitacora.configurar("INFO", salida=archivo, maximo=args.mensajes + 1)
+        apagado = bitacora.Bitacora("techpaint.bench")
+        muestreado = bitacora.Bitacora("techpaint.bench", niveles={"mensaje_sala": logging.INFO},
+                                       muestreo={"mensaje_sala": args.muestreo})
+        registrado = bitacora.Bitacora("techpaint.bench", niveles={"mensaje_sala": logging.INFO})
+
+        def evento(log):
+            return lambda i: log.evento("mensaje_sala", logging.DEBUG, sid=f"abc{i}",
+                                        username="ana", room="general", largo=len(texto))
+
+        sincrono = logging.getLogger("bench.sincrono")
+        sincrono.propagate = False
+        manejador = logging.StreamHandler(archivo)
+        manejador.setFormatter(bitacora.FormatoJSON())
+        sincrono.addHandler(manejador)
+        sincrono.setLevel(logging.INFO)
+
+        def json_sincrono(i):
+            sincrono.info("mensaje_sala", extra={"campos": {
+                "sid": f"abc{i}", "username": "ana", "room": "general", "largo": len(texto)}})
+
+        casos = [
+            ("print síncrono (antes)", con_print),
+            ("JSON síncrono", json_sincrono),
+            ("bitacora, evento apagado", evento(apagado)),
+            (f"bitacora, muestreo {args.muestreo}", evento(muestreado)),
+            ("bitacora, registrado", evento(registrado)),
+        ]
+        for nombre, funcion in casos:
+            costo = medir(funcion, args.mensajes)
+            archivo.flush()
+            print(f"{nombre:40} {costo:8.2f} µs/mensaje en el handler")
+
+        # Con la salida lenta el print frena al handler; bitacora sólo encola
+        archivo.retardo = args.lento_ms / 1000
+        for nombre, funcion in (casos[0], casos[-1]):
+            costo = medir(funcion, args.mensajes_lento)
+            print(f"{nombre + ', salida lenta':40} {costo:8.2f} µs/mensaje en el handler")
+        archivo.retardo = 0.0
+
+        # El hilo escritor termina de vaciar la cola fuera del tiempo medido
+        inicio = time.perf_counter()
+        bitacora.cerrar()
+        print(f"{'vaciado del hilo escritor':40} {time.perf_counter() - inicio:8.2f} s"
+              f"  (descartados: {bitacora.descartados()})")
+        archivo.archivo.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Latencia de join_chat con muchos sockets conectados.
+
+Conecta N clientes de prueba de Flask-SocketIO en salas de tamaño fijo y mide
+cuánto tarda cada join_chat a medida que crece el total de conectados. Con el
+índice por sala la latencia depende del tamaño de la sala, no del total:
+
+    python benchmarks/bench_presencia.py --sockets 10000 --por-sala 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from bench_busqueda import medir  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sockets", type=int, default=10_000)
+    parser.add_argument("--por-sala", type=int, default=50)
+    parser.add_argument("--puntos", type=int, default=5,
+                        help="cantidad de cortes donde se mide la latencia")
+    parser.add_argument("--repeticiones", type=int, default=200)
+    args = parser.parse_args()
+
+    carpeta = tempfile.mkdtemp()
+    os.environ["TECHPAINT_DB"] = os.path.join(carpeta, "bench.db")
+    os.environ.pop("TECHPAINT_MQ", None)
+    from app import app, socketio  # noqa: E402
+
+    clientes = []
+    paso = args.sockets // args.puntos
+
+    def conectar(i):
+        cliente = socketio.test_client(app)
+        cliente.emit("join_chat", {"username": f"u{i}", "room": f"sala-{i // args.por_sala}"})
+        cliente.get_received()  # no acumular eventos en memoria
+        return cliente
+
+    def medir_joins(repeticiones, salas_llenas):
+        # Sólo se cronometra el join_chat; conectar y desconectar quedan afuera
+        tiempos = []
+        for r in range(repeticiones):
+            cliente = socketio.test_client(app)
+            # Siempre a salas ya llenas, para que el tamaño de sala no cambie
+            datos = {"username": f"medido{r}", "room": f"sala-{r % salas_llenas}"}
+            tiempos.append(medir(lambda: cliente.emit("join_chat", datos), 1)["p50_ms"])
+            cliente.disconnect()
+        tiempos.sort()
+        return {
+            "p50_ms": round(statistics.median(tiempos), 3),
+            "p95_ms": round(tiempos[int(len(tiempos) * 0.95) - 1], 3),
+            "max_ms": round(tiempos[-1], 3),
+        }
+
+    for corte in range(1, args.puntos + 1):
+        inicio = time.perf_counter()
+        while len(clientes) < corte * paso:
+            clientes.append(conectar(len(clientes)))
+        carga = time.perf_counter() - inicio
+        # Lo que quedó en las colas de los demás sockets no se mide
+        for cliente in clientes:
+            cliente.get_received()
+        resultado = medir_joins(args.repeticiones, len(clientes) // args.por_sala)
+        print(f"{len(clientes):>7} conectados (+{paso} en {carga:.1f}s)  join_chat {resultado}")
+
+    for cliente in clientes:
+        cliente.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Carga de datos sintéticos con el esquema de BaseDatos_TP.db.
+
+Todo es determinístico para una semilla dada, así dos corridas del benchmark
+miden exactamente la misma base.
+"""
+import random
+from datetime import datetime, timedelta
+
+import conversaciones
+from db import migrar
+
+AREAS = ["Producción", "Calidad", "Logística", "Ventas", "Sistemas", "Mantenimiento"]
+TECNOLOGIAS = ["Python", "Flask", "JavaScript", "SQLite", "React", "Docker", "Node.js", "CSS"]
+PALABRAS = (
+    "hola proyecto pintura color flask python deploy servidor base datos reunion "
+    "cliente rojo azul verde revisar codigo error prueba frontend backend diseño "
+    "industrial digital mezcla tono"
+).split()
+INICIO = datetime(2025, 1, 1)
+PASSWORD = "bench1234"
+
+
+def _texto(rnd, minimo, maximo):
+    return " ".join(rnd.choices(PALABRAS, k=rnd.randint(minimo, maximo)))
+
+
+def _fecha(rnd, dias=365):
+    return (INICIO + timedelta(seconds=rnd.randrange(dias * 86400))).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def sembrar(conn, usuarios=1000, proyectos=2000, votos=50000, comentarios=20000,
+            mensajes=200000, semilla=42):
+    """Migra la base y la llena; devuelve la cantidad de filas por tabla"""
+    migrar(conn)
+    rnd = random.Random(semilla)
+
+    conn.executemany(
+        "INSERT INTO usuarios (id, nombre, email, password, area) VALUES (?, ?, ?, ?, ?)",
+        ((i, f"Usuario {i}", f"usuario{i}@techpaint.com", PASSWORD, rnd.choice(AREAS))
+         for i in range(1, usuarios + 1)),
+    )
+    conn.executemany("""
+        INSERT INTO proyectos (id, usuario_id, titulo, descripcion, github_url,
+                               tecnologias, fecha_publicacion)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, ((i, rnd.randint(1, usuarios), _texto(rnd, 2, 5).capitalize(), _texto(rnd, 10, 40),
+           f"https://github.com/techpaint/proyecto-{i}",
+           ", ".join(rnd.sample(TECNOLOGIAS, rnd.randint(1, 4))), _fecha(rnd))
+          for i in range(1, proyectos + 1)))
+
+    # Un voto por par (proyecto, usuario)
+    pares = set()
+    maximo = proyectos * usuarios
+    while len(pares) < min(votos, maximo):
+        pares.add((rnd.randint(1, proyectos), rnd.randint(1, usuarios)))
+    conn.executemany(
+        "INSERT INTO votos (proyecto_id, usuario_id, tipo) VALUES (?, ?, ?)",
+        ((p, u, "like" if rnd.random() < 0.75 else "dislike") for p, u in sorted(pares)),
+    )
+
+    conn.executemany(
+        "INSERT INTO comentarios (proyecto_id, usuario_id, comentario, fecha) VALUES (?, ?, ?, ?)",
+        ((rnd.randint(1, proyectos), rnd.randint(1, usuarios), _texto(rnd, 3, 20), _fecha(rnd))
+         for _ in range(comentarios)),
+    )
+
+    # Mensajes concentrados en pocos contactos por usuario, como una bandeja real
+    contactos = {u: rnd.sample(range(1, usuarios + 1), min(20, usuarios))
+                 for u in range(1, usuarios + 1)}
+    filas = sorted(
+        (_fecha(rnd), u, rnd.choice(contactos[u]), _texto(rnd, 3, 15), int(rnd.random() < 0.9))
+        for u in (rnd.randint(1, usuarios) for _ in range(mensajes))
+    )
+    conn.executemany("""
+        INSERT INTO mensajes_privados (fecha, remitente_id, destinatario_id, mensaje, leido)
+        VALUES (?, ?, ?, ?, ?)
+    """, filas)
+    conversaciones.backfill(conn)
+    conn.commit()
+
+    return {tabla: conn.execute(f"SELECT COUNT(*) FROM {tabla}").fetchone()[0]
+            for tabla in ("usuarios", "proyectos", "votos", "comentarios",
+                          "mensajes_privados", "conversaciones")}
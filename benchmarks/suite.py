@@ -0,0 +1,338 @@
+"""Suite de benchmarks de la API REST y de los eventos de Socket.IO.
+
+Siembra una base temporal con el esquema de BaseDatos_TP.db a la escala
+pedida, importa app.py apuntando a esa base y mide cada caso con el test
+client de Flask o el de Flask-SocketIO. Escribe p50/p95/p99 y operaciones
+por segundo de cada caso en JSON; con --comparar marca las regresiones
+contra una corrida anterior:
+
+    python benchmarks/suite.py --usuarios 2000 --mensajes 500000 --salida base.json
+    python benchmarks/suite.py --usuarios 2000 --mensajes 500000 --comparar base.json
+"""
+import argparse
+import atexit
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from datos import AREAS, PASSWORD, TECNOLOGIAS, sembrar  # noqa: E402
+
+
+def percentiles(tiempos, duracion):
+    tiempos = sorted(tiempos)
+
+    def p(q):
+        return round(tiempos[min(int(len(tiempos) * q), len(tiempos) - 1)], 3)
+
+    return {
+        "n": len(tiempos),
+        "p50_ms": p(0.50),
+        "p95_ms": p(0.95),
+        "p99_ms": p(0.99),
+        "max_ms": round(tiempos[-1], 3),
+        "ops_por_s": round(len(tiempos) / duracion, 1),
+    }
+
+
+class Contexto:
+    """Lo que comparten los casos: app, clientes y datos sembrados"""
+
+    def __init__(self, app, socketio, sesiones, escala, semilla):
+        self.app = app
+        self.socketio = socketio
+        self.sesiones = sesiones
+        self._tokens = {}
+        self.http = app.test_client()
+        self.escala = escala
+        self.rnd = random.Random(semilla)
+
+    def usuario(self):
+        return self.rnd.randint(1, self.escala["usuarios"])
+
+    def proyecto(self):
+        return self.rnd.randint(1, self.escala["proyectos"])
+
+    def token(self, usuario):
+        """Token de sesión emitido directo, sin pasar por el hash del login"""
+        if usuario not in self._tokens:
+            self._tokens[usuario] = self.sesiones.emitir(usuario)
+        return self._tokens[usuario]
+
+    def _encabezados(self, usuario):
+        return {"Authorization": f"Bearer {self.token(usuario)}"} if usuario else {}
+
+    @staticmethod
+    def _leida(respuesta):
+        # Leer todo y cerrar: las respuestas en streaming (historial de
+        # mensajes) devuelven su conexión al pool recién al cerrarse
+        respuesta.get_data()
+        respuesta.close()
+        return respuesta
+
+    def get(self, url, usuario=None):
+        respuesta = self._leida(self.http.get(url, headers=self._encabezados(usuario)))
+        assert respuesta.status_code == 200, (url, respuesta.status_code)
+        return respuesta
+
+    def post(self, url, datos, usuario=None):
+        respuesta = self._leida(self.http.post(url, json=datos, headers=self._encabezados(usuario)))
+        assert respuesta.status_code == 200, (url, respuesta.status_code, respuesta.get_json())
+        return respuesta
+
+
+# ---------------------------
+# Casos REST
+# ---------------------------
+
+def caso_feed(ctx):
+    ctx.get("/api/proyectos")
+
+
+def preparar_feed_sin_cache(ctx):
+    import app
+    app.feed_cache.invalidar()
+
+
+def caso_feed_filtrado(ctx):
+    ctx.get(f"/api/proyectos?area={ctx.rnd.choice(AREAS)}&tecnologia={ctx.rnd.choice(TECNOLOGIAS)}")
+
+
+def caso_feed_pagina_3(ctx):
+    url = "/api/proyectos"
+    for _ in range(3):
+        siguiente = ctx.get(url).get_json()["siguiente"]
+        if siguiente is None:
+            break   # con pocos proyectos el feed tiene menos de 3 páginas
+        url = "/api/proyectos?cursor=" + siguiente
+
+
+def caso_comentarios(ctx):
+    ctx.get(f"/api/proyectos/{ctx.proyecto()}/comentarios")
+
+
+def caso_votar(ctx):
+    ctx.post(f"/api/proyectos/{ctx.proyecto()}/votar",
+             {"tipo": ctx.rnd.choice(["like", "dislike"])}, ctx.usuario())
+
+
+def caso_comentar(ctx):
+    ctx.post(f"/api/proyectos/{ctx.proyecto()}/comentarios",
+             {"comentario": "comentario de benchmark"}, ctx.usuario())
+
+
+def caso_conversaciones(ctx):
+    usuario = ctx.usuario()
+    ctx.get(f"/api/conversaciones/{usuario}", usuario)
+
+
+def caso_mensajes(ctx):
+    usuario = ctx.usuario()
+    ctx.get(f"/api/mensajes/{usuario}/{ctx.usuario()}", usuario)
+
+
+def caso_buscar(ctx):
+    ctx.get("/api/buscar?q=pintura+col", ctx.usuario())
+
+
+def caso_usuarios(ctx):
+    ctx.get("/api/usuarios")
+
+
+def caso_login(ctx):
+    ctx.post("/api/login", {"email": f"usuario{ctx.usuario()}@techpaint.com", "password": PASSWORD})
+
+
+# ---------------------------
+# Casos Socket.IO
+# ---------------------------
+
+def preparar_socketio(ctx):
+    """Una sala con oyentes y un par de usuarios en el chat privado"""
+    if hasattr(ctx, "emisor"):
+        return
+    ctx.oyentes = []
+    for i in range(ctx.escala["oyentes"]):
+        cliente = ctx.socketio.test_client(ctx.app, flask_test_client=ctx.http)
+        cliente.emit("join_chat", {"username": f"oyente{i}", "room": "bench"})
+        ctx.oyentes.append(cliente)
+    ctx.emisor = ctx.socketio.test_client(ctx.app, flask_test_client=ctx.http,
+                                          auth={"token": ctx.token(1)})
+    ctx.emisor.emit("join_chat", {"username": "emisor", "room": "bench"})
+    ctx.emisor.emit("join_private_chat", {})
+    ctx.receptor = ctx.socketio.test_client(ctx.app, flask_test_client=ctx.http,
+                                            auth={"token": ctx.token(2)})
+    ctx.receptor.emit("join_private_chat", {})
+
+
+def vaciar_colas(ctx):
+    """Descarta lo recibido y deja correr las tareas de fondo (fuera del tiempo medido)"""
+    for cliente in ctx.oyentes + [ctx.emisor, ctx.receptor]:
+        cliente.get_received()
+    ctx.socketio.sleep(0)
+
+
+def caso_join_chat(ctx):
+    cliente = ctx.cliente_join
+    cliente.emit("join_chat", {"username": "visitante", "room": f"sala{ctx.rnd.randint(1, 50)}"})
+
+
+def preparar_join_chat(ctx):
+    preparar_socketio(ctx)
+    if not hasattr(ctx, "cliente_join"):
+        ctx.cliente_join = ctx.socketio.test_client(ctx.app, flask_test_client=ctx.http)
+    vaciar_colas(ctx)
+    ctx.cliente_join.get_received()
+
+
+def caso_send_message(ctx):
+    ctx.emisor.emit("send_message", {"message": "mensaje de benchmark"})
+
+
+def caso_send_private_message(ctx):
+    respuesta = ctx.emisor.emit("send_private_message", {
+        "destinatarioId": 2, "mensaje": "privado de benchmark",
+    }, callback=True)
+    assert respuesta and respuesta.get("success"), respuesta
+
+
+def preparar_socketio_y_vaciar(ctx):
+    preparar_socketio(ctx)
+    vaciar_colas(ctx)
+
+
+# nombre -> (función medida, preparación opcional antes de cada iteración)
+CASOS = {
+    "GET /api/proyectos": (caso_feed, None),
+    "GET /api/proyectos (sin cache)": (caso_feed, preparar_feed_sin_cache),
+    "GET /api/proyectos?area&tecnologia": (caso_feed_filtrado, preparar_feed_sin_cache),
+    "GET /api/proyectos x3 páginas": (caso_feed_pagina_3, preparar_feed_sin_cache),
+    "GET /api/proyectos/<id>/comentarios": (caso_comentarios, None),
+    "POST /api/proyectos/<id>/votar": (caso_votar, None),
+    "POST /api/proyectos/<id>/comentarios": (caso_comentar, None),
+    "GET /api/conversaciones/<id>": (caso_conversaciones, None),
+    "GET /api/mensajes/<id>/<id>": (caso_mensajes, None),
+    "GET /api/buscar": (caso_buscar, None),
+    "GET /api/usuarios": (caso_usuarios, None),
+    "POST /api/login": (caso_login, None),
+    "ws join_chat": (caso_join_chat, preparar_join_chat),
+    "ws send_message": (caso_send_message, preparar_socketio_y_vaciar),
+    "ws send_private_message": (caso_send_private_message, preparar_socketio_y_vaciar),
+}
+
+
+def medir_caso(ctx, funcion, preparar, iteraciones, calentamiento):
+    for _ in range(calentamiento):
+        if preparar:
+            preparar(ctx)
+        funcion(ctx)
+    tiempos = []
+    total = 0.0
+    for _ in range(iteraciones):
+        if preparar:
+            preparar(ctx)
+        inicio = time.perf_counter()
+        funcion(ctx)
+        transcurrido = time.perf_counter() - inicio
+        total += transcurrido
+        tiempos.append(transcurrido * 1000)
+    return percentiles(tiempos, total)
+
+
+def comparar(actual, anterior, umbral):
+    """Imprime la variación de p95 por caso; devuelve los que empeoraron más que umbral"""
+    regresiones = []
+    print(f"\n{'caso':40} {'p95 antes':>10} {'p95 ahora':>10} {'var':>8}")
+    for nombre, datos in actual["resultados"].items():
+        previo = anterior.get("resultados", {}).get(nombre)
+        if not previo:
+            print(f"{nombre:40} {'-':>10} {datos['p95_ms']:>10.3f}    nuevo")
+            continue
+        variacion = (datos["p95_ms"] - previo["p95_ms"]) / max(previo["p95_ms"], 1e-9)
+        marca = "  REGRESIÓN" if variacion > umbral else ""
+        print(f"{nombre:40} {previo['p95_ms']:>10.3f} {datos['p95_ms']:>10.3f} {variacion:>+8.1%}{marca}")
+        if marca:
+            regresiones.append(nombre)
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--usuarios", type=int, default=1000)
+    parser.add_argument("--proyectos", type=int, default=2000)
+    parser.add_argument("--votos", type=int, default=50000)
+    parser.add_argument("--comentarios", type=int, default=20000)
+    parser.add_argument("--mensajes", type=int, default=200000)
+    parser.add_argument("--oyentes", type=int, default=50, help="sockets en la sala de send_message")
+    parser.add_argument("--iteraciones", type=int, default=300)
+    parser.add_argument("--calentamiento", type=int, default=20)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--casos", help="subcadena para filtrar casos por nombre")
+    parser.add_argument("--salida", help="archivo JSON con los resultados")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior")
+    parser.add_argument("--umbral", type=float, default=0.2,
+                        help="variación de p95 que cuenta como regresión (0.2 = +20%%)")
+    args = parser.parse_args()
+
+    escala = {k: getattr(args, k) for k in
+              ("usuarios", "proyectos", "votos", "comentarios", "mensajes", "oyentes")}
+
+    carpeta = tempfile.mkdtemp(prefix="techpaint-bench-")
+    # Registrado antes de importar app: atexit corre en orden inverso, así que
+    # se borra después de que app vacíe sus colas de escritura
+    atexit.register(shutil.rmtree, carpeta, ignore_errors=True)
+    ruta = os.path.join(carpeta, "bench.db")
+    inicio = time.perf_counter()
+    conn = sqlite3.connect(ruta)
+    conn.execute("PRAGMA journal_mode = WAL")
+    filas = sembrar(conn, args.usuarios, args.proyectos, args.votos, args.comentarios,
+                    args.mensajes, args.semilla)
+    conn.close()
+    print(f"Base sembrada en {time.perf_counter() - inicio:.1f}s: {filas}")
+
+    # app.py lee la configuración al importarse
+    os.environ["TECHPAINT_DB"] = ruta
+    os.environ.pop("TECHPAINT_MQ", None)
+    from app import app, sesiones, socketio
+
+    ctx = Contexto(app, socketio, sesiones, escala, args.semilla)
+    resultados = {}
+    for nombre, (funcion, preparar) in CASOS.items():
+        if args.casos and args.casos not in nombre:
+            continue
+        resultados[nombre] = medir_caso(ctx, funcion, preparar, args.iteraciones, args.calentamiento)
+        r = resultados[nombre]
+        print(f"{nombre:40} p50 {r['p50_ms']:8.3f}  p95 {r['p95_ms']:8.3f}  "
+              f"p99 {r['p99_ms']:8.3f} ms  {r['ops_por_s']:9.1f} ops/s")
+
+    salida = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "escala": escala,
+        "filas": filas,
+        "iteraciones": args.iteraciones,
+        "resultados": resultados,
+    }
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(salida, f, indent=2, ensure_ascii=False)
+        print(f"Resultados en {args.salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            regresiones = comparar(salida, json.load(f), args.umbral)
+        if regresiones:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
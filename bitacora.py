@@ -0,0 +1,149 @@
+"""Logs estructurados en JSON que no bloquean a los handlers.
+
+Los handlers sólo dejan el registro en una cola acotada; un hilo aparte lo
+serializa a JSON y lo escribe. Si la cola se llena el registro se descarta
+y se cuenta, nunca se espera. Cada evento tiene nombre, y su nivel y una
+tasa de muestreo se pueden cambiar por configuración:
+
+    TECHPAINT_LOG_NIVEL=INFO
+    TECHPAINT_LOG_EVENTOS="mensaje_sala=INFO,socket_conectado=OFF"
+    TECHPAINT_LOG_MUESTREO="mensaje_sala=0.01"
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+
+# Nivel para apagar un evento por completo
+OFF = logging.CRITICAL + 10
+
+
+def nivel(nombre):
+    if str(nombre).upper() == "OFF":
+        return OFF
+    valor = logging.getLevelName(str(nombre).upper())
+    if not isinstance(valor, int):
+        raise ValueError(f"Nivel de log desconocido: {nombre}")
+    return valor
+
+
+def leer_pares(texto, convertir):
+    """"a=x,b=y" -> {"a": convertir("x"), "b": convertir("y")}"""
+    pares = {}
+    for parte in (texto or "").split(","):
+        if "=" in parte:
+            clave, valor = parte.split("=", 1)
+            pares[clave.strip()] = convertir(valor.strip())
+    return pares
+
+
+class FormatoJSON(logging.Formatter):
+    """Una línea JSON por registro, con los campos del evento al mismo nivel"""
+
+    def format(self, record):
+        datos = {
+            "ts": round(record.created, 3),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        datos.update(getattr(record, "campos", {}))
+        if record.exc_text:
+            datos["exc"] = record.exc_text
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class ManejadorCola(logging.handlers.QueueHandler):
+    """QueueHandler que descarta en vez de esperar cuando la cola está llena"""
+
+    def __init__(self, cola):
+        super().__init__(cola)
+        self.descartados = 0
+
+    def prepare(self, record):
+        # El registro sólo va a esta cola: se arma el mensaje y se manda tal
+        # cual, sin la copia ni el formateo que hace QueueHandler
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+
+
+_manejador = None
+_oyente = None
+
+
+def configurar(nivel_global="INFO", salida=None, maximo=10000):
+    """Conecta el logger "techpaint" (y sus hijos) a la cola y arranca el escritor.
+
+    El escritor es un hilo del sistema (QueueListener): la escritura a la
+    salida no pasa por el hub de eventlet.
+    """
+    global _manejador, _oyente
+    logger = logging.getLogger("techpaint")
+    logger.setLevel(nivel(nivel_global))
+    if _manejador is not None:
+        return _manejador
+
+    cola = queue.Queue(maxsize=maximo)
+    _manejador = ManejadorCola(cola)
+    destino = logging.StreamHandler(salida or sys.stderr)
+    destino.setFormatter(FormatoJSON())
+    _oyente = logging.handlers.QueueListener(cola, destino, respect_handler_level=True)
+    _oyente.start()
+    atexit.register(cerrar)
+
+    logger.addHandler(_manejador)
+    logger.propagate = False
+    return _manejador
+
+
+def cerrar():
+    """Escribe lo que quede en la cola y detiene el hilo escritor"""
+    global _oyente
+    if _oyente is not None:
+        _oyente.stop()
+        _oyente = None
+
+
+def descartados():
+    return _manejador.descartados if _manejador is not None else 0
+
+
+class Bitacora:
+    """Eventos con nombre sobre un logger, con nivel y muestreo por evento"""
+
+    def __init__(self, nombre, niveles=None, muestreo=None, azar=random.random):
+        self.logger = logging.getLogger(nombre)
+        self.niveles = dict(niveles or {})     # evento -> nivel con que se registra
+        self.muestreo = dict(muestreo or {})   # evento -> fracción que se registra
+        self._azar = azar
+
+    def evento(self, nombre, nivel_evento=logging.INFO, exc=False, **campos):
+        nivel_evento = self.niveles.get(nombre, nivel_evento)
+        # Descartar antes de armar el registro: es lo que pasa casi siempre
+        if not self.logger.isEnabledFor(nivel_evento):
+            return
+        tasa = self.muestreo.get(nombre)
+        if tasa is not None:
+            if self._azar() >= tasa:
+                return
+            campos["muestreo"] = tasa
+        campos["evento"] = nombre
+        # makeRecord + handle en vez de logger.log: sin findCaller, que
+        # recorre la pila en cada llamada y acá no aporta (el evento ya dice dónde)
+        registro = self.logger.makeRecord(
+            self.logger.name, nivel_evento, "", 0, nombre, None,
+            sys.exc_info() if exc else None, extra={"campos": campos})
+        self.logger.handle(registro)
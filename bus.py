@@ -0,0 +1,243 @@
+"""Cola de mensajes entre workers de Socket.IO.
+
+Con varios procesos cada uno sólo conoce sus propios sockets; los emits a una
+sala o a un sid se publican en un bus y cada worker entrega a los suyos.
+Backends según TECHPAINT_MQ:
+
+    (vacío)                 un solo proceso, sin bus
+    local:///ruta.sock      broker propio sobre un socket Unix (python bus.py)
+    memoria://              varios servidores dentro del mismo proceso (pruebas)
+    redis://, amqp://, ...  cualquier cola soportada por Flask-SocketIO
+"""
+import argparse
+import json
+import os
+import selectors
+import socket
+import sys
+
+import socketio
+
+from pool import crear_semaforo
+
+RUTA_BUS_POR_DEFECTO = "/tmp/techpaint-bus.sock"
+# Primera línea de cada conexión al broker
+ROL_PUBLICADOR = "PUB"
+ROL_SUSCRIPTOR = "SUB"
+# Bytes sin leer que el broker le guarda a un suscriptor antes de soltarlo
+MAX_ATRASO = 8 * 1024 * 1024
+
+
+class GestorBusLocal(socketio.PubSubManager):
+    """Publica y escucha en el broker local por un socket Unix"""
+
+    name = "local"
+
+    def __init__(self, url="local://" + RUTA_BUS_POR_DEFECTO, channel="flask-socketio",
+                 write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.ruta = url[len("local://"):] or RUTA_BUS_POR_DEFECTO
+        self._publicador = None
+        self._lock = None
+
+    def _modulo_socket(self):
+        # Con eventlet el socket tiene que ser verde para no frenar el hub
+        if self.server is not None and self.server.async_mode == "eventlet":
+            from eventlet.green import socket as socket_verde
+            return socket_verde
+        return socket
+
+    def _conectar(self, rol):
+        mod = self._modulo_socket()
+        conexion = mod.socket(mod.AF_UNIX, mod.SOCK_STREAM)
+        conexion.connect(self.ruta)
+        conexion.sendall(rol.encode() + b"\n")
+        return conexion
+
+    def _publish(self, data):
+        if self._lock is None:
+            modo = self.server.async_mode if self.server is not None else "threading"
+            self._lock = crear_semaforo(1, modo)
+        linea = (json.dumps({"canal": self.channel, "datos": data}) + "\n").encode()
+        with self._lock:
+            for _ in range(2):  # un reintento si el broker se reinició
+                try:
+                    if self._publicador is None:
+                        self._publicador = self._conectar(ROL_PUBLICADOR)
+                    self._publicador.sendall(linea)
+                    return
+                except OSError:
+                    if self._publicador is not None:
+                        self._publicador.close()
+                    self._publicador = None
+        self._get_logger().error("No se pudo publicar en el bus %s", self.ruta)
+
+    def _listen(self):
+        espera = 1
+        while True:
+            try:
+                conexion = self._conectar(ROL_SUSCRIPTOR)
+                espera = 1
+                for linea in conexion.makefile("rb"):
+                    mensaje = json.loads(linea)
+                    if mensaje.get("canal") == self.channel:
+                        yield mensaje["datos"]
+                # El broker suelta a los suscriptores muy atrasados
+                conexion.close()
+                self._get_logger().error("El bus %s cerró la conexión, reconectando", self.ruta)
+            except OSError:
+                self._get_logger().error("Bus %s no disponible, reintento en %ss", self.ruta, espera)
+            self.server.sleep(espera)
+            espera = min(espera * 2, 30)
+
+
+class GestorMemoria(socketio.PubSubManager):
+    """Bus dentro del proceso: cada servidor suscrito recibe todo lo publicado"""
+
+    name = "memoria"
+    _suscriptores = {}  # canal -> colas de los servidores
+
+    def initialize(self):
+        self._cola = self.server.eio.create_queue()
+        self._suscriptores.setdefault(self.channel, []).append(self._cola)
+        super().initialize()
+
+    def _publish(self, data):
+        for cola in list(self._suscriptores.get(self.channel, [])):
+            cola.put(data)
+
+    def _listen(self):
+        while True:
+            yield self._cola.get()
+
+
+def opciones_socketio(url, canal="flask-socketio"):
+    """kwargs para SocketIO(...) según la URL de la cola configurada"""
+    if not url:
+        return {}
+    if url.startswith("local://"):
+        return {"client_manager": GestorBusLocal(url, channel=canal)}
+    if url.startswith("memoria://"):
+        return {"client_manager": GestorMemoria(channel=canal)}
+    return {"message_queue": url, "channel": canal}
+
+
+def correr_broker(ruta, max_atraso=MAX_ATRASO):
+    """Reenvía cada línea de los publicadores a todos los suscriptores.
+
+    Cada conexión abre con una línea PUB o SUB. A los publicadores nunca se
+    les escribe; a los suscriptores se les escribe sin bloquear desde un
+    buffer propio, y al que acumula más de `max_atraso` bytes sin leer se lo
+    desconecta (su worker se vuelve a conectar) para no frenar al resto.
+    """
+    if os.path.exists(ruta):
+        os.unlink(ruta)
+    servidor = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    servidor.bind(ruta)
+    servidor.listen(128)
+    servidor.setblocking(False)
+
+    selector = selectors.DefaultSelector()
+    selector.register(servidor, selectors.EVENT_READ)
+    pendientes = {}     # conexión -> bytes de una línea incompleta
+    roles = {}          # conexión -> PUB / SUB (None hasta el saludo)
+    salidas = {}        # suscriptor -> bytes todavía no enviados
+
+    def cerrar(conexion):
+        selector.unregister(conexion)
+        pendientes.pop(conexion, None)
+        roles.pop(conexion, None)
+        salidas.pop(conexion, None)
+        conexion.close()
+
+    def enviar(conexion):
+        """Escribe lo que entre sin bloquear; False si hubo que cerrarla"""
+        try:
+            enviados = conexion.send(salidas[conexion])
+        except (BlockingIOError, InterruptedError):
+            enviados = 0
+        except OSError:
+            cerrar(conexion)
+            return False
+        del salidas[conexion][:enviados]
+        eventos = selectors.EVENT_READ | (selectors.EVENT_WRITE if salidas[conexion] else 0)
+        selector.modify(conexion, eventos)
+        return True
+
+    def repartir(lineas):
+        for destino, salida in list(salidas.items()):
+            if len(salida) + len(lineas) > max_atraso:
+                print(f"Bus: suscriptor desconectado con {len(salida)} bytes sin leer",
+                      file=sys.stderr)
+                cerrar(destino)
+                continue
+            vacia = not salida
+            salida += lineas
+            if vacia:
+                enviar(destino)
+
+    print(f"Bus local escuchando en {ruta}")
+    while True:
+        for clave, eventos in selector.select():
+            if clave.fileobj is servidor:
+                try:
+                    conexion, _ = servidor.accept()
+                except (BlockingIOError, InterruptedError):
+                    continue
+                conexion.setblocking(False)
+                selector.register(conexion, selectors.EVENT_READ)
+                pendientes[conexion] = b""
+                roles[conexion] = None
+                continue
+
+            conexion = clave.fileobj
+            if conexion not in roles:
+                continue    # cerrada antes en esta misma vuelta
+            if eventos & selectors.EVENT_WRITE and conexion in salidas:
+                if not enviar(conexion):
+                    continue
+            if not eventos & selectors.EVENT_READ:
+                continue
+
+            try:
+                datos = conexion.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                continue
+            except OSError:
+                datos = b""
+            if not datos:
+                cerrar(conexion)
+                continue
+
+            buffer = pendientes[conexion] + datos
+            if roles[conexion] is None:
+                saludo, separador, buffer = buffer.partition(b"\n")
+                if not separador:
+                    pendientes[conexion] = saludo
+                    continue
+                rol = saludo.strip().decode(errors="replace")
+                if rol not in (ROL_PUBLICADOR, ROL_SUSCRIPTOR):
+                    cerrar(conexion)
+                    continue
+                roles[conexion] = rol
+                if rol == ROL_SUSCRIPTOR:
+                    salidas[conexion] = bytearray()
+            if roles[conexion] == ROL_SUSCRIPTOR:
+                # Los suscriptores no publican: lo que manden se descarta
+                pendientes[conexion] = b""
+                continue
+
+            completas, _, resto = buffer.rpartition(b"\n")
+            pendientes[conexion] = resto
+            if completas:
+                repartir(completas + b"\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Broker local del bus de Socket.IO")
+    parser.add_argument("--socket", default=RUTA_BUS_POR_DEFECTO)
+    args = parser.parse_args()
+    try:
+        correr_broker(args.socket)
+    except KeyboardInterrupt:
+        sys.exit(0)
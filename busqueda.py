@@ -0,0 +1,122 @@
+"""Búsqueda de texto completo con FTS5 sobre proyectos, comentarios y mensajes.
+
+Las tablas FTS son de contenido externo (no duplican el texto) y se mantienen
+sincronizadas con triggers sobre las tablas base.
+"""
+import html
+import re
+
+
+# Marcadores del área privada de Unicode: no aparecen en texto normal y se
+# reemplazan por <mark> después de escapar el HTML del fragmento.
+INICIO_MARCA = "\ue000"
+FIN_MARCA = "\ue001"
+
+# (tabla fts, tabla base, columnas indexadas)
+INDICES_FTS = [
+    ("proyectos_fts", "proyectos", ("titulo", "descripcion", "tecnologias")),
+    ("comentarios_fts", "comentarios", ("comentario",)),
+    ("mensajes_fts", "mensajes_privados", ("mensaje",)),
+]
+
+
+def sentencias_fts():
+    """DDL de la migración: tablas virtuales, triggers y carga inicial"""
+    sentencias = []
+    for fts, base, columnas in INDICES_FTS:
+        cols = ", ".join(columnas)
+        nuevos = ", ".join(f"new.{c}" for c in columnas)
+        viejos = ", ".join(f"old.{c}" for c in columnas)
+        sentencias += [
+            f"""CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                {cols}, content='{base}', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )""",
+            f"""CREATE TRIGGER IF NOT EXISTS trg_{fts}_insert AFTER INSERT ON {base} BEGIN
+                INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {nuevos});
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS trg_{fts}_delete AFTER DELETE ON {base} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {viejos});
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS trg_{fts}_update AFTER UPDATE OF {cols} ON {base} BEGIN
+                INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {viejos});
+                INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {nuevos});
+            END""",
+            f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+        ]
+    return sentencias
+
+
+def consulta_fts(texto):
+    """Convierte texto libre en una consulta FTS5 segura.
+
+    Cada palabra va entre comillas (sin operadores ni sintaxis del usuario) y
+    la última se busca por prefijo para que funcione mientras se escribe.
+    """
+    palabras = re.findall(r"\w+", texto or "")
+    if not palabras:
+        return None
+    terminos = ['"%s"' % p for p in palabras]
+    terminos[-1] += "*"
+    return " ".join(terminos)
+
+
+def fragmento_html(texto):
+    """Escapa el fragmento y convierte los marcadores en <mark>"""
+    if texto is None:
+        return None
+    return html.escape(texto).replace(INICIO_MARCA, "<mark>").replace(FIN_MARCA, "</mark>")
+
+
+def _snippet(fts):
+    return f"snippet({fts}, -1, '{INICIO_MARCA}', '{FIN_MARCA}', '…', 16)"
+
+
+def buscar_proyectos(conn, consulta, limite):
+    filas = conn.execute(f"""
+        SELECT p.id, p.titulo, p.usuario_id, p.fecha_publicacion,
+               {_snippet('proyectos_fts')} AS fragmento,
+               bm25(proyectos_fts, 10.0, 4.0, 2.0) AS rank
+        FROM proyectos_fts
+        JOIN proyectos p ON p.id = proyectos_fts.rowid
+        WHERE proyectos_fts MATCH ?
+        ORDER BY rank
+        LIMIT ?
+    """, (consulta, limite)).fetchall()
+    return [_resultado(fila) for fila in filas]
+
+
+def buscar_comentarios(conn, consulta, limite):
+    filas = conn.execute(f"""
+        SELECT c.id, c.proyecto_id, c.usuario_id, c.fecha,
+               {_snippet('comentarios_fts')} AS fragmento,
+               bm25(comentarios_fts) AS rank
+        FROM comentarios_fts
+        JOIN comentarios c ON c.id = comentarios_fts.rowid
+        WHERE comentarios_fts MATCH ?
+        ORDER BY rank
+        LIMIT ?
+    """, (consulta, limite)).fetchall()
+    return [_resultado(fila) for fila in filas]
+
+
+def buscar_mensajes(conn, consulta, usuario_id, limite):
+    """Sólo mensajes de conversaciones en las que participa usuario_id"""
+    filas = conn.execute(f"""
+        SELECT m.id, m.remitente_id, m.destinatario_id, m.fecha,
+               {_snippet('mensajes_fts')} AS fragmento,
+               bm25(mensajes_fts) AS rank
+        FROM mensajes_fts
+        JOIN mensajes_privados m ON m.id = mensajes_fts.rowid
+        WHERE mensajes_fts MATCH ?
+          AND (m.remitente_id = ? OR m.destinatario_id = ?)
+        ORDER BY rank
+        LIMIT ?
+    """, (consulta, usuario_id, usuario_id, limite)).fetchall()
+    return [_resultado(fila) for fila in filas]
+
+
+def _resultado(fila):
+    resultado = dict(fila)
+    resultado["fragmento"] = fragmento_html(resultado["fragmento"])
+    return resultado
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def etag_de(cuerpo):
+    """ETag fuerte: depende sólo de los bytes de la respuesta"""
+    if isinstance(cuerpo, str):
+        cuerpo = cuerpo.encode()
+    return hashlib.sha1(cuerpo).hexdigest()[:20]
+
+
+class CacheVersionada:
+    """Respuestas ya serializadas, válidas mientras no cambie la versión de los datos.
+
+    Cada escritura relevante llama a invalidar(), que sube la versión y vacía
+    el cache; mientras tanto las lecturas no tocan la base ni re-serializan.
+    Con varios workers las escrituras de los otros no pasan por acá:
+    sincronizar() recibe una versión leída de la base y vacía el cache cuando
+    cambió.
+    """
+
+    def __init__(self, max_entradas=256):
+        self.max_entradas = max_entradas
+        self.version = 0
+        self._compartida = None
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def obtener(self, clave):
+        """Devuelve (etag, cuerpo) o None"""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.misses += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.hits += 1
+            return entrada
+
+    def guardar(self, clave, cuerpo, version):
+        """Guarda la respuesta calculada con los datos de `version`.
+
+        Si mientras tanto hubo una invalidación la respuesta ya está vieja:
+        se devuelve igual al que la pidió pero no se cachea.
+        """
+        entrada = (etag_de(cuerpo), cuerpo)
+        with self._lock:
+            if version == self.version:
+                self._entradas[clave] = entrada
+                self._entradas.move_to_end(clave)
+                while len(self._entradas) > self.max_entradas:
+                    self._entradas.popitem(last=False)
+        return entrada
+
+    def invalidar(self):
+        with self._lock:
+            self.version += 1
+            self._entradas.clear()
+
+    def sincronizar(self, version_compartida):
+        """Invalida si la versión de los datos en la base cambió desde la última vez"""
+        with self._lock:
+            if version_compartida != self._compartida:
+                self._compartida = version_compartida
+                self.version += 1
+                self._entradas.clear()
+
+    def metricas(self):
+        with self._lock:
+            return {
+                "version": self.version,
+                "version_compartida": self._compartida,
+                "entradas": len(self._entradas),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class CachePerfiles:
+    """Perfiles de usuarios (sin password) en un LRU acotado con vencimiento.
+
+    Las lecturas calientes traen sólo ids y completan nombre/área desde acá.
+    Cada escritura de un perfil llama a invalidar(); el vencimiento (ttl)
+    acota lo que puede quedar viejo en los otros workers, que no se enteran.
+    También guarda la lista completa de /api/usuarios ya serializada.
+    """
+
+    COLUMNAS = ("id", "nombre", "email", "area", "github_username")
+
+    def __init__(self, max_entradas=10000, ttl=300.0, reloj=time.monotonic):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.reloj = reloj
+        self._perfiles = OrderedDict()   # id -> (perfil, vence)
+        self._lista = None               # (etag, cuerpo, usuarios, vence)
+        self._version = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def varios(self, conn, ids):
+        """{id: perfil} de los ids pedidos; los que faltan se leen en una consulta"""
+        encontrados = {}
+        faltan = []
+        ahora = self.reloj()
+        with self._lock:
+            for usuario_id in set(ids):
+                entrada = self._perfiles.get(usuario_id)
+                if entrada is not None and entrada[1] > ahora:
+                    self._perfiles.move_to_end(usuario_id)
+                    encontrados[usuario_id] = entrada[0]
+                elif usuario_id is not None:
+                    faltan.append(usuario_id)
+            self.hits += len(encontrados)
+            self.misses += len(faltan)
+        # De a tandas para no pasar el límite de parámetros de SQLite
+        for i in range(0, len(faltan), 500):
+            tanda = faltan[i:i + 500]
+            filas = conn.execute(
+                f"SELECT {', '.join(self.COLUMNAS)} FROM usuarios "
+                f"WHERE id IN ({', '.join('?' * len(tanda))})", tanda).fetchall()
+            for fila in filas:
+                perfil = self.guardar(fila)
+                encontrados[perfil["id"]] = perfil
+        return encontrados
+
+    def obtener(self, conn, usuario_id):
+        """Perfil como dict, o None si el usuario no existe"""
+        return self.varios(conn, (usuario_id,)).get(usuario_id)
+
+    def hidratar(self, conn, filas, campo_id, **campos):
+        """Completa cada fila (dict) con datos del perfil de filas[campo_id].
+
+        `campos` es destino=columna del perfil, p. ej. usuario_nombre="nombre".
+        """
+        perfiles = self.varios(conn, (fila[campo_id] for fila in filas))
+        for fila in filas:
+            perfil = perfiles.get(fila[campo_id])
+            for destino, columna in campos.items():
+                fila[destino] = perfil[columna] if perfil else None
+        return filas
+
+    def guardar(self, fila):
+        perfil = {columna: fila[columna] for columna in self.COLUMNAS}
+        with self._lock:
+            self._perfiles[perfil["id"]] = (perfil, self.reloj() + self.ttl)
+            self._perfiles.move_to_end(perfil["id"])
+            while len(self._perfiles) > self.max_entradas:
+                self._perfiles.popitem(last=False)
+        return perfil
+
+    def invalidar(self, usuario_id=None):
+        """Olvida un perfil (o ninguno, para un usuario nuevo) y la lista completa"""
+        with self._lock:
+            if usuario_id is not None:
+                self._perfiles.pop(usuario_id, None)
+            self._lista = None
+            self._version += 1
+
+    def lista(self, conn):
+        """(etag, cuerpo JSON, usuarios) de todos los usuarios, recalculado si cambió o venció"""
+        with self._lock:
+            lista = self._lista
+            version = self._version
+        if lista is not None and lista[3] > self.reloj():
+            return lista[:3]
+        usuarios = [dict(fila) for fila in conn.execute(
+            "SELECT id, nombre, email, area FROM usuarios ORDER BY id")]
+        cuerpo = json.dumps({"success": True, "usuarios": usuarios})
+        lista = (etag_de(cuerpo), cuerpo, usuarios, self.reloj() + self.ttl)
+        with self._lock:
+            # Como en CacheVersionada: si hubo una invalidación mientras tanto no se guarda
+            if version == self._version:
+                self._lista = lista
+        return lista[:3]
+
+    def metricas(self):
+        with self._lock:
+            return {
+                "entradas": len(self._perfiles),
+                "hits": self.hits,
+                "misses": self.misses,
+                "version_lista": self._version,
+            }
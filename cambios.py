@@ -0,0 +1,130 @@
+"""Registro de cambios (change log) para sincronizar clientes por deltas.
+
+Los triggers de la migración 10 agregan una fila a `cambios` en la misma
+transacción que cada alta, cambio o baja en proyectos, votos, comentarios y
+mensajes_privados. `seq` es AUTOINCREMENT: crece siempre y, como SQLite
+tiene un solo escritor, las filas se commitean en orden de seq. Un cliente
+guarda el último seq que vio y /api/sync le devuelve sólo lo posterior.
+
+`usuario_id` es la audiencia de la fila: NULL para lo público (proyectos,
+comentarios), el votante para su voto y una fila por participante para los
+mensajes privados.
+"""
+
+
+def _triggers(tabla, id_fila, audiencias, columnas_update=None, condicion_baja=None):
+    """Triggers de alta, cambio y baja que registran (tabla, id, operación, audiencia).
+
+    `condicion_baja` va como WHEN del trigger de baja: las bajas que no la
+    cumplen no se registran.
+    """
+    sentencias = []
+    for evento, operacion, fila in (("INSERT", "alta", "NEW"), ("UPDATE", "cambio", "NEW"),
+                                    ("DELETE", "baja", "OLD")):
+        if evento == "UPDATE" and columnas_update:
+            evento = f"UPDATE OF {', '.join(columnas_update)}"
+        cuando = f" WHEN {condicion_baja}" if evento == "DELETE" and condicion_baja else ""
+        inserts = "\n".join(
+            f"INSERT INTO cambios (tabla, fila_id, operacion, usuario_id) "
+            f"VALUES ('{tabla}', {fila}.{id_fila}, '{operacion}', "
+            f"{audiencia.format(fila=fila) if audiencia else 'NULL'});"
+            for audiencia in audiencias)
+        sentencias.append(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_cambios_{tabla}_{operacion}
+            AFTER {evento} ON {tabla}{cuando}
+            BEGIN
+                {inserts}
+            END
+        """)
+    return sentencias
+
+
+TRIGGERS = [
+    # Los contadores de votos se materializan en proyectos (votos.py), así que
+    # cada voto también deja un cambio público del proyecto
+    *_triggers("proyectos", "id", [None]),
+    *_triggers("votos", "proyecto_id", ["{fila}.usuario_id"], ["tipo"]),
+    *_triggers("comentarios", "id", [None]),
+    # entregado cambia con cada ack (recibos.py) y no le interesa al historial
+    *_triggers("mensajes_privados", "id", ["{fila}.remitente_id", "{fila}.destinatario_id"],
+               ["mensaje", "leido"]),
+]
+
+# Migración 11: mover mensajes al archivo (archivo.py) no es borrarlos. Mientras
+# dura el DELETE del archivado hay una fila en `archivando` y la baja no se
+# registra; las otras conexiones nunca la ven porque vive en esa transacción.
+TRIGGER_BAJA_MENSAJES = _triggers(
+    "mensajes_privados", "id", ["{fila}.remitente_id", "{fila}.destinatario_id"],
+    ["mensaje", "leido"], condicion_baja="NOT EXISTS (SELECT 1 FROM archivando)")[2]
+
+SQL_CAMBIOS_DESDE = """
+    SELECT seq, tabla, fila_id, operacion FROM cambios
+    WHERE seq > ? AND seq <= ? AND (usuario_id IS NULL OR usuario_id = ?)
+    ORDER BY seq
+    LIMIT ?
+"""
+
+
+# Por idx_cambios_publicos (migración 12): no recorre los cambios de privados
+SQL_VERSION_PUBLICA = "SELECT COALESCE(MAX(seq), 0) FROM cambios WHERE usuario_id IS NULL"
+
+
+def ultimo_seq(conn):
+    return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM cambios").fetchone()[0]
+
+
+def version_publica(conn):
+    """Último seq de proyectos, votos o comentarios, escrito por cualquier worker"""
+    return conn.execute(SQL_VERSION_PUBLICA).fetchone()[0]
+
+
+def leer(conn, usuario_id, desde, limite):
+    """Cambios visibles para el usuario después de `desde`.
+
+    Devuelve (hasta, mas, cambios) donde cambios es {tabla: {fila_id: operacion}}
+    con la última operación de cada fila, o None si la compactación ya borró
+    parte de lo que el cliente no vio y tiene que recargar todo.
+    """
+    piso = conn.execute("SELECT MIN(seq) FROM cambios").fetchone()[0]
+    if piso is not None and desde < piso - 1:
+        return None
+    # Tope fijado antes de leer: lo que se commitee mientras tanto queda para la próxima
+    tope = ultimo_seq(conn)
+    filas = conn.execute(SQL_CAMBIOS_DESDE, (desde, tope, usuario_id, limite + 1)).fetchall()
+    mas = len(filas) > limite
+    if mas:
+        filas = filas[:limite]
+        tope = filas[-1][0]
+    cambios = {}
+    for _, tabla, fila_id, operacion in filas:
+        cambios.setdefault(tabla, {})[fila_id] = operacion
+    return tope, mas, cambios
+
+
+def compactar(conn, max_filas=100000, horas=72):
+    """Borra el registro viejo: más de `max_filas` o anterior a `horas`.
+
+    Devuelve cuántas filas borró. Los clientes con un seq anterior al nuevo
+    piso reciben reiniciar en /api/sync.
+    """
+    ultimo = ultimo_seq(conn)
+    recientes = conn.execute(
+        "SELECT seq FROM cambios WHERE fecha >= datetime('now', ?) ORDER BY seq LIMIT 1",
+        (f"-{horas} hours",)).fetchone()
+    # fecha crece con seq: todo lo anterior a la primera fila reciente es viejo
+    tope = max(ultimo - max_filas, (recientes[0] if recientes else ultimo + 1) - 1)
+    # La última fila queda siempre: marca el piso para detectar clientes atrasados
+    tope = min(tope, ultimo - 1)
+    return conn.execute("DELETE FROM cambios WHERE seq <= ?", (tope,)).rowcount
+
+
+def reiniciar(conn):
+    """Vacía el registro tras una carga masiva (volcado.py), que no pasa por triggers.
+
+    El piso queda por encima de todo seq ya entregado: cada cliente recibe
+    reiniciar en su próximo /api/sync.
+    """
+    ultimo = ultimo_seq(conn)
+    conn.execute("DELETE FROM cambios")
+    conn.execute("INSERT INTO cambios (seq, tabla, fila_id, operacion) VALUES (?, 'reinicio', 0, 'cambio')",
+                 (ultimo + 2,))
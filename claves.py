@@ -0,0 +1,164 @@
+"""Hash de contraseñas fuera del event loop y límite de intentos de login.
+
+scrypt/pbkdf2 tardan decenas de milisegundos a propósito. Con un solo hub de
+eventlet, calcularlos ahí frenaría todos los sockets del chat, así que corren
+en hilos del sistema (tpool con eventlet, un ThreadPoolExecutor si no):
+hashlib suelta el GIL mientras calcula. La cantidad de hashes simultáneos y
+la cola de espera son acotadas; pasado el límite se rechaza en vez de esperar.
+"""
+import hmac
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from pool import crear_semaforo
+
+METODO_POR_DEFECTO = "scrypt:32768:8:1"
+
+
+class ServicioOcupado(Exception):
+    """Demasiados hashes en curso o esperando"""
+
+
+def es_hash(guardado):
+    """Las filas viejas guardaban la contraseña en texto plano"""
+    return guardado.startswith(("scrypt:", "pbkdf2:")) and guardado.count("$") == 2
+
+
+class HasherClaves:
+
+    def __init__(self, metodo=METODO_POR_DEFECTO, hilos=2, max_cola=64, espera=5.0,
+                 modo="threading"):
+        self.hilos = hilos
+        self.max_cola = max_cola
+        self.espera = espera
+        if hilos <= 0:
+            # Sin pool, en el mismo hilo: sólo para comparar en el benchmark
+            self._ejecutar = lambda funcion, *args: funcion(*args)
+        elif modo == "eventlet":
+            from eventlet import tpool
+            self._ejecutar = tpool.execute
+        else:
+            self._executor = ThreadPoolExecutor(hilos, thread_name_prefix="claves")
+            self._ejecutar = lambda funcion, *args: self._executor.submit(funcion, *args).result()
+        self._semaforo = crear_semaforo(max(hilos, 1), modo)
+        self._lock = threading.Lock()
+        self._esperando = 0
+        self._metricas = {"hashes": 0, "verificaciones": 0, "rechazados": 0, "segundos": 0.0}
+        # El prefijo completo ("scrypt" -> "scrypt:32768:8:1") para detectar
+        # hashes hechos con otro costo; también sirve de hash para emails que no existen
+        self._hash_falso = generate_password_hash("", method=metodo)
+        self.metodo = self._hash_falso.split("$", 1)[0]
+
+    def _en_pool(self, funcion, *args):
+        with self._lock:
+            if self._esperando >= self.max_cola:
+                self._metricas["rechazados"] += 1
+                raise ServicioOcupado("Demasiados logins en curso")
+            self._esperando += 1
+        try:
+            adquirido = self._semaforo.acquire(timeout=self.espera)
+        finally:
+            with self._lock:
+                self._esperando -= 1
+        if not adquirido:
+            with self._lock:
+                self._metricas["rechazados"] += 1
+            raise ServicioOcupado("Demasiados logins en curso")
+        inicio = time.perf_counter()
+        try:
+            return self._ejecutar(funcion, *args)
+        finally:
+            self._semaforo.release()
+            with self._lock:
+                self._metricas["segundos"] += time.perf_counter() - inicio
+
+    def generar(self, password):
+        with self._lock:
+            self._metricas["hashes"] += 1
+        return self._en_pool(generate_password_hash, password, self.metodo)
+
+    def verificar(self, guardado, password):
+        """Devuelve (válida, hash nuevo o None).
+
+        El hash nuevo viene cuando la fila hay que reescribirla: texto plano
+        heredado u otro costo que el configurado.
+        """
+        with self._lock:
+            self._metricas["verificaciones"] += 1
+        if guardado is None or not es_hash(guardado):
+            # Mismo costo que una verificación real, para no delatar por el
+            # tiempo de respuesta qué emails existen o cuáles no tienen hash
+            self._en_pool(check_password_hash, self._hash_falso, password)
+            if guardado is not None and hmac.compare_digest(guardado.encode(), password.encode()):
+                return True, self.generar(password)
+            return False, None
+        if not self._en_pool(check_password_hash, guardado, password):
+            return False, None
+        if guardado.split("$", 1)[0] != self.metodo:
+            return True, self.generar(password)
+        return True, None
+
+    def metricas(self):
+        with self._lock:
+            datos = dict(self._metricas)
+            datos["esperando"] = self._esperando
+        datos["segundos"] = round(datos["segundos"], 3)
+        datos["metodo"] = self.metodo
+        datos["hilos"] = self.hilos
+        return datos
+
+
+class LimitadorIntentos:
+    """Fallos recientes por clave (IP o email) en una ventana deslizante.
+
+    Es por proceso: con varios workers cada uno cuenta los suyos.
+    """
+
+    def __init__(self, max_fallos=5, ventana=300.0, max_claves=10000, reloj=time.monotonic):
+        self.max_fallos = max_fallos
+        self.ventana = ventana
+        self.max_claves = max_claves
+        self.reloj = reloj
+        self._fallos = OrderedDict()   # clave -> deque de instantes de fallo
+        self._lock = threading.Lock()
+
+    def _recientes(self, clave, ahora):
+        fallos = self._fallos.get(clave)
+        if fallos is None:
+            return None
+        while fallos and fallos[0] <= ahora - self.ventana:
+            fallos.popleft()
+        if not fallos:
+            del self._fallos[clave]
+            return None
+        return fallos
+
+    def bloqueado(self, clave):
+        """Segundos que faltan para poder intentar de nuevo (0 = puede)"""
+        with self._lock:
+            ahora = self.reloj()
+            fallos = self._recientes(clave, ahora)
+            if fallos is None or len(fallos) < self.max_fallos:
+                return 0
+            return fallos[-self.max_fallos] + self.ventana - ahora
+
+    def fallo(self, clave):
+        with self._lock:
+            ahora = self.reloj()
+            fallos = self._recientes(clave, ahora)
+            if fallos is None:
+                fallos = self._fallos[clave] = deque(maxlen=self.max_fallos)
+                # Las claves más viejas se olvidan primero
+                while len(self._fallos) > self.max_claves:
+                    self._fallos.popitem(last=False)
+            else:
+                self._fallos.move_to_end(clave)
+            fallos.append(ahora)
+
+    def exito(self, clave):
+        with self._lock:
+            self._fallos.pop(clave, None)
@@ -0,0 +1,72 @@
+"""SQL de las rutas calientes de app.py.
+
+Viven acá y no dentro de las vistas para que db.CONSULTAS_CRITICAS (y
+tests/test_planes.py) revisen el plan de la misma sentencia que corre la app.
+"""
+
+# tecnologias se guarda como "Python, Flask": se compara ",python,flask,"
+SQL_FEED_PROYECTOS = """
+    SELECT p.*
+    FROM proyectos p
+    WHERE (p.fecha_publicacion, p.id) < (?, ?)
+      AND (? IS NULL OR (SELECT area FROM usuarios WHERE id = p.usuario_id) = ?)
+      AND (? IS NULL OR instr(',' || replace(lower(coalesce(p.tecnologias, '')), ' ', '') || ',',
+                              ',' || ? || ',') > 0)
+    ORDER BY p.fecha_publicacion DESC, p.id DESC
+    LIMIT ?
+"""
+
+SQL_COMENTARIOS_PROYECTO = """
+    SELECT c.*
+    FROM comentarios c
+    WHERE c.proyecto_id = ?
+    ORDER BY c.fecha ASC
+"""
+
+# Cada sentido de la conversación recorre su propio rango de idx_mp_conversacion
+# y sólo lee `limite` filas; el UNION ALL mezcla ambos sentidos. {tabla} es
+# mensajes_privados o la de una partición del archivo (ver archivo.py).
+SQL_PAGINA_MENSAJES = """
+    SELECT mp.*
+    FROM (
+        SELECT * FROM (
+            SELECT * FROM {tabla}
+            WHERE remitente_id = ? AND destinatario_id = ? AND (fecha, id) {op} (?, ?)
+            ORDER BY fecha {orden}, id {orden} LIMIT ?
+        )
+        UNION ALL
+        SELECT * FROM (
+            SELECT * FROM {tabla}
+            WHERE remitente_id = ? AND destinatario_id = ? AND (fecha, id) {op} (?, ?)
+              AND remitente_id != destinatario_id
+            ORDER BY fecha {orden}, id {orden} LIMIT ?
+        )
+        ORDER BY fecha {orden}, id {orden} LIMIT ?
+    ) mp
+    ORDER BY mp.fecha ASC, mp.id ASC
+"""
+
+SQL_HAY_MAS_MENSAJES = """
+    SELECT EXISTS(
+        SELECT 1 FROM {tabla}
+        WHERE remitente_id = ? AND destinatario_id = ? AND (fecha, id) {op} (?, ?)
+    ) OR EXISTS(
+        SELECT 1 FROM {tabla}
+        WHERE remitente_id = ? AND destinatario_id = ? AND (fecha, id) {op} (?, ?)
+    )
+"""
+
+# (lector, remitente): lo que remitente le mandó a lector y todavía no leyó
+SQL_MARCAR_LEIDOS = """
+    UPDATE mensajes_privados
+    SET leido = 1, entregado = 1
+    WHERE destinatario_id = ? AND remitente_id = ? AND leido = 0
+    RETURNING id, remitente_id
+"""
+
+SQL_ENTREGAS_PENDIENTES = """
+    SELECT * FROM mensajes_privados
+    WHERE destinatario_id = ? AND entregado = 0
+    ORDER BY id
+    LIMIT ?
+"""
@@ -0,0 +1,106 @@
+"""Resumen desnormalizado de conversaciones privadas (bandeja de entrada).
+
+Cada conversación se guarda dos veces, una fila por participante, para que la
+bandeja de un usuario sea un único recorrido por índice sobre
+(usuario_id, ultima_fecha) en lugar de agregar todo el historial.
+"""
+
+
+# Bandeja de un usuario: un recorrido de idx_conversaciones_bandeja
+SQL_BANDEJA = """
+    SELECT c.contacto_id AS id, c.ultimo_mensaje, c.ultima_fecha, c.no_leidos
+    FROM conversaciones c
+    WHERE c.usuario_id = ?
+    ORDER BY c.ultima_fecha DESC
+"""
+
+# Reconstruye el resumen a partir de mensajes_privados
+SQL_RESUMEN_ESPERADO = """
+    SELECT x.usuario_id, x.contacto_id,
+           m.id AS ultimo_mensaje_id, m.mensaje AS ultimo_mensaje, m.fecha AS ultima_fecha,
+           (SELECT COUNT(*) FROM mensajes_privados
+            WHERE destinatario_id = x.usuario_id AND remitente_id = x.contacto_id
+              AND leido = 0) AS no_leidos
+    FROM (
+        SELECT usuario_id, contacto_id, id AS ultimo_id,
+               ROW_NUMBER() OVER (PARTITION BY usuario_id, contacto_id
+                                  ORDER BY fecha DESC, id DESC) AS orden
+        FROM (
+            SELECT remitente_id AS usuario_id, destinatario_id AS contacto_id, id, fecha
+            FROM mensajes_privados
+            UNION ALL
+            SELECT destinatario_id, remitente_id, id, fecha
+            FROM mensajes_privados
+        )
+    ) x
+    JOIN mensajes_privados m ON m.id = x.ultimo_id
+    WHERE x.orden = 1
+"""
+
+SQL_UPSERT = """
+    INSERT INTO conversaciones
+        (usuario_id, contacto_id, ultimo_mensaje_id, ultimo_mensaje, ultima_fecha, no_leidos)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(usuario_id, contacto_id) DO UPDATE SET
+        ultimo_mensaje_id = CASE WHEN {mas_nuevo} THEN excluded.ultimo_mensaje_id
+                                 ELSE ultimo_mensaje_id END,
+        ultimo_mensaje = CASE WHEN {mas_nuevo} THEN excluded.ultimo_mensaje
+                              ELSE ultimo_mensaje END,
+        ultima_fecha = CASE WHEN {mas_nuevo} THEN excluded.ultima_fecha
+                            ELSE ultima_fecha END,
+        no_leidos = no_leidos + excluded.no_leidos
+""".format(
+    # Último = mayor (fecha, id), el mismo orden que el historial. Con varios
+    # workers los ids se reservan por bloques y no crecen con el tiempo.
+    mas_nuevo="(excluded.ultima_fecha, excluded.ultimo_mensaje_id) > (ultima_fecha, ultimo_mensaje_id)"
+)
+
+
+def registrar_mensaje(conn, mensaje_id, remitente_id, destinatario_id, mensaje, fecha):
+    """Actualiza ambas filas del par en la misma transacción que el INSERT"""
+    conn.execute(SQL_UPSERT, (remitente_id, destinatario_id, mensaje_id, mensaje, fecha, 0))
+    if destinatario_id != remitente_id:
+        conn.execute(SQL_UPSERT, (destinatario_id, remitente_id, mensaje_id, mensaje, fecha, 1))
+
+
+def marcar_leida(conn, usuario_id, contacto_id):
+    """Pone en cero los no leídos de usuario_id en su conversación con contacto_id"""
+    conn.execute("""
+        UPDATE conversaciones SET no_leidos = 0
+        WHERE usuario_id = ? AND contacto_id = ? AND no_leidos != 0
+    """, (usuario_id, contacto_id))
+
+
+def backfill(conn):
+    """Regenera la tabla completa desde mensajes_privados; devuelve filas escritas"""
+    conn.execute("DELETE FROM conversaciones")
+    cur = conn.execute(f"""
+        INSERT INTO conversaciones
+            (usuario_id, contacto_id, ultimo_mensaje_id, ultimo_mensaje, ultima_fecha, no_leidos)
+        {SQL_RESUMEN_ESPERADO}
+    """)
+    return cur.rowcount
+
+
+def verificar(conn):
+    """Compara el resumen con el historial.
+
+    Devuelve los pares (usuario_id, contacto_id) cuyas filas difieren, faltan
+    o sobran; lista vacía si la tabla es consistente.
+    """
+    columnas = "usuario_id, contacto_id, ultimo_mensaje_id, ultimo_mensaje, ultima_fecha, no_leidos"
+    filas = conn.execute(f"""
+        SELECT usuario_id, contacto_id FROM (
+            SELECT * FROM ({SQL_RESUMEN_ESPERADO})
+            EXCEPT
+            SELECT {columnas} FROM conversaciones
+        )
+        UNION
+        SELECT usuario_id, contacto_id FROM (
+            SELECT {columnas} FROM conversaciones
+            EXCEPT
+            SELECT * FROM ({SQL_RESUMEN_ESPERADO})
+        )
+        ORDER BY usuario_id, contacto_id
+    """).fetchall()
+    return [(fila[0], fila[1]) for fila in filas]
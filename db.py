@@ -1,74 +1,386 @@
+import os
 import sqlite3
+import sys
 
-def crear_tablas():
-    conexion = sqlite3.connect("BaseDatos_TP.db")  # Agregar .db
-    cursor = conexion.cursor()
-
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS usuarios(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        nombre TEXT NOT NULL,
-        email TEXT UNIQUE NOT NULL,
-        password TEXT NOT NULL,
-        area TEXT NOT NULL,
-        github_username TEXT
-    )
-    """)
-    
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS proyectos(  -- Corrección: TABLE, no TALBE
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        usuario_id INTEGER NOT NULL,
-        titulo TEXT NOT NULL,
-        descripcion TEXT,
-        github_url TEXT NOT NULL,
-        tecnologias TEXT,
-        fecha_publicacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (usuario_id) REFERENCES usuarios(id)  -- Corrección: FOREIGN
-    )
-    """)
-    
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS votos(  -- Faltaba paréntesis
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        proyecto_id INTEGER NOT NULL,
-        usuario_id INTEGER NOT NULL,  -- Corrección: usuario_id, no usuarios_id
-        tipo TEXT CHECK(tipo IN ('like', 'dislike')),
-        fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP,  -- Corrección: CURRENT_TIMESTAMP
-        FOREIGN KEY (proyecto_id) REFERENCES proyectos(id),  -- Corrección: FOREIGN
-        FOREIGN KEY (usuario_id) REFERENCES usuarios(id),
-        UNIQUE(proyecto_id, usuario_id)
-    )
-    """)
-    
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS comentarios(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        proyecto_id INTEGER NOT NULL,
-        usuario_id INTEGER NOT NULL,  -- Corrección: usuario_id
-        comentario TEXT NOT NULL,  -- Corrección: comentario (singular)
-        fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (proyecto_id) REFERENCES proyectos(id),
-        FOREIGN KEY (usuario_id) REFERENCES usuarios(id)  -- Quitar coma final
-    )
-    """)
-    
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS mensajes_privados(  -- Corrección: TABLE
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        remitente_id INTEGER NOT NULL,
-        destinatario_id INTEGER NOT NULL,
-        mensaje TEXT NOT NULL,
-        leido BOOLEAN DEFAULT 0,  -- 0 = false en SQLite
-        fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (remitente_id) REFERENCES usuarios(id),
-        FOREIGN KEY (destinatario_id) REFERENCES usuarios(id)  -- Quitar coma final
-    )
-    """)
-    
-    conexion.commit()
+import archivo
+import busqueda
+import cambios
+import consultas
+import conversaciones
+import presencia
+import salas
+import votos
+
+DB_PATH = os.environ.get("TECHPAINT_DB", "BaseDatos_TP.db")
+
+
+# Migraciones versionadas: (version, descripcion, sentencias).
+# Cada sentencia es SQL o una función que recibe la conexión (backfills).
+# La versión aplicada se guarda en PRAGMA user_version; nunca editar una
+# migración ya publicada, agregar una nueva al final.
+MIGRACIONES = [
+    (1, "esquema inicial", [
+        """
+        CREATE TABLE IF NOT EXISTS usuarios(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            area TEXT NOT NULL,
+            github_username TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS proyectos(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            usuario_id INTEGER NOT NULL,
+            titulo TEXT NOT NULL,
+            descripcion TEXT,
+            github_url TEXT NOT NULL,
+            tecnologias TEXT,
+            fecha_publicacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS votos(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            proyecto_id INTEGER NOT NULL,
+            usuario_id INTEGER NOT NULL,
+            tipo TEXT CHECK(tipo IN ('like', 'dislike')),
+            fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (proyecto_id) REFERENCES proyectos(id),
+            FOREIGN KEY (usuario_id) REFERENCES usuarios(id),
+            UNIQUE(proyecto_id, usuario_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS comentarios(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            proyecto_id INTEGER NOT NULL,
+            usuario_id INTEGER NOT NULL,
+            comentario TEXT NOT NULL,
+            fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (proyecto_id) REFERENCES proyectos(id),
+            FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS mensajes_privados(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            remitente_id INTEGER NOT NULL,
+            destinatario_id INTEGER NOT NULL,
+            mensaje TEXT NOT NULL,
+            leido BOOLEAN DEFAULT 0,  -- 0 = false en SQLite
+            fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (remitente_id) REFERENCES usuarios(id),
+            FOREIGN KEY (destinatario_id) REFERENCES usuarios(id)
+        )
+        """,
+    ]),
+    (2, "indices para las consultas frecuentes", [
+        # Historial de una conversación, en ambos sentidos, ordenado por fecha
+        "CREATE INDEX IF NOT EXISTS idx_mp_conversacion ON mensajes_privados(remitente_id, destinatario_id, fecha)",
+        # No leídos por destinatario (y por remitente para marcar leídos)
+        "CREATE INDEX IF NOT EXISTS idx_mp_no_leidos ON mensajes_privados(destinatario_id, leido, remitente_id)",
+        # Conteo de likes/dislikes sin tocar la tabla
+        "CREATE INDEX IF NOT EXISTS idx_votos_proyecto_tipo ON votos(proyecto_id, tipo)",
+        "CREATE INDEX IF NOT EXISTS idx_comentarios_proyecto_fecha ON comentarios(proyecto_id, fecha)",
+        "CREATE INDEX IF NOT EXISTS idx_proyectos_fecha ON proyectos(fecha_publicacion)",
+    ]),
+    (3, "resumen de conversaciones para la bandeja de entrada", [
+        """
+        CREATE TABLE IF NOT EXISTS conversaciones(
+            usuario_id INTEGER NOT NULL,
+            contacto_id INTEGER NOT NULL,
+            ultimo_mensaje_id INTEGER NOT NULL,
+            ultimo_mensaje TEXT,
+            ultima_fecha TIMESTAMP,
+            no_leidos INTEGER NOT NULL DEFAULT 0,  -- pendientes para usuario_id
+            PRIMARY KEY (usuario_id, contacto_id),
+            FOREIGN KEY (usuario_id) REFERENCES usuarios(id),
+            FOREIGN KEY (contacto_id) REFERENCES usuarios(id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_conversaciones_bandeja ON conversaciones(usuario_id, ultima_fecha)",
+        conversaciones.backfill,
+    ]),
+    (4, "contadores de votos materializados en proyectos", [
+        "ALTER TABLE proyectos ADD COLUMN likes INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE proyectos ADD COLUMN dislikes INTEGER NOT NULL DEFAULT 0",
+        *votos.TRIGGERS,
+        votos.reconciliar,
+    ]),
+    (5, "busqueda de texto completo (FTS5) sincronizada por triggers", busqueda.sentencias_fts()),
+    (6, "presencia compartida entre workers de Socket.IO", [
+        """
+        CREATE TABLE IF NOT EXISTS trabajadores(
+            id TEXT PRIMARY KEY,
+            latido REAL NOT NULL  -- epoch del último latido
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS presencia_salas(
+            sid TEXT PRIMARY KEY,
+            trabajador TEXT NOT NULL,
+            username TEXT NOT NULL,
+            sala TEXT NOT NULL,
+            desde TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_presencia_sala ON presencia_salas(sala, desde)",
+        """
+        CREATE TABLE IF NOT EXISTS presencia_privada(
+            usuario_id INTEGER PRIMARY KEY,
+            sid TEXT NOT NULL,
+            trabajador TEXT NOT NULL
+        )
+        """,
+    ]),
+    (7, "secuencias de ids reservados por bloques", [
+        """
+        CREATE TABLE IF NOT EXISTS secuencias(
+            nombre TEXT PRIMARY KEY,
+            ultimo INTEGER NOT NULL  -- último id entregado a algún worker
+        )
+        """,
+    ]),
+    (8, "historial persistente de las salas de chat", [
+        """
+        CREATE TABLE IF NOT EXISTS mensajes_sala(
+            id INTEGER PRIMARY KEY,
+            sala TEXT NOT NULL,
+            username TEXT NOT NULL,
+            mensaje TEXT NOT NULL,
+            fecha TIMESTAMP NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_mensajes_sala ON mensajes_sala(sala, fecha, id)",
+    ]),
+    (9, "varias sesiones privadas por usuario y entregas pendientes", [
+        # La presencia es efímera: se recrea vacía con el sid como clave
+        "DROP TABLE IF EXISTS presencia_privada",
+        """
+        CREATE TABLE presencia_privada(
+            sid TEXT PRIMARY KEY,
+            usuario_id INTEGER NOT NULL,
+            trabajador TEXT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_presencia_privada_usuario ON presencia_privada(usuario_id)",
+        # Los mensajes viejos ya se vieron por el historial: cuentan como entregados
+        "ALTER TABLE mensajes_privados ADD COLUMN entregado INTEGER NOT NULL DEFAULT 1",
+        # Índice parcial: la cola de pendientes sólo ocupa lo que falta entregar
+        """
+        CREATE INDEX IF NOT EXISTS idx_mp_pendientes
+        ON mensajes_privados(destinatario_id, id) WHERE entregado = 0
+        """,
+    ]),
+    (10, "registro de cambios para /api/sync", [
+        """
+        CREATE TABLE IF NOT EXISTS cambios(
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            tabla TEXT NOT NULL,
+            fila_id INTEGER NOT NULL,
+            operacion TEXT NOT NULL,  -- alta, cambio o baja
+            usuario_id INTEGER,       -- NULL = visible para todos
+            fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        *cambios.TRIGGERS,
+    ]),
+    (11, "archivo de mensajes viejos en bases por año", [
+        """
+        CREATE TABLE IF NOT EXISTS archivos(
+            particion TEXT PRIMARY KEY,  -- año de la fecha de los mensajes
+            archivo TEXT NOT NULL,       -- nombre del archivo dentro de la carpeta del archivo
+            desde TIMESTAMP NOT NULL,
+            hasta TIMESTAMP NOT NULL,
+            filas INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        # Marca, dentro de la transacción del archivado, que el DELETE no es una baja
+        "CREATE TABLE IF NOT EXISTS archivando(id INTEGER PRIMARY KEY)",
+        "CREATE INDEX IF NOT EXISTS idx_mp_fecha ON mensajes_privados(fecha)",
+        "DROP TRIGGER IF EXISTS trg_cambios_mensajes_privados_baja",
+        cambios.TRIGGER_BAJA_MENSAJES,
+    ]),
+    (12, "último cambio público para los caches de cada worker", [
+        # Parcial: sólo proyectos y comentarios, no el volumen de los privados
+        "CREATE INDEX IF NOT EXISTS idx_cambios_publicos ON cambios(seq) WHERE usuario_id IS NULL",
+    ]),
+    (13, "rango de cada conversación en las particiones del archivo", [
+        """
+        CREATE TABLE IF NOT EXISTS archivo_conversaciones(
+            usuario_a INTEGER NOT NULL,  -- el menor de los dos ids
+            usuario_b INTEGER NOT NULL,
+            particion TEXT NOT NULL,
+            desde TIMESTAMP NOT NULL,
+            hasta TIMESTAMP NOT NULL,
+            PRIMARY KEY (usuario_a, usuario_b, particion)
+        ) WITHOUT ROWID
+        """,
+        # 1 = archivo_conversaciones tiene todas sus conversaciones (ver archivo.indexar)
+        "ALTER TABLE archivos ADD COLUMN indexada INTEGER NOT NULL DEFAULT 0",
+    ]),
+]
+
+
+def version_actual(conexion):
+    return conexion.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrar(conexion):
+    """Aplica en orden las migraciones pendientes, cada una en su transacción"""
+    aplicadas = []
+    if version_actual(conexion) == 0:
+        # Sólo tiene efecto en una base vacía; las existentes: python db.py activar-vacuum
+        conexion.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    for version, descripcion, sentencias in MIGRACIONES:
+        if version <= version_actual(conexion):
+            continue
+        try:
+            # IMMEDIATE toma el lock de escritura: si varios workers arrancan a
+            # la vez, sólo uno aplica la migración y los demás la ven aplicada
+            conexion.execute("BEGIN IMMEDIATE")
+            if version <= version_actual(conexion):
+                conexion.rollback()
+                continue
+            for sentencia in sentencias:
+                if callable(sentencia):
+                    sentencia(conexion)
+                else:
+                    conexion.execute(sentencia)
+            conexion.execute(f"PRAGMA user_version = {version}")
+            conexion.commit()
+        except Exception:
+            conexion.rollback()
+            raise
+        aplicadas.append((version, descripcion))
+    return aplicadas
+
+
+def crear_tablas(ruta=DB_PATH):
+    conexion = sqlite3.connect(ruta)
+    for version, descripcion in migrar(conexion):
+        print(f"Migración {version} aplicada: {descripcion}")
+    print(f"Base de datos en versión {version_actual(conexion)}")
     conexion.close()
-    print("Base de datos creada exitosamente")
+
+
+# Consultas calientes (las mismas constantes que ejecutan app.py y los módulos)
+# que deben resolverse con índices. Formato: nombre -> (sql, params, recorridos
+# permitidos). Recorrer una subconsulta ya acotada no cuenta como SCAN de tabla.
+RECORRIDOS_SIEMPRE_PERMITIDOS = ("SCAN CONSTANT ROW", "SCAN (subquery-")
+CONSULTAS_CRITICAS = {
+    "pagina_mensajes": (
+        consultas.SQL_PAGINA_MENSAJES.format(op="<", orden="DESC", tabla="mensajes_privados"),
+        (1, 2, "9999", 0, 50, 2, 1, "9999", 0, 50, 50), ("SCAN mp",)),
+    "hay_mas_mensajes": (
+        consultas.SQL_HAY_MAS_MENSAJES.format(op="<", tabla="mensajes_privados"),
+        (1, 2, "9999", 0, 2, 1, "9999", 0), ()),
+    "historial_sala": (salas.SQL_PAGINA_SALA, ("general", "9999", 0, 50), ()),
+    "bandeja_entrada": (conversaciones.SQL_BANDEJA, (1,), ()),
+    "miembros_sala": (presencia.SQL_MIEMBROS_SALA, ("general", "abc"), ()),
+    "cambios_desde": (cambios.SQL_CAMBIOS_DESDE, (0, 100, 1, 501), ()),
+    "version_publica": (cambios.SQL_VERSION_PUBLICA, (), ()),
+    "sesiones_privadas": (presencia.SQL_SESIONES_PRIVADAS, (1,), ()),
+    "marcar_leidos": (consultas.SQL_MARCAR_LEIDOS, (1, 2), ()),
+    "entregas_pendientes": (consultas.SQL_ENTREGAS_PENDIENTES, (1, 500), ()),
+    "feed_proyectos": (consultas.SQL_FEED_PROYECTOS,
+                       ("9999", 0, "backend", "backend", None, None, 21),
+                       ("SCAN p USING INDEX idx_proyectos_fecha",)),
+    "candidatos_archivo": (archivo.SQL_CANDIDATOS, ("2025-01-01", "", 0, 500), ()),
+    # archivos tiene una fila por año: recorrerla es lo esperado
+    "particiones_conversacion": (archivo.SQL_PARTICIONES_ANTES, (1, 2, "9999", "9999"),
+                                 ("SCAN a",)),
+    "votar": (votos.SQL_VOTAR, (1, 1, "like"), ()),
+    "comentarios_proyecto": (consultas.SQL_COMENTARIOS_PROYECTO, (1,), ()),
+}
+
+
+def verificar_planes(conexion=None):
+    """Devuelve los pasos SCAN no permitidos de cada consulta crítica.
+
+    Sin conexión se usa una base en memoria recién migrada, así el resultado
+    depende sólo del esquema y no de las estadísticas de una base concreta.
+    """
+    propia = conexion is None
+    if propia:
+        conexion = sqlite3.connect(":memory:")
+        migrar(conexion)
+
+    problemas = []
+    for nombre, (sql, params, permitidos) in CONSULTAS_CRITICAS.items():
+        for fila in conexion.execute("EXPLAIN QUERY PLAN " + sql, params):
+            detalle = fila[3]
+            if detalle.startswith("SCAN") and not detalle.startswith(
+                    permitidos + RECORRIDOS_SIEMPRE_PERMITIDOS):
+                problemas.append((nombre, detalle))
+
+    if propia:
+        conexion.close()
+    return problemas
+
 
 if __name__ == "__main__":
-    crear_tablas()
\ No newline at end of file
+    comando = sys.argv[1] if len(sys.argv) > 1 else "migrar"
+    if comando == "migrar":
+        crear_tablas()
+    elif comando == "verificar-planes":
+        problemas = verificar_planes()
+        for nombre, detalle in problemas:
+            print(f"[{nombre}] {detalle}")
+        print("OK" if not problemas else f"{len(problemas)} consultas sin índice")
+        sys.exit(1 if problemas else 0)
+    elif comando == "backfill-conversaciones":
+        conexion = sqlite3.connect(DB_PATH)
+        with conexion:
+            filas = conversaciones.backfill(conexion)
+        conexion.close()
+        print(f"{filas} filas de conversaciones regeneradas")
+    elif comando == "verificar-conversaciones":
+        conexion = sqlite3.connect(DB_PATH)
+        diferencias = conversaciones.verificar(conexion)
+        conexion.close()
+        for usuario_id, contacto_id in diferencias:
+            print(f"Inconsistente: usuario {usuario_id} / contacto {contacto_id}")
+        print("OK" if not diferencias else f"{len(diferencias)} filas inconsistentes, correr backfill-conversaciones")
+        sys.exit(1 if diferencias else 0)
+    elif comando == "compactar-cambios":
+        conexion = sqlite3.connect(DB_PATH)
+        with conexion:
+            borrados = cambios.compactar(
+                conexion, max_filas=int(os.environ.get("TECHPAINT_CAMBIOS_MAX", "100000")),
+                horas=float(os.environ.get("TECHPAINT_CAMBIOS_HORAS", "72")))
+        conexion.close()
+        print(f"{borrados} filas del registro de cambios borradas")
+    elif comando == "archivar":
+        conexion = sqlite3.connect(DB_PATH)
+        conexion.row_factory = sqlite3.Row
+        archivador = archivo.ArchivoMensajes(
+            archivo.carpeta_por_defecto(DB_PATH),
+            dias=float(os.environ.get("TECHPAINT_ARCHIVO_DIAS", "180")))
+        movidos = archivador.archivar(conexion)
+        liberadas = archivador.vacuum(conexion)
+        conexion.close()
+        print(f"{movidos} mensajes archivados en {archivador.carpeta}, {liberadas} páginas liberadas")
+    elif comando == "activar-vacuum":
+        # Cambiar auto_vacuum en una base con datos requiere un VACUUM completo (offline)
+        conexion = sqlite3.connect(DB_PATH)
+        conexion.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conexion.execute("VACUUM")
+        modo = conexion.execute("PRAGMA auto_vacuum").fetchone()[0]
+        conexion.close()
+        print("auto_vacuum incremental activo" if modo == 2 else f"auto_vacuum = {modo}")
+    elif comando == "reconciliar-votos":
+        conexion = sqlite3.connect(DB_PATH)
+        with conexion:
+            corregidos = votos.reconciliar(conexion)
+        conexion.close()
+        print(f"{corregidos} proyectos con contadores corregidos")
+    else:
+        print("Uso: python db.py [migrar | verificar-planes | backfill-conversaciones | "
+              "verificar-conversaciones | compactar-cambios | archivar | activar-vacuum | "
+              "reconciliar-votos]")
+        sys.exit(2)
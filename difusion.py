@@ -0,0 +1,160 @@
+"""Difusión de mensajes de sala en lotes.
+
+En salas grandes con ráfagas de mensajes, el costo por frame (cabeceras de
+Engine.IO/WebSocket, una escritura al socket por miembro) pesa más que el
+contenido. Con `ventana_ms > 0` los mensajes que llegan a una sala dentro de
+esa ventana salen juntos en un solo evento `new_messages`; con 0 se emite
+`new_message` por cada uno, como siempre.
+
+Las novedades del feed de proyectos (DifusionProyectos) van por el mismo
+camino: un frame de contadores por ventana en lugar de uno por voto.
+"""
+import threading
+
+
+class DifusionSalas:
+
+    def __init__(self, socketio, ventana_ms=0, max_lote=100):
+        self.socketio = socketio
+        self.ventana = ventana_ms / 1000
+        self.max_lote = max_lote
+        self._lotes = {}   # sala -> mensajes esperando la ventana
+        self._lock = threading.Lock()
+        self._metricas = {"mensajes": 0, "frames": 0, "lote_max": 0}
+
+    def emitir(self, sala, mensaje):
+        if self.ventana <= 0:
+            self._contar(1)
+            self.socketio.emit('new_message', mensaje, to=sala)
+            return
+        with self._lock:
+            lote = self._lotes.get(sala)
+            nuevo = lote is None
+            if nuevo:
+                lote = self._lotes[sala] = []
+            lote.append(mensaje)
+            lleno = len(lote) >= self.max_lote
+        if lleno:
+            self._vaciar(sala)
+        elif nuevo:
+            self.socketio.start_background_task(self._vaciar_luego, sala)
+
+    def _vaciar_luego(self, sala):
+        self.socketio.sleep(self.ventana)
+        self._vaciar(sala)
+
+    def _vaciar(self, sala):
+        with self._lock:
+            lote = self._lotes.pop(sala, None)
+        if lote:
+            self._contar(len(lote))
+            self.socketio.emit('new_messages', {'mensajes': lote}, to=sala)
+
+    def _contar(self, mensajes):
+        with self._lock:
+            self._metricas["mensajes"] += mensajes
+            self._metricas["frames"] += 1
+            self._metricas["lote_max"] = max(self._metricas["lote_max"], mensajes)
+
+    def metricas(self):
+        with self._lock:
+            datos = dict(self._metricas)
+            datos["salas_esperando"] = len(self._lotes)
+        datos["ventana_ms"] = self.ventana * 1000
+        return datos
+
+
+NAMESPACE_PROYECTOS = '/proyectos'
+
+# Columnas del feed que necesita una tarjeta (sin las que el cliente no usa)
+CAMPOS_PROYECTO = ('id', 'usuario_id', 'usuario_nombre', 'usuario_area', 'titulo', 'descripcion',
+                   'github_url', 'tecnologias', 'fecha_publicacion', 'likes', 'dislikes')
+
+
+class DifusionProyectos:
+    """Novedades del feed de proyectos en el namespace /proyectos.
+
+    project_created y comment_added salen al momento. Los contadores de votos
+    de un mismo proyecto se acumulan `ventana_ms` y sale sólo el último, todos
+    los proyectos votados en un único vote_counts: {"votos": [[id, likes, dislikes]]}.
+    Con varios workers cada uno junta los votos que recibió.
+    """
+
+    def __init__(self, socketio, ventana_ms=250):
+        self.socketio = socketio
+        self.ventana = ventana_ms / 1000
+        self._votos = {}   # proyecto_id -> (likes, dislikes)
+        self._lock = threading.Lock()
+        self._metricas = {"proyectos": 0, "comentarios": 0, "votos": 0, "frames_votos": 0}
+
+    def proyecto_creado(self, proyecto):
+        with self._lock:
+            self._metricas["proyectos"] += 1
+        self.socketio.emit('project_created', {c: proyecto.get(c) for c in CAMPOS_PROYECTO},
+                           namespace=NAMESPACE_PROYECTOS)
+
+    def comentario_agregado(self, comentario):
+        with self._lock:
+            self._metricas["comentarios"] += 1
+        self.socketio.emit('comment_added', comentario, namespace=NAMESPACE_PROYECTOS)
+
+    def votos(self, proyecto_id, likes, dislikes):
+        with self._lock:
+            self._metricas["votos"] += 1
+            primero = not self._votos
+            self._votos[proyecto_id] = (likes, dislikes)
+        if primero:
+            self.socketio.start_background_task(self._vaciar_luego)
+
+    def _vaciar_luego(self):
+        self.socketio.sleep(self.ventana)
+        with self._lock:
+            votos, self._votos = self._votos, {}
+            if votos:
+                self._metricas["frames_votos"] += 1
+        if votos:
+            self.socketio.emit('vote_counts',
+                               {'votos': [[pid, l, d] for pid, (l, d) in votos.items()]},
+                               namespace=NAMESPACE_PROYECTOS)
+
+    def metricas(self):
+        with self._lock:
+            datos = dict(self._metricas)
+            datos["votos_esperando"] = len(self._votos)
+        datos["votos_ahorrados"] = max(datos["votos"] - datos["frames_votos"], 0)
+        datos["ventana_ms"] = self.ventana * 1000
+        return datos
+
+
+def instalar_umbral_deflate(umbral):
+    """permessage-deflate sólo para frames de al menos `umbral` bytes.
+
+    El servidor WebSocket de eventlet negocia permessage-deflate con los
+    navegadores y comprime todos los frames; para eventos chicos (typing,
+    presencia) eso cuesta CPU sin ahorrar bytes. RFC 7692 permite mandar
+    frames sin comprimir en la misma conexión, así que los chicos se mandan
+    tal cual. Sólo aplica con async_mode eventlet.
+    """
+    from eventlet import websocket
+
+    base = websocket.RFC6455WebSocket
+    if getattr(base, "umbral_deflate", None) is not None:
+        base.umbral_deflate = umbral
+        return
+
+    class WebSocketUmbral(base):
+        umbral_deflate = umbral
+
+        def _pack_message(self, message, *args, **kwargs):
+            if message is not None and len(message) < self.umbral_deflate:
+                # Sin la extensión, _pack_message no comprime este frame; no
+                # cede el hub, así que ninguna lectura ve el cambio
+                extensiones = self.extensions
+                self.extensions = {}
+                try:
+                    return super()._pack_message(message, *args, **kwargs)
+                finally:
+                    self.extensions = extensiones
+            return super()._pack_message(message, *args, **kwargs)
+
+    websocket.RFC6455WebSocket = WebSocketUmbral
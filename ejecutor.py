@@ -0,0 +1,308 @@
+"""SQLite fuera del event loop: hilos lectores y un único escritor.
+
+Cada llamada a sqlite3 es C bloqueante; con eventlet sin monkey patching
+una consulta larga (una bandeja grande, un COMMIT esperando el fsync) frena
+todos los sockets del worker mientras corre. Las conexiones del pool vienen
+envueltas en ConexionEjecutor: cada execute/fetch/commit corre en un hilo
+del sistema y la green thread sólo espera el resultado.
+
+- Lecturas: hasta `lectores` a la vez, en tpool con eventlet o en un
+  ThreadPoolExecutor propio si no.
+- Escrituras: siempre en un único hilo escritor, también con eventlet. Una
+  transacción por vez: la conexión que empieza a escribir toma el turno de
+  escritor y lo suelta al commit/rollback, así dos transacciones del mismo
+  worker nunca se esperan dentro de SQLite.
+- Cola acotada: más de `max_cola` esperando, o más de `espera` segundos por
+  un turno, es EjecutorOcupado. Una sentencia que pasa `timeout` se corta
+  con el progress handler de SQLite (OperationalError: interrupted).
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pool import crear_semaforo
+
+
+# Sentencias que no escriben la base; el resto (DML, BEGIN, DDL, PRAGMA) toma el
+# turno de escritor. ATTACH/DETACH sólo cambian la conexión (ver archivo.py)
+PREFIJOS_LECTURA = ("SELECT", "VALUES", "EXPLAIN", "ATTACH", "DETACH")
+# Filas por viaje al hilo cuando se itera un cursor
+FILAS_POR_VIAJE = 256
+# Instrucciones de la VM de SQLite entre chequeos del timeout
+PASOS_PROGRESO = 10000
+
+
+class EjecutorOcupado(Exception):
+    """Demasiadas consultas esperando o sin turno dentro de la espera"""
+
+
+def es_lectura(sql):
+    return sql.lstrip()[:8].upper().startswith(PREFIJOS_LECTURA)
+
+
+def en_hilo(hilos, funcion, args, esperar=None):
+    """Corre `funcion` en el ThreadPoolExecutor y espera su resultado.
+
+    Al salir el intérprete los executors ya no aceptan trabajo antes de que
+    corran los atexit (el vaciado de las colas de escritura): ahí se corre
+    en el hilo que llama, que a esa altura es el único.
+    """
+    try:
+        futuro = hilos.submit(funcion, *args)
+    except RuntimeError:
+        return funcion(*args)
+    return esperar(futuro.result) if esperar else futuro.result()
+
+
+class EjecutorDB:
+
+    def __init__(self, lectores=4, max_cola=256, espera=5.0, timeout=10.0, modo="threading"):
+        self.lectores = lectores
+        self.max_cola = max_cola
+        self.espera = espera
+        self.timeout = timeout
+        if lectores <= 0:
+            # En el mismo hilo, como antes: sólo para comparar en el benchmark
+            self._leer = self._escribir = lambda funcion, *args: funcion(*args)
+        elif modo == "eventlet":
+            from eventlet import tpool
+            self._escritor = ThreadPoolExecutor(1, thread_name_prefix="db-escritor")
+            self._leer = tpool.execute
+            # La escritura corre en su hilo propio; la espera del resultado va a
+            # tpool para que la green thread no bloquee el hub
+            self._escribir = lambda funcion, *args: en_hilo(
+                self._escritor, funcion, args, esperar=tpool.execute)
+        else:
+            self._lectores = ThreadPoolExecutor(lectores, thread_name_prefix="db-lector")
+            self._escritor = ThreadPoolExecutor(1, thread_name_prefix="db-escritor")
+            self._leer = lambda funcion, *args: en_hilo(self._lectores, funcion, args)
+            self._escribir = lambda funcion, *args: en_hilo(self._escritor, funcion, args)
+        self._turnos_lectura = crear_semaforo(max(lectores, 1), modo)
+        self._turno_escritura = crear_semaforo(1, modo)
+        self._lock = threading.Lock()
+        self._esperando = 0
+        self._metricas = {
+            "lecturas": 0,
+            "escrituras": 0,         # llamadas con el turno de escritor
+            "transacciones": 0,      # turnos de escritor tomados
+            "rechazados": 0,         # cola llena o sin turno a tiempo
+            "interrumpidas": 0,      # cortadas por timeout
+            "segundos_lectura": 0.0,
+            "segundos_escritura": 0.0,
+            "segundos_esperando_escritor": 0.0,
+        }
+
+    def _tomar(self, semaforo):
+        with self._lock:
+            if self._esperando >= self.max_cola:
+                self._metricas["rechazados"] += 1
+                raise EjecutorOcupado("Demasiadas consultas en espera")
+            self._esperando += 1
+        try:
+            adquirido = semaforo.acquire(timeout=self.espera)
+        finally:
+            with self._lock:
+                self._esperando -= 1
+        if not adquirido:
+            with self._lock:
+                self._metricas["rechazados"] += 1
+            raise EjecutorOcupado(f"Sin turno para la base tras {self.espera}s")
+
+    def _con_limite(self, conn, funcion, args):
+        """Corre en el hilo: corta la sentencia si pasa el timeout"""
+        if conn is None or not self.timeout:
+            return funcion(*args)
+        limite = time.monotonic() + self.timeout
+        conn.set_progress_handler(lambda: time.monotonic() > limite, PASOS_PROGRESO)
+        try:
+            return funcion(*args)
+        except Exception as e:
+            if "interrupted" in str(e):
+                with self._lock:
+                    self._metricas["interrumpidas"] += 1
+            raise
+        finally:
+            conn.set_progress_handler(None, 0)
+
+    def leer(self, conn, funcion, *args):
+        self._tomar(self._turnos_lectura)
+        inicio = time.perf_counter()
+        try:
+            return self._leer(self._con_limite, conn, funcion, args)
+        finally:
+            self._turnos_lectura.release()
+            with self._lock:
+                self._metricas["lecturas"] += 1
+                self._metricas["segundos_lectura"] += time.perf_counter() - inicio
+
+    def tomar_escritura(self):
+        inicio = time.perf_counter()
+        self._tomar(self._turno_escritura)
+        with self._lock:
+            self._metricas["transacciones"] += 1
+            self._metricas["segundos_esperando_escritor"] += time.perf_counter() - inicio
+
+    def soltar_escritura(self):
+        self._turno_escritura.release()
+
+    def escribir(self, conn, funcion, *args):
+        """Requiere el turno de escritor (ver ConexionEjecutor)"""
+        inicio = time.perf_counter()
+        try:
+            return self._escribir(self._con_limite, conn, funcion, args)
+        finally:
+            with self._lock:
+                self._metricas["escrituras"] += 1
+                self._metricas["segundos_escritura"] += time.perf_counter() - inicio
+
+    def envolver(self, conn):
+        return ConexionEjecutor(conn, self)
+
+    def metricas(self):
+        with self._lock:
+            datos = dict(self._metricas)
+            datos["esperando"] = self._esperando
+        for clave in ("segundos_lectura", "segundos_escritura", "segundos_esperando_escritor"):
+            datos[clave] = round(datos[clave], 3)
+        datos["lectores"] = self.lectores
+        return datos
+
+
+class CursorEjecutor:
+    """Cursor cuyas llamadas a SQLite pasan por la conexión envolvente.
+
+    Un SELECT trae su primer lote de filas en el mismo viaje al hilo: la
+    mayoría de las consultas caben en él y el fetch ya no vuelve a salir.
+    """
+
+    def __init__(self, conexion, cursor):
+        self._conexion = conexion
+        self._cursor = cursor
+        self._lote = []
+        self._agotado = False
+
+    def _ejecutar_y_leer(self, sql, parametros):
+        self._cursor.execute(sql, parametros)
+        if self._cursor.description is None:
+            return [], True
+        filas = self._cursor.fetchmany(FILAS_POR_VIAJE)
+        return filas, len(filas) < FILAS_POR_VIAJE
+
+    def execute(self, sql, parametros=()):
+        self._lote, self._agotado = [], False
+        if not self._conexion.escribiendo and es_lectura(sql):
+            self._lote, self._agotado = self._conexion._correr(
+                sql, self._ejecutar_y_leer, sql, parametros)
+        else:
+            self._conexion._correr(sql, self._cursor.execute, sql, parametros)
+        return self
+
+    def executemany(self, sql, filas):
+        self._lote, self._agotado = [], False
+        self._conexion._correr(sql, self._cursor.executemany, sql, filas)
+        return self
+
+    def _sacar(self, cantidad):
+        filas, self._lote = self._lote[:cantidad], self._lote[cantidad:]
+        return filas
+
+    def fetchone(self):
+        if self._lote:
+            return self._sacar(1)[0]
+        if self._agotado:
+            return None
+        return self._conexion._correr(None, self._cursor.fetchone)
+
+    def fetchmany(self, cantidad=None):
+        cantidad = cantidad or self._cursor.arraysize
+        filas = self._sacar(cantidad)
+        if len(filas) < cantidad and not self._agotado:
+            filas += self._conexion._correr(None, self._cursor.fetchmany, cantidad - len(filas))
+        return filas
+
+    def fetchall(self):
+        filas = self._sacar(len(self._lote))
+        if not self._agotado:
+            filas += self._conexion._correr(None, self._cursor.fetchall)
+            self._agotado = True
+        return filas
+
+    def __iter__(self):
+        # De a lotes: un viaje al hilo por fila costaría más que la fila
+        while True:
+            filas = self.fetchmany(FILAS_POR_VIAJE)
+            if not filas:
+                return
+            yield from filas
+
+    def close(self):
+        self._cursor.close()
+
+    def __getattr__(self, nombre):
+        # lastrowid, rowcount, description, arraysize
+        return getattr(self._cursor, nombre)
+
+
+class ConexionEjecutor:
+    """Conexión del pool con sus llamadas derivadas al EjecutorDB"""
+
+    def __init__(self, conn, ejecutor):
+        self.conn = conn
+        self.ejecutor = ejecutor
+        self.escribiendo = False
+
+    def _correr(self, sql, funcion, *args):
+        # sql None = fetch: sigue en el modo de la sentencia que lo abrió
+        if not self.escribiendo and (sql is None or es_lectura(sql)):
+            return self.ejecutor.leer(self.conn, funcion, *args)
+        if not self.escribiendo:
+            self.ejecutor.tomar_escritura()
+            self.escribiendo = True
+        try:
+            return self.ejecutor.escribir(self.conn, funcion, *args)
+        finally:
+            # DDL y sentencias fallidas fuera de una transacción no dejan nada abierto
+            if not self.conn.in_transaction:
+                self.soltar()
+
+    def soltar(self):
+        if self.escribiendo:
+            self.escribiendo = False
+            self.ejecutor.soltar_escritura()
+
+    def cursor(self):
+        return CursorEjecutor(self, self.conn.cursor())
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, filas):
+        return self.cursor().executemany(sql, filas)
+
+    def executescript(self, sql):
+        # Corre cada sentencia hasta el final (p. ej. PRAGMA incremental_vacuum)
+        self._correr(sql, self.conn.executescript, sql)
+        return self
+
+    def commit(self):
+        if not self.escribiendo:
+            self.conn.commit()   # sin transacción abierta no hace nada
+            return
+        try:
+            self.ejecutor.escribir(self.conn, self.conn.commit)
+        finally:
+            if not self.conn.in_transaction:
+                self.soltar()
+
+    def rollback(self):
+        if not self.escribiendo:
+            self.conn.rollback()
+            return
+        try:
+            self.ejecutor.escribir(self.conn, self.conn.rollback)
+        finally:
+            self.soltar()
+
+    def __getattr__(self, nombre):
+        # in_transaction, row_factory, total_changes, close...
+        return getattr(self.conn, nombre)
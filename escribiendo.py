@@ -0,0 +1,87 @@
+"""Indicadores de "está escribiendo" agrupados por canal.
+
+En vez de reenviar cada evento typing de cada cliente, se guarda quién está
+escribiendo en cada canal (una sala o la bandeja de un usuario) y cada
+`intervalo` se emite un único evento con la lista de los canales que
+cambiaron. Un usuario que sigue escribiendo sólo renueva su vencimiento; si
+deja de mandar eventos sale de la lista al cumplirse el TTL.
+"""
+import logging
+import threading
+import time
+import uuid
+
+log = logging.getLogger("techpaint.escribiendo")
+
+class AgregadorEscritura:
+    """`emitir(canal, usuarios, origen)` se llama una vez por canal modificado"""
+
+    def __init__(self, emitir, ttl=5.0, intervalo=0.5, reloj=time.monotonic):
+        self.emitir = emitir
+        self.ttl = ttl
+        self.intervalo = intervalo
+        self.reloj = reloj
+        # Con varios workers cada uno emite sólo sus usuarios; el cliente une por origen
+        self.origen = uuid.uuid4().hex[:8]
+        self._canales = {}       # canal -> {usuario: vence}
+        self._modificados = set()
+        self._lock = threading.Lock()
+        self._metricas = {
+            "eventos": 0,        # typing recibidos de los clientes
+            "emits": 0,          # room_typing / private_typing enviados
+            "expirados": 0,      # usuarios quitados por TTL
+        }
+
+    def iniciar(self, socketio):
+        socketio.start_background_task(self._bucle, socketio)
+
+    def _bucle(self, socketio):
+        while True:
+            socketio.sleep(self.intervalo)
+            try:
+                self.publicar()
+            except Exception:
+                log.exception("Error publicando indicadores de escritura")
+
+    def marcar(self, canal, usuario, escribiendo=True):
+        """Registra un evento typing; sólo los cambios de estado se publican"""
+        with self._lock:
+            self._metricas["eventos"] += 1
+            usuarios = self._canales.get(canal)
+            if escribiendo:
+                if usuarios is None:
+                    usuarios = self._canales[canal] = {}
+                if usuario not in usuarios:
+                    self._modificados.add(canal)
+                usuarios[usuario] = self.reloj() + self.ttl
+            elif usuarios is not None and usuarios.pop(usuario, None) is not None:
+                self._modificados.add(canal)
+                if not usuarios:
+                    del self._canales[canal]
+
+    def publicar(self):
+        """Vence a los que dejaron de escribir y emite los canales que cambiaron"""
+        ahora = self.reloj()
+        with self._lock:
+            for canal, usuarios in list(self._canales.items()):
+                vencidos = [u for u, vence in usuarios.items() if vence <= ahora]
+                for usuario in vencidos:
+                    del usuarios[usuario]
+                if vencidos:
+                    self._metricas["expirados"] += len(vencidos)
+                    self._modificados.add(canal)
+                    if not usuarios:
+                        del self._canales[canal]
+            cambios = [(canal, list(self._canales.get(canal, ()))) for canal in self._modificados]
+            self._modificados.clear()
+            self._metricas["emits"] += len(cambios)
+        for canal, usuarios in cambios:
+            self.emitir(canal, usuarios, self.origen)
+
+    def metricas(self):
+        with self._lock:
+            datos = dict(self._metricas)
+            datos["canales_activos"] = len(self._canales)
+            datos["escribiendo"] = sum(len(u) for u in self._canales.values())
+        datos["emits_ahorrados"] = max(datos["eventos"] - datos["emits"], 0)
+        return datos
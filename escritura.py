@@ -0,0 +1,230 @@
+"""Persistencia diferida (write-behind) de mensajes privados.
+
+El handler de Socket.IO asigna id y fecha, entrega el mensaje enseguida y lo
+encola; un worker en segundo plano lo guarda en lotes (una transacción y un
+fsync por lote) y avisa al remitente cuando el mensaje ya es durable.
+"""
+import atexit
+import logging
+import queue
+import signal
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import conversaciones
+from pool import crear_semaforo
+
+log = logging.getLogger("techpaint.escritura")
+
+class ColaLlena(Exception):
+    """La cola de escritura no se vació dentro del timeout (backpressure)"""
+
+
+class Secuencia:
+    """Ids reservados por bloques en la tabla secuencias.
+
+    Cada worker pide un bloque con una sola escritura y después asigna ids en
+    memoria. Tomar MAX(id) de la tabla cubre filas insertadas por otras vías.
+    """
+
+    def __init__(self, pool, tabla, bloque=1000, modo="threading"):
+        self.pool = pool
+        self.tabla = tabla
+        self.bloque = bloque
+        self._lock = crear_semaforo(1, modo)
+        self._proximo = 1
+        self._limite = 0
+
+    def siguiente(self):
+        with self._lock:
+            if self._proximo > self._limite:
+                self._reservar()
+            valor = self._proximo
+            self._proximo += 1
+            return valor
+
+    def _reservar(self):
+        with self.pool.conexion() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            ultimo = conn.execute(f"""
+                INSERT INTO secuencias (nombre, ultimo)
+                VALUES (:nombre, (SELECT COALESCE(MAX(id), 0) FROM {self.tabla}) + :bloque)
+                ON CONFLICT(nombre) DO UPDATE SET
+                    ultimo = MAX(ultimo, (SELECT COALESCE(MAX(id), 0) FROM {self.tabla})) + :bloque
+                RETURNING ultimo
+            """, {"nombre": self.tabla, "bloque": self.bloque}).fetchone()[0]
+            conn.commit()
+        self._proximo = ultimo - self.bloque + 1
+        self._limite = ultimo
+
+
+def fecha_actual():
+    """Mismo formato que CURRENT_TIMESTAMP de SQLite (UTC)"""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+_FIN = object()
+
+
+class EscrituraDiferida:
+    """Cola acotada de mensajes privados pendientes de guardar.
+
+    `al_guardar(sid, datos)` se llama por cada mensaje ya commiteado (o que
+    falló definitivamente) para avisarle al remitente.
+    """
+
+    SQL_INSERT = """
+        INSERT INTO mensajes_privados (id, remitente_id, destinatario_id, mensaje, fecha, entregado)
+        VALUES (?, ?, ?, ?, ?, 0)
+    """
+
+    def __init__(self, pool, al_guardar=None, maximo=10000, lote=500, timeout=1.0):
+        self.pool = pool
+        self.al_guardar = al_guardar
+        self.maximo = maximo
+        self.lote = lote
+        self.timeout = timeout
+        self.secuencia = None
+        self._cola = None
+        self._socketio = None
+        self._cerrando = False
+        self._terminado = False
+        self._metricas = {
+            "encolados": 0,
+            "guardados": 0,
+            "fallidos": 0,
+            "rechazados": 0,    # cola llena tras el timeout
+            "lotes": 0,
+            "lote_max": 0,
+            "segundos_escribiendo": 0.0,
+        }
+
+    def iniciar(self, socketio):
+        self._socketio = socketio
+        self._cola = socketio.server.eio.create_queue(self.maximo)
+        self.secuencia = Secuencia(self.pool, "mensajes_privados", modo=socketio.async_mode)
+        socketio.start_background_task(self._bucle)
+        atexit.register(self.cerrar)
+        # SIGTERM (p. ej. trabajadores.py al apagar) pasa por atexit y vacía la cola
+        if (threading.current_thread() is threading.main_thread()
+                and signal.getsignal(signal.SIGTERM) is signal.SIG_DFL):
+            signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    def encolar(self, remitente_id, destinatario_id, mensaje, sid=None, client_id=None):
+        """Asigna id y fecha y deja el mensaje en la cola; devuelve sus datos.
+
+        Si la cola está llena espera hasta `timeout` a que el worker la vacíe
+        y si no, lanza ColaLlena.
+        """
+        if self._cerrando:
+            raise ColaLlena("El servidor se está apagando")
+        datos = {
+            "id": self.secuencia.siguiente(),
+            "remitente_id": remitente_id,
+            "destinatario_id": destinatario_id,
+            "mensaje": mensaje,
+            "fecha": fecha_actual(),
+            "leido": 0,
+        }
+        try:
+            self._cola.put((datos, sid, client_id), timeout=self.timeout)
+        except queue.Full:
+            self._metricas["rechazados"] += 1
+            raise ColaLlena("Cola de escritura llena")
+        self._metricas["encolados"] += 1
+        return datos
+
+    def _bucle(self):
+        while True:
+            item = self._cola.get()
+            if item is _FIN:
+                break
+            pendientes = [item]
+            fin = False
+            # Group commit: todo lo que se acumuló mientras se escribía el lote anterior
+            while len(pendientes) < self.lote:
+                try:
+                    item = self._cola.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _FIN:
+                    fin = True
+                    break
+                pendientes.append(item)
+            try:
+                self._guardar(pendientes)
+            except Exception:
+                log.exception("Error guardando lote de mensajes")
+            if fin:
+                break
+        self._terminado = True
+
+    def _guardar(self, pendientes):
+        inicio = time.perf_counter()
+        with self.pool.conexion() as conn:
+            try:
+                self._insertar(conn, [datos for datos, _, _ in pendientes])
+                conn.commit()
+                resultados = [(item, None) for item in pendientes]
+            except sqlite3.Error:
+                conn.rollback()
+                # Aislar el mensaje problemático (p. ej. un destinatario inexistente)
+                resultados = []
+                for item in pendientes:
+                    try:
+                        self._insertar(conn, [item[0]])
+                        conn.commit()
+                        resultados.append((item, None))
+                    except sqlite3.Error as e:
+                        conn.rollback()
+                        resultados.append((item, str(e)))
+
+        self._metricas["lotes"] += 1
+        self._metricas["lote_max"] = max(self._metricas["lote_max"], len(pendientes))
+        self._metricas["segundos_escribiendo"] += time.perf_counter() - inicio
+        for (datos, sid, client_id), error in resultados:
+            self._metricas["fallidos" if error else "guardados"] += 1
+            if self.al_guardar and sid:
+                aviso = {"id": datos["id"], "client_id": client_id, "success": error is None}
+                if error:
+                    aviso["error"] = error
+                self.al_guardar(sid, aviso)
+
+    def _insertar(self, conn, mensajes):
+        conn.executemany(self.SQL_INSERT, (
+            (m["id"], m["remitente_id"], m["destinatario_id"], m["mensaje"], m["fecha"])
+            for m in mensajes
+        ))
+        for m in mensajes:
+            conversaciones.registrar_mensaje(conn, m["id"], m["remitente_id"],
+                                             m["destinatario_id"], m["mensaje"], m["fecha"])
+
+    def cerrar(self, espera=5.0):
+        """Deja de aceptar mensajes y guarda todo lo que queda en la cola"""
+        if self._cola is None or self._cerrando:
+            return
+        self._cerrando = True
+        self._cola.put(_FIN)
+        limite = time.monotonic() + espera
+        while not self._terminado and time.monotonic() < limite:
+            self._socketio.sleep(0.05)
+        # Si el worker ya no corre (hub detenido, proceso saliendo) se vacía acá
+        restantes = []
+        while True:
+            try:
+                item = self._cola.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _FIN:
+                restantes.append(item)
+        if restantes:
+            self._guardar(restantes)
+
+    def metricas(self):
+        datos = dict(self._metricas)
+        datos["pendientes"] = self._cola.qsize() if self._cola is not None else 0
+        datos["segundos_escribiendo"] = round(datos["segundos_escribiendo"], 3)
+        return datos
@@ -0,0 +1,315 @@
+"""Métricas de latencia y errores en formato de texto de Prometheus.
+
+Mide cada ruta de Flask, cada handler de Socket.IO y cada sentencia SQL de
+las conexiones del pool, y expone todo en /metrics. Incluye un perfilador por
+muestreo opcional que escribe las pilas más frecuentes a un archivo.
+"""
+import collections
+import inspect
+import os
+import re
+import signal
+import sqlite3
+import sys
+import threading
+import time
+from functools import wraps
+
+from flask import g, request
+
+# Límites superiores (segundos) de los buckets de los histogramas
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _etiquetas(nombres, valores):
+    if not nombres:
+        return ""
+    return "{" + ",".join(f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)) + "}"
+
+
+class Histograma:
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self._series = {}   # valores de etiquetas -> [conteos por bucket..., suma, total]
+        self._lock = threading.Lock()
+
+    def observar(self, segundos, *valores):
+        with self._lock:
+            serie = self._series.get(valores)
+            if serie is None:
+                serie = self._series[valores] = [0] * (len(BUCKETS) + 2)
+            for i, limite in enumerate(BUCKETS):
+                if segundos <= limite:
+                    serie[i] += 1
+                    break
+            serie[-2] += segundos
+            serie[-1] += 1
+
+    def exportar(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for valores, serie in sorted(series.items()):
+            acumulado = 0
+            for limite, conteo in zip(BUCKETS, serie):
+                acumulado += conteo
+                etiquetas = _etiquetas(self.etiquetas + ("le",), valores + (limite,))
+                lineas.append(f"{self.nombre}_bucket{etiquetas} {acumulado}")
+            etiquetas = _etiquetas(self.etiquetas + ("le",), valores + ("+Inf",))
+            lineas.append(f"{self.nombre}_bucket{etiquetas} {serie[-1]}")
+            etiquetas = _etiquetas(self.etiquetas, valores)
+            lineas.append(f"{self.nombre}_sum{etiquetas} {serie[-2]:.6f}")
+            lineas.append(f"{self.nombre}_count{etiquetas} {serie[-1]}")
+        return lineas
+
+
+class Contador:
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self._series = collections.Counter()
+        self._lock = threading.Lock()
+
+    def sumar(self, *valores, cantidad=1):
+        with self._lock:
+            self._series[valores] += cantidad
+
+    def exportar(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        with self._lock:
+            series = dict(self._series)
+        for valores, total in sorted(series.items()):
+            lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, valores)} {total}")
+        return lineas
+
+
+class Medidor:
+    """Gauge calculado al momento de exportar"""
+
+    def __init__(self, nombre, ayuda, funcion):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.funcion = funcion
+
+    def exportar(self):
+        try:
+            valor = self.funcion()
+        except Exception:
+            return []
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} gauge",
+                f"{self.nombre} {valor}"]
+
+
+class Registro:
+    def __init__(self):
+        self.metricas = []
+        self.http = self._agregar(Histograma(
+            "techpaint_http_request_seconds", "Latencia de las rutas HTTP",
+            ("metodo", "ruta", "estado")))
+        self.http_errores = self._agregar(Contador(
+            "techpaint_http_errores_total", "Respuestas 5xx por ruta", ("metodo", "ruta")))
+        self.eventos = self._agregar(Histograma(
+            "techpaint_socketio_evento_seconds", "Latencia de los handlers de Socket.IO",
+            ("evento",)))
+        self.eventos_errores = self._agregar(Contador(
+            "techpaint_socketio_errores_total", "Excepciones en handlers de Socket.IO",
+            ("evento",)))
+        self.sql = self._agregar(Histograma(
+            "techpaint_sql_seconds", "Tiempo por sentencia SQL (ejecución y lectura de filas)",
+            ("consulta",)))
+
+    def _agregar(self, metrica):
+        self.metricas.append(metrica)
+        return metrica
+
+    def medidor(self, nombre, ayuda, funcion):
+        self._agregar(Medidor(nombre, ayuda, funcion))
+
+    def exportar(self):
+        lineas = []
+        for metrica in self.metricas:
+            lineas.extend(metrica.exportar())
+        return "\n".join(lineas) + "\n"
+
+
+# ---------------------------
+# Flask y Socket.IO
+# ---------------------------
+
+def instrumentar_flask(app, registro):
+    @app.before_request
+    def _inicio_request():
+        g.inicio_request = time.perf_counter()
+
+    @app.after_request
+    def _fin_request(respuesta):
+        inicio = g.pop("inicio_request", None)
+        if inicio is not None:
+            # La regla y no la URL, para no crear una serie por id
+            ruta = request.url_rule.rule if request.url_rule else "sin_ruta"
+            registro.http.observar(time.perf_counter() - inicio,
+                                   request.method, ruta, str(respuesta.status_code))
+            if respuesta.status_code >= 500:
+                registro.http_errores.sumar(request.method, ruta)
+        return respuesta
+
+
+def instrumentar_socketio(socketio, registro):
+    """Envuelve socketio.on para medir los handlers que se registren después"""
+    registrar_original = socketio.on
+
+    def on(evento, namespace=None):
+        registrar = registrar_original(evento, namespace)
+
+        def decorador(handler):
+            firma = inspect.signature(handler)
+
+            @wraps(handler)
+            def medido(*args, **kwargs):
+                try:
+                    firma.bind(*args, **kwargs)
+                except TypeError:
+                    # Flask-SocketIO prueba firmas (connect con y sin auth):
+                    # mismo error que sin medir y sin contarlo
+                    return handler(*args, **kwargs)
+                inicio = time.perf_counter()
+                try:
+                    return handler(*args, **kwargs)
+                except Exception:
+                    registro.eventos_errores.sumar(evento)
+                    raise
+                finally:
+                    registro.eventos.observar(time.perf_counter() - inicio, evento)
+
+            registrar(medido)
+            return handler
+        return decorador
+
+    socketio.on = on
+
+
+# ---------------------------
+# SQL
+# ---------------------------
+
+def nombre_consulta(sql):
+    """Etiqueta acotada para una sentencia: espacios colapsados, números
+    literales como ? y 100 caracteres, para no abrir una serie por valor"""
+    return re.sub(r"\b\d+\b", "?", re.sub(r"\s+", " ", sql)).strip()[:100]
+
+
+def fabrica_conexion(registro):
+    """Clase para sqlite3.connect(factory=...) que mide cada sentencia.
+
+    El trace callback de sqlite3 avisa cuando empieza una sentencia pero no
+    cuánto tarda, así que se miden execute y la lectura de filas del cursor.
+    """
+
+    class CursorMedido(sqlite3.Cursor):
+        _consulta = None
+
+        def _medir(self, metodo, *args):
+            inicio = time.perf_counter()
+            try:
+                return metodo(self, *args)
+            finally:
+                if self._consulta is not None:
+                    registro.sql.observar(time.perf_counter() - inicio, self._consulta)
+
+        def execute(self, sql, parametros=()):
+            self._consulta = nombre_consulta(sql)
+            return self._medir(sqlite3.Cursor.execute, sql, parametros)
+
+        def executemany(self, sql, parametros):
+            self._consulta = nombre_consulta(sql)
+            return self._medir(sqlite3.Cursor.executemany, sql, parametros)
+
+        def fetchone(self):
+            return self._medir(sqlite3.Cursor.fetchone)
+
+        def fetchmany(self, *args):
+            return self._medir(sqlite3.Cursor.fetchmany, *args)
+
+        def fetchall(self):
+            return self._medir(sqlite3.Cursor.fetchall)
+
+        def __next__(self):
+            return self._medir(sqlite3.Cursor.__next__)
+
+    class ConexionMedida(sqlite3.Connection):
+        def cursor(self, factory=CursorMedido):
+            return super().cursor(factory)
+
+        def execute(self, sql, parametros=()):
+            return self.cursor().execute(sql, parametros)
+
+        def executemany(self, sql, parametros):
+            return self.cursor().executemany(sql, parametros)
+
+    return ConexionMedida
+
+
+# ---------------------------
+# Perfilador por muestreo
+# ---------------------------
+
+class Perfilador:
+    """Muestrea las pilas de todos los hilos cada `intervalo` segundos.
+
+    Escribe en `ruta` las pilas en formato colapsado (función;función;... N),
+    el que entienden flamegraph.pl y speedscope. SIGUSR2 lo prende y apaga.
+    """
+
+    def __init__(self, ruta, intervalo=0.01, volcado=10.0):
+        self.ruta = ruta
+        self.intervalo = intervalo
+        self.volcado = volcado
+        self.activo = False
+        self.pilas = collections.Counter()
+        self._hilo = None
+
+    def iniciar(self, activo=True):
+        if hasattr(signal, "SIGUSR2") and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR2, lambda *_: self.alternar())
+        if activo:
+            self.alternar()
+
+    def alternar(self):
+        self.activo = not self.activo
+        if self.activo and (self._hilo is None or not self._hilo.is_alive()):
+            # Hilo del sistema: con eventlet todas las green threads viven en el
+            # hilo principal y se las ve igual desde afuera
+            self._hilo = threading.Thread(target=self._bucle, name="perfilador", daemon=True)
+            self._hilo.start()
+        elif not self.activo:
+            self.volcar()
+
+    def _bucle(self):
+        propio = threading.get_ident()
+        ultimo_volcado = time.monotonic()
+        while self.activo:
+            for ident, frame in sys._current_frames().items():
+                if ident == propio:
+                    continue
+                pila = []
+                while frame is not None:
+                    codigo = frame.f_code
+                    pila.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.pilas[";".join(reversed(pila))] += 1
+            if time.monotonic() - ultimo_volcado > self.volcado:
+                self.volcar()
+                ultimo_volcado = time.monotonic()
+            time.sleep(self.intervalo)
+
+    def volcar(self):
+        with open(self.ruta, "w", encoding="utf-8") as f:
+            for pila, muestras in self.pilas.most_common():
+                f.write(f"{pila} {muestras}\n")
@@ -0,0 +1,31 @@
+import base64
+import json
+
+
+class CursorInvalido(ValueError):
+    """El cursor recibido no se pudo decodificar"""
+
+
+def codificar_cursor(*valores):
+    """Cursor opaco (base64 url-safe) con la clave de orden de una fila"""
+    crudo = json.dumps(valores, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(crudo).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor, cantidad):
+    """Devuelve la tupla de `cantidad` valores guardada en el cursor"""
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+    except (ValueError, TypeError):
+        raise CursorInvalido("Cursor inválido")
+    if not isinstance(valores, list) or len(valores) != cantidad:
+        raise CursorInvalido("Cursor inválido")
+    return tuple(valores)
+
+
+def limite_pagina(valor, por_defecto, maximo):
+    """Tamaño de página pedido, acotado a [1, maximo]"""
+    if valor is None:
+        return por_defecto
+    return max(1, min(valor, maximo))
@@ -0,0 +1,169 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+# Pragmas aplicados a cada conexión nueva del pool
+PRAGMAS_POR_DEFECTO = {
+    "journal_mode": "WAL",        # lectores no bloquean al escritor
+    "synchronous": "NORMAL",      # en WAL alcanza con fsync en el checkpoint
+    "cache_size": -16000,         # ~16 MB de cache de páginas por conexión
+    "mmap_size": 268435456,       # 256 MB mapeados en memoria
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+    "foreign_keys": "ON",
+}
+
+
+class PoolAgotado(Exception):
+    """No se liberó ninguna conexión dentro del timeout"""
+
+
+def crear_semaforo(tamano, modo="threading"):
+    """Semáforo acorde al modo asíncrono del servidor.
+
+    Con eventlet sin monkey patching un semáforo de threading bloquearía
+    el hub entero mientras una green thread espera conexión.
+    """
+    if modo == "eventlet":
+        from eventlet.semaphore import Semaphore
+        return Semaphore(tamano)
+    return threading.Semaphore(tamano)
+
+
+class PoolConexiones:
+    """Pool de conexiones SQLite reutilizables, uno por proceso (worker)"""
+
+    def __init__(self, ruta, tamano_max=8, timeout=5.0, cached_statements=256,
+                 pragmas=None, modo="threading", factory=sqlite3.Connection, ejecutor=None):
+        self.ruta = ruta
+        self.tamano_max = tamano_max
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self.pragmas = dict(PRAGMAS_POR_DEFECTO if pragmas is None else pragmas)
+        self.modo = modo
+        self.factory = factory    # clase de conexión (p. ej. la que mide SQL en metricas.py)
+        self.ejecutor = ejecutor  # EjecutorDB: las conexiones salen envueltas (ver ejecutor.py)
+        self._inicializar()
+
+    def _inicializar(self):
+        self._pid = os.getpid()
+        self._libres = deque()
+        self._abiertas = 0
+        self._lock = threading.Lock()
+        self._semaforo = crear_semaforo(self.tamano_max, self.modo)
+        self._metricas = {
+            "hits": 0,          # se reutilizó una conexión libre
+            "misses": 0,        # hubo que abrir una conexión nueva
+            "waits": 0,         # el pool estaba lleno y hubo que esperar
+            "wait_seconds": 0.0,
+            "timeouts": 0,
+        }
+
+    def _abrir(self):
+        conn = sqlite3.connect(
+            self.ruta,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            factory=self.factory,
+        )
+        conn.row_factory = sqlite3.Row
+        for nombre, valor in self.pragmas.items():
+            conn.execute(f"PRAGMA {nombre} = {valor}")
+        return conn
+
+    def obtener(self):
+        """Toma una conexión del pool, abriendo una nueva si no hay libres"""
+        if os.getpid() != self._pid:
+            # Proceso hijo tras un fork: las conexiones heredadas no se comparten
+            self._inicializar()
+
+        if not self._semaforo.acquire(blocking=False):
+            inicio = time.perf_counter()
+            adquirido = self._semaforo.acquire(timeout=self.timeout)
+            espera = time.perf_counter() - inicio
+            with self._lock:
+                self._metricas["waits"] += 1
+                self._metricas["wait_seconds"] += espera
+                if not adquirido:
+                    self._metricas["timeouts"] += 1
+            if not adquirido:
+                raise PoolAgotado(f"Sin conexiones libres tras {self.timeout}s")
+
+        conn = None
+        nueva = False
+        try:
+            with self._lock:
+                conn = self._libres.pop() if self._libres else None
+                self._metricas["hits" if conn else "misses"] += 1
+                if conn is None:
+                    self._abiertas += 1
+                    nueva = True
+            if nueva:
+                conn = (self._abrir() if self.ejecutor is None
+                        else self.ejecutor.leer(None, self._abrir))
+            return conn if self.ejecutor is None else self.ejecutor.envolver(conn)
+        except Exception:
+            with self._lock:
+                if nueva:
+                    # Sólo se descuenta la que abrió esta llamada
+                    self._abiertas -= 1
+                    if conn is not None:
+                        conn.close()
+                elif conn is not None:
+                    self._libres.append(conn)
+            self._semaforo.release()
+            raise
+
+    def liberar(self, conn):
+        """Devuelve la conexión al pool descartando transacciones a medias"""
+        try:
+            if self.ejecutor is not None:
+                envuelta, conn = conn, conn.conn
+                if envuelta.escribiendo or conn.in_transaction:
+                    envuelta.rollback()   # también suelta el turno de escritor
+            if conn.in_transaction:
+                conn.rollback()
+            with self._lock:
+                self._libres.append(conn)
+        except sqlite3.Error:
+            conn.close()
+            with self._lock:
+                self._abiertas -= 1
+        finally:
+            self._semaforo.release()
+
+    @contextmanager
+    def conexion(self, conn=None):
+        """Uso fuera de un request: `with pool.conexion() as conn:`.
+
+        Con `conn` (la que ya tiene el request o evento en curso) se usa esa
+        en vez de tomar otra del pool.
+        """
+        if conn is not None:
+            yield conn
+            return
+        conn = self.obtener()
+        try:
+            yield conn
+        finally:
+            self.liberar(conn)
+
+    def metricas(self):
+        with self._lock:
+            datos = dict(self._metricas)
+            datos["abiertas"] = self._abiertas
+            datos["libres"] = len(self._libres)
+        datos["en_uso"] = datos["abiertas"] - datos["libres"]
+        datos["tamano_max"] = self.tamano_max
+        return datos
+
+    def cerrar(self):
+        with self._lock:
+            while self._libres:
+                self._libres.pop().close()
+                self._abiertas -= 1
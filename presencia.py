@@ -0,0 +1,213 @@
+"""Registro de usuarios conectados (salas y chat privado).
+
+PresenciaLocal vive en la memoria del proceso y alcanza con un solo worker.
+PresenciaCompartida guarda el registro en SQLite para que todos los workers
+vean quién está en cada sala y en qué sids entregar un mensaje privado (un
+usuario puede tener el chat privado abierto en varias pestañas o equipos).
+"""
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime
+
+log = logging.getLogger("techpaint.presencia")
+
+SQL_MIEMBROS_SALA = """
+    SELECT username FROM presencia_salas
+    WHERE sala = ? AND sid IS NOT ?
+    ORDER BY desde
+"""
+SQL_SESIONES_PRIVADAS = "SELECT sid FROM presencia_privada WHERE usuario_id = ?"
+
+class Miembro:
+    """Socket unido a una sala"""
+
+    __slots__ = ('sid', 'username', 'room', 'joined_at')
+
+    def __init__(self, sid, username, room):
+        self.sid = sid
+        self.username = username
+        self.room = room
+        self.joined_at = datetime.now()
+
+
+class PresenciaLocal:
+    """Presencia en memoria de este proceso, indexada por sid y por sala.
+
+    Unirse, salir y listar una sala cuestan O(1) u O(miembros de la sala),
+    nunca O(total de conectados).
+    """
+
+    def __init__(self):
+        self._por_sid = {}    # sid -> Miembro
+        self._por_sala = {}   # sala -> {sid: Miembro}, en orden de llegada
+        self._privados = {}   # usuario_id -> {sid}
+        self._privado_de = {} # sid -> usuario_id
+
+    def iniciar(self, socketio):
+        pass
+
+    def unir_sala(self, sid, username, sala, conn=None):
+        """Registra el socket en la sala; devuelve el Miembro anterior si cambió de sala.
+
+        `conn` es la conexión del evento en curso, si ya tiene una: la
+        presencia compartida la usa en vez de tomar otra del pool.
+        """
+        anterior = self._quitar(sid)
+        miembro = Miembro(sid, username, sala)
+        self._por_sid[sid] = miembro
+        self._por_sala.setdefault(sala, {})[sid] = miembro
+        return anterior
+
+    def usuario(self, sid):
+        return self._por_sid.get(sid)
+
+    def salir_sala(self, sid):
+        return self._quitar(sid)
+
+    def _quitar(self, sid):
+        miembro = self._por_sid.pop(sid, None)
+        if miembro is not None:
+            miembros = self._por_sala.get(miembro.room)
+            if miembros is not None:
+                miembros.pop(sid, None)
+                if not miembros:
+                    del self._por_sala[miembro.room]
+        return miembro
+
+    def usuarios_en_sala(self, sala, excluir_sid=None, conn=None):
+        return [m.username for sid, m in self._por_sala.get(sala, {}).items()
+                if sid != excluir_sid]
+
+    def cantidad_en_sala(self, sala, conn=None):
+        return len(self._por_sala.get(sala, ()))
+
+    def total(self):
+        return len(self._por_sid)
+
+    def registrar_privado(self, usuario_id, sid):
+        self._privados.setdefault(usuario_id, set()).add(sid)
+        self._privado_de[sid] = usuario_id
+
+    def quitar_privado(self, sid):
+        """Olvida la sesión privada del sid; devuelve el id del usuario o None"""
+        usuario_id = self._privado_de.pop(sid, None)
+        if usuario_id is not None:
+            sids = self._privados.get(usuario_id)
+            if sids is not None:
+                sids.discard(sid)
+                if not sids:
+                    del self._privados[usuario_id]
+        return usuario_id
+
+    def sids_privados(self, usuario_id):
+        return list(self._privados.get(usuario_id, ()))
+
+    def total_privados(self):
+        return len(self._privado_de)
+
+
+class PresenciaCompartida(PresenciaLocal):
+    """Presencia en SQLite compartida entre workers.
+
+    Los sids propios se siguen resolviendo en memoria; sólo las consultas que
+    cruzan workers (miembros de una sala, sids de un usuario) van a la base.
+    Cada worker late periódicamente y al arrancar se borran las filas de
+    workers que dejaron de latir.
+    """
+
+    INTERVALO_LATIDO = 10
+    VENCIMIENTO = 30
+
+    def __init__(self, pool):
+        super().__init__()
+        self.pool = pool
+        self.trabajador = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def iniciar(self, socketio):
+        self._latir()
+        socketio.start_background_task(self._bucle_latidos, socketio)
+
+    def _bucle_latidos(self, socketio):
+        while True:
+            socketio.sleep(self.INTERVALO_LATIDO)
+            try:
+                self._latir()
+            except Exception:
+                log.exception("Error en latido de presencia")
+
+    def _latir(self):
+        ahora = time.time()
+        with self.pool.conexion() as conn:
+            conn.execute("""
+                INSERT INTO trabajadores (id, latido) VALUES (?, ?)
+                ON CONFLICT(id) DO UPDATE SET latido = excluded.latido
+            """, (self.trabajador, ahora))
+            # Limpiar lo que dejaron workers caídos
+            conn.execute("DELETE FROM trabajadores WHERE latido < ?", (ahora - self.VENCIMIENTO,))
+            for tabla in ('presencia_salas', 'presencia_privada'):
+                conn.execute(f"""
+                    DELETE FROM {tabla}
+                    WHERE trabajador NOT IN (SELECT id FROM trabajadores)
+                """)
+            conn.commit()
+
+    def unir_sala(self, sid, username, sala, conn=None):
+        anterior = super().unir_sala(sid, username, sala)
+        with self.pool.conexion(conn) as conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO presencia_salas (sid, trabajador, username, sala)
+                VALUES (?, ?, ?, ?)
+            """, (sid, self.trabajador, username, sala))
+            conn.commit()
+        return anterior
+
+    def salir_sala(self, sid):
+        datos = super().salir_sala(sid)
+        if datos is not None:
+            with self.pool.conexion() as conn:
+                conn.execute("DELETE FROM presencia_salas WHERE sid = ?", (sid,))
+                conn.commit()
+        return datos
+
+    def usuarios_en_sala(self, sala, excluir_sid=None, conn=None):
+        with self.pool.conexion(conn) as conn:
+            filas = conn.execute(SQL_MIEMBROS_SALA, (sala, excluir_sid)).fetchall()
+        return [fila['username'] for fila in filas]
+
+    def cantidad_en_sala(self, sala, conn=None):
+        with self.pool.conexion(conn) as conn:
+            return conn.execute("SELECT COUNT(*) FROM presencia_salas WHERE sala = ?",
+                                (sala,)).fetchone()[0]
+
+    def total(self):
+        with self.pool.conexion() as conn:
+            return conn.execute("SELECT COUNT(*) FROM presencia_salas").fetchone()[0]
+
+    def registrar_privado(self, usuario_id, sid):
+        super().registrar_privado(usuario_id, sid)
+        with self.pool.conexion() as conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO presencia_privada (sid, usuario_id, trabajador)
+                VALUES (?, ?, ?)
+            """, (sid, usuario_id, self.trabajador))
+            conn.commit()
+
+    def quitar_privado(self, sid):
+        usuario_id = super().quitar_privado(sid)
+        if usuario_id is not None:
+            with self.pool.conexion() as conn:
+                conn.execute("DELETE FROM presencia_privada WHERE sid = ?", (sid,))
+                conn.commit()
+        return usuario_id
+
+    def sids_privados(self, usuario_id):
+        with self.pool.conexion() as conn:
+            filas = conn.execute(SQL_SESIONES_PRIVADAS, (usuario_id,)).fetchall()
+        return [fila['sid'] for fila in filas]
+
+    def total_privados(self):
+        with self.pool.conexion() as conn:
+            return conn.execute("SELECT COUNT(*) FROM presencia_privada").fetchone()[0]
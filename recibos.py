@@ -0,0 +1,112 @@
+"""Confirmaciones de entrega y de lectura de mensajes privados, en lotes.
+
+Cada cliente confirma (ack) los mensajes que le llegan; las lecturas salen de
+marcar-leidos. En vez de un UPDATE y un emit por mensaje, se acumulan y cada
+`intervalo` se marca todo lo entregado con un solo UPDATE y a cada remitente
+le llega un único frame private_receipts con lo suyo:
+
+    {"entregados": [ids], "leidos": {lector_id: último id leído}}
+
+Las lecturas van como marca de agua: marcar-leidos deja leída toda la
+conversación, así que alcanza con el id más alto por lector.
+"""
+import logging
+import threading
+
+log = logging.getLogger("techpaint.recibos")
+
+# Ids por UPDATE (límite de variables de SQLite)
+LOTE_IDS = 500
+
+
+class RecibosPrivados:
+    """`emitir(remitente_id, recibos)` se llama una vez por remitente con novedades"""
+
+    # Un ack puede llegar antes de que la escritura diferida guarde el mensaje:
+    # los ids que el UPDATE no encontró se reintentan en las próximas rondas
+    REINTENTOS = 20
+
+    def __init__(self, pool, emitir, intervalo=0.5):
+        self.pool = pool
+        self.emitir = emitir
+        self.intervalo = intervalo
+        self._entregados = {}    # mensaje_id -> (remitente_id, reintentos)
+        self._leidos = {}        # remitente_id -> {lector_id: último id}
+        self._lock = threading.Lock()
+        self._metricas = {
+            "entregados": 0,     # mensajes marcados como entregados
+            "leidos": 0,         # mensajes marcados como leídos
+            "frames": 0,         # private_receipts enviados
+            "sin_guardar": 0,    # acks de mensajes que nunca aparecieron en la base
+        }
+
+    def iniciar(self, socketio):
+        socketio.start_background_task(self._bucle, socketio)
+
+    def _bucle(self, socketio):
+        while True:
+            socketio.sleep(self.intervalo)
+            try:
+                self.publicar()
+            except Exception:
+                log.exception("Error publicando recibos de mensajes privados")
+
+    def entregado(self, mensajes):
+        """Registra el ack de un cliente; `mensajes` son pares (id, remitente_id)"""
+        with self._lock:
+            for mensaje_id, remitente_id in mensajes:
+                self._entregados.setdefault(mensaje_id, (remitente_id, 0))
+
+    def leidos(self, lector_id, filas):
+        """Mensajes que marcar-leidos acaba de dejar leídos (filas con id y remitente_id)"""
+        with self._lock:
+            for fila in filas:
+                marcas = self._leidos.setdefault(fila['remitente_id'], {})
+                marcas[lector_id] = max(marcas.get(lector_id, 0), fila['id'])
+                self._metricas["leidos"] += 1
+
+    def publicar(self):
+        with self._lock:
+            entregados, self._entregados = self._entregados, {}
+            leidos, self._leidos = self._leidos, {}
+        if not entregados and not leidos:
+            return
+
+        guardados = set()
+        if entregados:
+            ids = list(entregados)
+            with self.pool.conexion() as conn:
+                for i in range(0, len(ids), LOTE_IDS):
+                    lote = ids[i:i + LOTE_IDS]
+                    marcas = ",".join("?" * len(lote))
+                    guardados.update(fila[0] for fila in conn.execute(
+                        f"UPDATE mensajes_privados SET entregado = 1 "
+                        f"WHERE id IN ({marcas}) RETURNING id", lote).fetchall())
+                conn.commit()
+
+        por_remitente = {}
+        reintentar = {}
+        for mensaje_id, (remitente_id, reintentos) in entregados.items():
+            if mensaje_id in guardados:
+                por_remitente.setdefault(remitente_id, {"entregados": [], "leidos": {}})[
+                    "entregados"].append(mensaje_id)
+            elif reintentos < self.REINTENTOS:
+                reintentar[mensaje_id] = (remitente_id, reintentos + 1)
+        for remitente_id, marcas in leidos.items():
+            por_remitente.setdefault(remitente_id, {"entregados": [], "leidos": {}})[
+                "leidos"] = marcas
+
+        with self._lock:
+            self._metricas["entregados"] += len(guardados)
+            self._metricas["sin_guardar"] += len(entregados) - len(guardados) - len(reintentar)
+            self._metricas["frames"] += len(por_remitente)
+            for mensaje_id, dato in reintentar.items():
+                self._entregados.setdefault(mensaje_id, dato)
+        for remitente_id, recibos in por_remitente.items():
+            self.emitir(remitente_id, recibos)
+
+    def metricas(self):
+        with self._lock:
+            datos = dict(self._metricas)
+            datos["pendientes"] = len(self._entregados)
+        return datos
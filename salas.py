@@ -0,0 +1,195 @@
+"""Historial de las salas de chat.
+
+Cada sala activa tiene un buffer circular con los mensajes más recientes, que
+se manda completo al que entra sin tocar la base. Todos los mensajes se
+guardan además en mensajes_sala, en lotes y en segundo plano; lo que ya no
+está en el buffer se pide paginado a /api/salas/<sala>/mensajes.
+"""
+import atexit
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+
+from escritura import Secuencia
+
+log = logging.getLogger("techpaint.salas")
+# Estimación del costo de un mensaje en memoria además de sus textos
+BYTES_POR_MENSAJE = 300
+
+SQL_PAGINA_SALA = """
+    SELECT * FROM (
+        SELECT id, sala, username, mensaje, fecha FROM mensajes_sala
+        WHERE sala = ? AND (fecha, id) < (?, ?)
+        ORDER BY fecha DESC, id DESC
+        LIMIT ?
+    )
+    ORDER BY fecha ASC, id ASC
+"""
+
+
+class BufferSala:
+    """Últimos mensajes de una sala, acotados en cantidad y en bytes"""
+
+    __slots__ = ("mensajes", "bytes", "max_bytes")
+
+    def __init__(self, max_mensajes, max_bytes):
+        self.mensajes = deque(maxlen=max_mensajes)
+        self.bytes = 0
+        self.max_bytes = max_bytes
+
+    def agregar(self, mensaje):
+        if len(self.mensajes) == self.mensajes.maxlen:
+            self.bytes -= tamano_mensaje(self.mensajes[0])
+        self.mensajes.append(mensaje)
+        self.bytes += tamano_mensaje(mensaje)
+        while self.bytes > self.max_bytes and len(self.mensajes) > 1:
+            self.bytes -= tamano_mensaje(self.mensajes.popleft())
+
+
+def tamano_mensaje(mensaje):
+    return BYTES_POR_MENSAJE + len(mensaje["message"]) + len(mensaje["username"])
+
+
+class HistorialSalas:
+    """Buffers por sala (LRU entre salas) y escritura por lotes a mensajes_sala.
+
+    Con `compartido=True` (varios workers) el buffer de este proceso no ve los
+    mensajes enviados en otros workers, así que la historia al entrar se lee
+    de la base.
+    """
+
+    # Vueltas que se reintenta un mensaje que no se pudo guardar (p. ej. base
+    # bloqueada); una violación de restricción no se reintenta
+    REINTENTOS = 5
+
+    def __init__(self, pool, max_mensajes=100, max_bytes_sala=64 * 1024, max_salas=1000,
+                 intervalo=1.0, lote=500, compartido=False):
+        self.pool = pool
+        self.max_mensajes = max_mensajes
+        self.max_bytes_sala = max_bytes_sala
+        self.max_salas = max_salas
+        self.intervalo = intervalo
+        self.lote = lote
+        self.compartido = compartido
+        self.secuencia = None
+        self._salas = OrderedDict()   # sala -> BufferSala, la menos usada primero
+        self._pendientes = []         # mensajes todavía no guardados
+        self._lock = threading.Lock()
+        self._socketio = None
+        self._metricas = {"guardados": 0, "lotes": 0, "errores": 0, "descartados": 0,
+                          "salas_descartadas": 0}
+
+    def iniciar(self, socketio):
+        self._socketio = socketio
+        self.secuencia = Secuencia(self.pool, "mensajes_sala", modo=socketio.async_mode)
+        socketio.start_background_task(self._bucle)
+        atexit.register(self.guardar_pendientes)
+
+    def registrar(self, sala, username, mensaje, fecha, sender_id=None):
+        """Asigna id, guarda en el buffer de la sala y encola para la base"""
+        datos = {
+            "id": self.secuencia.siguiente(),
+            "username": username,
+            "message": mensaje,
+            "timestamp": fecha,
+            "sender_id": sender_id,
+        }
+        with self._lock:
+            buffer = self._salas.get(sala)
+            if buffer is None:
+                buffer = self._salas[sala] = BufferSala(self.max_mensajes, self.max_bytes_sala)
+                if len(self._salas) > self.max_salas:
+                    # Lo descartado ya está pendiente o guardado en la base
+                    self._salas.popitem(last=False)
+                    self._metricas["salas_descartadas"] += 1
+            else:
+                self._salas.move_to_end(sala)
+            buffer.agregar(datos)
+            self._pendientes.append((sala, datos, 0))   # (sala, mensaje, intentos)
+            lleno = len(self._pendientes) >= self.lote
+        if lleno:
+            self._socketio.start_background_task(self.guardar_pendientes)
+        return datos
+
+    def recientes(self, sala, conn=None):
+        """Mensajes para reproducir al entrar, en orden cronológico.
+
+        `conn`: la conexión del evento en curso, si ya tiene una.
+        """
+        if self.compartido:
+            with self.pool.conexion(conn) as conn:
+                filas = conn.execute(SQL_PAGINA_SALA, (sala, "9999", 0, self.max_mensajes))
+                return [mensaje_de_fila(fila) for fila in filas]
+        with self._lock:
+            buffer = self._salas.get(sala)
+            return list(buffer.mensajes) if buffer else []
+
+    def _bucle(self):
+        while True:
+            self._socketio.sleep(self.intervalo)
+            self.guardar_pendientes()
+
+    def guardar_pendientes(self):
+        with self._lock:
+            pendientes, self._pendientes = self._pendientes, []
+        if not pendientes:
+            return
+        fallidos = []
+        with self.pool.conexion() as conn:
+            try:
+                self._insertar(conn, pendientes)
+                conn.commit()
+            except sqlite3.Error:
+                conn.rollback()
+                # Aislar la fila problemática para que no frene al resto del lote
+                for item in pendientes:
+                    try:
+                        self._insertar(conn, [item])
+                        conn.commit()
+                    except sqlite3.Error as e:
+                        conn.rollback()
+                        fallidos.append((item, e))
+
+        # Las que fallan se reintentan unas vueltas (base bloqueada) y después se descartan
+        reintentar = []
+        descartados = 0
+        for (sala, datos, intentos), error in fallidos:
+            if intentos + 1 < self.REINTENTOS and not isinstance(error, sqlite3.IntegrityError):
+                reintentar.append((sala, datos, intentos + 1))
+            else:
+                descartados += 1
+                log.error("Mensaje de sala %s descartado tras %d intentos: %s",
+                          datos["id"], intentos + 1, error)
+        with self._lock:
+            self._pendientes[:0] = reintentar
+            self._metricas["guardados"] += len(pendientes) - len(fallidos)
+            self._metricas["errores"] += len(fallidos)
+            self._metricas["descartados"] += descartados
+            self._metricas["lotes"] += 1
+
+    def _insertar(self, conn, pendientes):
+        conn.executemany("""
+            INSERT INTO mensajes_sala (id, sala, username, mensaje, fecha)
+            VALUES (?, ?, ?, ?, ?)
+        """, ((m["id"], sala, m["username"], m["message"], m["timestamp"])
+              for sala, m, _ in pendientes))
+
+    def metricas(self):
+        with self._lock:
+            datos = dict(self._metricas)
+            datos["pendientes"] = len(self._pendientes)
+            datos["salas"] = len(self._salas)
+            datos["bytes"] = sum(b.bytes for b in self._salas.values())
+        return datos
+
+
+def mensaje_de_fila(fila):
+    """Fila de mensajes_sala con la forma del evento new_message"""
+    return {
+        "id": fila["id"],
+        "username": fila["username"],
+        "message": fila["mensaje"],
+        "timestamp": fila["fecha"],
+        "sender_id": None,
+    }
@@ -0,0 +1,42 @@
+"""Tokens de sesión firmados y sin estado en el servidor.
+
+/api/login emite un token con el id del usuario firmado con la SECRET_KEY de
+la app (itsdangerous, lo mismo que usa Flask para su cookie de sesión).
+Verificarlo es un HMAC en memoria: ningún request ni evento necesita ir a la
+base para saber quién es el usuario. El token viaja en la cookie
+techpaint_sesion (navegador) o en `Authorization: Bearer` / el `auth` del
+handshake de Socket.IO (otros clientes).
+"""
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+COOKIE_SESION = "techpaint_sesion"
+
+
+class FirmadorSesiones:
+
+    def __init__(self, secreto, duracion=12 * 3600):
+        self.duracion = duracion
+        self._serializador = URLSafeTimedSerializer(secreto, salt="techpaint-sesion")
+
+    def emitir(self, usuario_id):
+        return self._serializador.dumps({"uid": usuario_id})
+
+    def verificar(self, token):
+        """Id del usuario del token; None si falta, fue alterado o venció"""
+        if not token or not isinstance(token, str):
+            return None
+        try:
+            datos = self._serializador.loads(token, max_age=self.duracion)
+        except BadSignature:   # incluye SignatureExpired
+            return None
+        return datos.get("uid") if isinstance(datos, dict) else None
+
+
+def token_de(request, auth=None):
+    """Token del header Authorization, del auth del handshake o de la cookie"""
+    encabezado = request.headers.get("Authorization", "")
+    if encabezado.startswith("Bearer "):
+        return encabezado[7:].strip()
+    if isinstance(auth, dict) and auth.get("token"):
+        return auth["token"]
+    return request.cookies.get(COOKIE_SESION)
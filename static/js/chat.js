@@ -23,6 +23,7 @@ const typingText = document.getElementById('typingText');
   let currentUsername = null;
   let typingTimer = null;
   let isTyping = false;
+  let typingSent = 0;
 
   // Cargar usuario desde localStorage (espera que login guarde key "user")
   try {
@@ -127,9 +128,11 @@ const typingText = document.getElementById('typingText');
         sendMessage();
         return;
       }
-      if (!isTyping) {
+      // Se renueva cada 2s: el servidor vence el indicador a los 5s
+      if (!isTyping || Date.now() - typingSent > 2000) {
         socket.emit('typing', { is_typing: true });
         isTyping = true;
+        typingSent = Date.now();
       }
       clearTimeout(typingTimer);
       typingTimer = setTimeout(() => {
@@ -181,23 +184,69 @@ const typingText = document.getElementById('typingText');
     appendMessage(`<em>${escapeHtml(data.message)}</em>`, 'system');
   });
 
-  socket.on('new_message', (data) => {
-    // data: { username, message, timestamp, sender_id }
+  function appendChatMessage(data) {
+    // data: { id, username, message, timestamp, sender_id }
     // Determinar si es propio: comparar sender_id con socket.id O username con currentUsername
     const isOwn = (data.sender_id && data.sender_id === socket.id) || (data.username && data.username === currentUsername);
     const time = formatTime(data.timestamp);
     const content = `<div class="message-header"><strong>${escapeHtml(data.username)}</strong><span class="time">${time}</span></div><div class="message-text">${escapeHtml(data.message)}</div>`;
     appendMessage(content, isOwn ? 'own' : 'other');
+  }
+
+  // Últimos mensajes de la sala al entrar
+  socket.on('room_history', (data) => {
+    (data.mensajes || []).forEach(appendChatMessage);
+  });
+
+  socket.on('new_message', (data) => {
+    appendChatMessage(data);
     hideTyping();
   });
 
+  // Lote de mensajes de la sala (servidor con TECHPAINT_LOTE_MS)
+  socket.on('new_messages', (data) => {
+    (data.mensajes || []).forEach(appendChatMessage);
+    hideTyping();
+  });
+
+  // Lista local de la sala: snapshot al entrar y luego sólo deltas
+  let usersInRoom = [];
+
+  function renderOnlineUsers() {
+    onlineUsers.innerHTML = `<div class="users-label">En línea (${usersInRoom.length}):</div>` + usersInRoom.map(u => `<span class="user-pill">${escapeHtml(u)}</span>`).join('');
+  }
+
+  function checkUserCount(count) {
+    // Si perdimos algún delta, pedir el snapshot completo
+    if (typeof count === 'number' && count !== usersInRoom.length) socket.emit('get_room_users');
+  }
+
   socket.on('room_users', (data) => {
-    const users = data.users || [];
-    onlineUsers.innerHTML = `<div class="users-label">En línea (${users.length}):</div>` + users.map(u => `<span class="user-pill">${escapeHtml(u)}</span>`).join('');
+    usersInRoom = data.users || [];
+    renderOnlineUsers();
   });
 
-  socket.on('user_typing', (data) => {
-    if (data.is_typing) showTyping(data.username); else hideTyping();
+  socket.on('user_joined', (data) => {
+    usersInRoom.push(data.username);
+    renderOnlineUsers();
+    checkUserCount(data.count);
+  });
+
+  socket.on('user_left', (data) => {
+    const i = usersInRoom.indexOf(data.username);
+    if (i !== -1) usersInRoom.splice(i, 1);
+    renderOnlineUsers();
+    checkUserCount(data.count);
+  });
+
+  // El servidor manda la lista completa de quién escribe en la sala; con varios
+  // workers cada uno manda la de sus usuarios y se unen por origen
+  const typingPorOrigen = {};
+
+  socket.on('room_typing', (data) => {
+    typingPorOrigen[data.origen] = data.users || [];
+    const otros = [...new Set(Object.values(typingPorOrigen).flat())].filter(u => u !== currentUsername);
+    if (otros.length) showTyping(otros.join(', ')); else hideTyping();
   });
 
   socket.on('left_room', (data) => {
@@ -4,9 +4,15 @@ let currentUser = null;
 let currentChat = null;
 let conversaciones = [];
 let typingTimer = null;
+// Paginación del historial: cursor para pedir mensajes más viejos
+let cursorAnterior = null;
+let cargandoAnteriores = false;
+// Último seq del registro de cambios ya aplicado (ver /api/sync)
+let seqSync = null;
+let syncTimer = null;
 
 // Obtener usuario actual de localStorage
-document.addEventListener('DOMContentLoaded', function() {
+document.addEventListener('DOMContentLoaded', async function() {
     const userData = localStorage.getItem('user');
     if (!userData) {
         window.location.href = '/login';
@@ -17,7 +23,10 @@ document.addEventListener('DOMContentLoaded', function() {
     document.getElementById('currentUserName').textContent = currentUser.nombre;
     
     // Conectar al servidor
-    socket.emit('join_private_chat', { userId: currentUser.id });
+    socket.emit('join_private_chat', {});
+    
+    // Seq antes de la carga completa: desde ahí se piden sólo los cambios
+    await iniciarSync();
     
     // Cargar conversaciones
     cargarConversaciones();
@@ -53,6 +62,77 @@ async function cargarConversaciones() {
     }
 }
 
+// Seq actual del registro de cambios
+async function iniciarSync() {
+    try {
+        const response = await fetch('/api/sync');
+        const data = await response.json();
+        if (data.success) seqSync = data.seq;
+    } catch (error) {
+        console.error('Error iniciando sincronización:', error);
+    }
+}
+
+// Varios eventos seguidos se resuelven con un solo pedido de cambios
+function programarSync() {
+    clearTimeout(syncTimer);
+    syncTimer = setTimeout(sincronizar, 300);
+}
+
+// Aplica los cambios desde seqSync en vez de volver a pedir todo
+async function sincronizar() {
+    if (seqSync === null) return cargarConversaciones();
+    try {
+        let data;
+        do {
+            const response = await fetch(`/api/sync?since=${seqSync}`);
+            data = await response.json();
+            if (!data.success) return;
+            if (data.reiniciar) {
+                // El registro ya se compactó: recarga completa
+                seqSync = data.seq;
+                await cargarConversaciones();
+                if (currentChat) await cargarMensajes(currentChat.id);
+                return;
+            }
+            aplicarCambios(data);
+            seqSync = data.seq;
+        } while (data.mas);
+    } catch (error) {
+        console.error('Error sincronizando:', error);
+    }
+}
+
+function aplicarCambios(data) {
+    // Bandeja: se reemplaza la fila de cada conversación tocada
+    data.conversaciones.forEach(fila => {
+        const conv = conversaciones.find(c => c.id === fila.id);
+        if (conv) Object.assign(conv, fila);
+        else conversaciones.push(fila);
+    });
+    if (data.conversaciones.length) {
+        conversaciones.sort((a, b) => (b.ultima_fecha || '').localeCompare(a.ultima_fecha || ''));
+        renderConversaciones();
+    }
+    
+    if (!currentChat) return;
+    data.mensajes.forEach(msg => {
+        const contacto = msg.remitente_id === currentUser.id ? msg.destinatario_id : msg.remitente_id;
+        if (contacto !== currentChat.id) return;
+        const div = mensajesContenedor.querySelector(`.mensaje[data-id="${msg.id}"]`);
+        if (!div) {
+            agregarMensajeALaVista(msg);
+        } else if (msg.remitente_id === currentUser.id && msg.leido) {
+            div.classList.remove('entregado', 'pendiente');
+            div.classList.add('leido');
+        }
+    });
+    data.borrados.mensajes.forEach(id => {
+        const div = mensajesContenedor.querySelector(`.mensaje[data-id="${id}"]`);
+        if (div) div.remove();
+    });
+}
+
 // Renderizar lista de conversaciones
 function renderConversaciones() {
     conversacionesLista.innerHTML = '';
@@ -106,13 +186,15 @@ async function abrirConversacion(conv) {
     marcarComoLeidos(conv.id);
 }
 
-// Cargar mensajes de una conversación
+// Cargar mensajes de una conversación (página más reciente)
 async function cargarMensajes(destinatarioId) {
     try {
+        cursorAnterior = null;
         const response = await fetch(`/api/mensajes/${currentUser.id}/${destinatarioId}`);
         const data = await response.json();
         
         if (data.success) {
+            cursorAnterior = data.anterior;
             renderMensajes(data.mensajes);
         }
     } catch (error) {
@@ -120,6 +202,58 @@ async function cargarMensajes(destinatarioId) {
     }
 }
 
+// Cargar la página anterior al hacer scroll hasta arriba
+async function cargarMensajesAnteriores() {
+    if (!currentChat || !cursorAnterior || cargandoAnteriores) return;
+    cargandoAnteriores = true;
+    const chatId = currentChat.id;
+    
+    try {
+        const response = await fetch(`/api/mensajes/${currentUser.id}/${chatId}?before=${encodeURIComponent(cursorAnterior)}`);
+        const data = await response.json();
+        
+        // Ignorar la respuesta si mientras tanto se cambió de conversación
+        if (data.success && currentChat && currentChat.id === chatId) {
+            cursorAnterior = data.anterior;
+            
+            // Mantener la posición visual al insertar arriba
+            const alturaPrevia = mensajesContenedor.scrollHeight;
+            const fragmento = document.createDocumentFragment();
+            data.mensajes.forEach(msg => fragmento.appendChild(crearElementoMensaje(msg)));
+            mensajesContenedor.insertBefore(fragmento, mensajesContenedor.firstChild);
+            mensajesContenedor.scrollTop += mensajesContenedor.scrollHeight - alturaPrevia;
+        }
+    } catch (error) {
+        console.error('Error cargando mensajes anteriores:', error);
+    } finally {
+        cargandoAnteriores = false;
+    }
+}
+
+mensajesContenedor.addEventListener('scroll', () => {
+    if (mensajesContenedor.scrollTop < 80) {
+        cargarMensajesAnteriores();
+    }
+});
+
+function crearElementoMensaje(msg) {
+    const div = document.createElement('div');
+    const esEnviado = msg.remitente_id === currentUser.id;
+    div.className = `mensaje ${esEnviado ? 'enviado' : 'recibido'}`;
+    if (msg.id) div.dataset.id = msg.id;
+    if (esEnviado && msg.leido) div.classList.add('leido');
+    else if (esEnviado && msg.entregado) div.classList.add('entregado');
+    
+    const fecha = new Date(msg.fecha);
+    const hora = fecha.toLocaleTimeString('es-ES', { hour: '2-digit', minute: '2-digit' });
+    
+    div.innerHTML = `
+        <div>${msg.mensaje}</div>
+        <div class="mensaje-hora">${hora}</div>
+    `;
+    return div;
+}
+
 // Renderizar mensajes
 function renderMensajes(mensajes) {
     mensajesContenedor.innerHTML = '';
@@ -130,19 +264,7 @@ function renderMensajes(mensajes) {
     }
     
     mensajes.forEach(msg => {
-        const div = document.createElement('div');
-        const esEnviado = msg.remitente_id === currentUser.id;
-        div.className = `mensaje ${esEnviado ? 'enviado' : 'recibido'}`;
-        
-        const fecha = new Date(msg.fecha);
-        const hora = fecha.toLocaleTimeString('es-ES', { hour: '2-digit', minute: '2-digit' });
-        
-        div.innerHTML = `
-            <div>${msg.mensaje}</div>
-            <div class="mensaje-hora">${hora}</div>
-        `;
-        
-        mensajesContenedor.appendChild(div);
+        mensajesContenedor.appendChild(crearElementoMensaje(msg));
     });
     
     // Scroll al final
@@ -155,35 +277,43 @@ function enviarMensaje() {
     if (!mensaje || !currentChat) return;
     
     // Crear objeto de mensaje para mostrar inmediatamente
+    const clientId = `${currentUser.id}-${Date.now()}-${Math.random().toString(36).slice(2, 8)}`;
     const mensajeData = {
         remitente_id: currentUser.id,
         destinatario_id: currentChat.id,
         mensaje: mensaje,
-        fecha: new Date().toISOString()
+        fecha: new Date().toISOString(),
+        client_id: clientId
     };
     
-    // Mostrar el mensaje inmediatamente en la UI
-    agregarMensajeALaVista(mensajeData);
+    // Mostrar el mensaje inmediatamente en la UI, pendiente hasta que se guarde
+    const div = agregarMensajeALaVista(mensajeData);
+    if (div) div.classList.add('pendiente');
     
-    // Enviar al servidor
+    // Enviar al servidor; el ack trae el id asignado o el motivo del rechazo
     socket.emit('send_private_message', {
-        remitenteId: currentUser.id,
         destinatarioId: currentChat.id,
-        mensaje: mensaje
+        mensaje: mensaje,
+        clientId: clientId
+    }, (respuesta) => {
+        if (div && respuesta && respuesta.success) {
+            div.dataset.id = respuesta.id;
+        } else if (div && respuesta && !respuesta.success) {
+            div.classList.remove('pendiente');
+            div.classList.add('error');
+            div.title = respuesta.error || 'No se pudo enviar';
+        }
     });
     
     messageInput.value = '';
     
     // Detener indicador de escritura
     socket.emit('stop_typing_private', {
-        userId: currentUser.id,
         destinatarioId: currentChat.id
     });
     
-    // Actualizar conversaciones después de un breve delay
-    setTimeout(() => {
-        cargarConversaciones();
-    }, 100);
+    // La bandeja se actualiza con los cambios cuando el mensaje quede guardado
+    programarSync();
 }
 
 sendBtn.addEventListener('click', enviarMensaje);
@@ -198,13 +328,11 @@ messageInput.addEventListener('keypress', (e) => {
     // Indicador de escritura
     clearTimeout(typingTimer);
     socket.emit('typing_private', {
-        userId: currentUser.id,
         destinatarioId: currentChat.id
     });
     
     typingTimer = setTimeout(() => {
         socket.emit('stop_typing_private', {
-            userId: currentUser.id,
             destinatarioId: currentChat.id
         });
     }, 1000);
@@ -217,7 +345,7 @@ socket.on('new_private_message', (data) => {
         agregarMensajeALaVista(data);
         marcarComoLeidos(data.remitente_id);
     }
-    cargarConversaciones();
+    programarSync();
 });
 
 // Mensaje enviado por el usuario actual
@@ -225,22 +353,73 @@ socket.on('message_sent', (data) => {
     if (currentChat && currentChat.id === data.destinatario_id) {
         agregarMensajeALaVista(data);
     }
-    cargarConversaciones();
+    programarSync();
+});
+
+// El servidor confirma que el mensaje ya quedó guardado en la base
+socket.on('private_message_saved', (data) => {
+    const div = mensajesContenedor.querySelector(`.mensaje[data-client-id="${data.client_id}"]`);
+    if (!div) return;
+    div.classList.remove('pendiente');
+    if (!data.success) {
+        div.classList.add('error');
+        div.title = data.error || 'No se pudo guardar';
+    }
+    programarSync();
 });
 
-socket.on('user_typing_private', (data) => {
-    if (currentChat && data.userId === currentChat.id) {
+// Quiénes me están escribiendo (ids), unidos por worker de origen
+const escribiendoPorOrigen = {};
+
+socket.on('private_typing', (data) => {
+    escribiendoPorOrigen[data.origen] = data.userIds || [];
+    const escribiendo = Object.values(escribiendoPorOrigen).flat();
+    if (currentChat && escribiendo.includes(currentChat.id)) {
         document.getElementById('typingUsername').textContent = currentChat.nombre;
         document.getElementById('typingIndicator').classList.remove('hidden');
+    } else {
+        document.getElementById('typingIndicator').classList.add('hidden');
     }
 });
 
-socket.on('user_stop_typing_private', (data) => {
-    if (currentChat && data.userId === currentChat.id) {
-        document.getElementById('typingIndicator').classList.add('hidden');
+// Recibos en lote: ids entregados y, por lector, el último id que leyó
+socket.on('private_receipts', (data) => {
+    (data.entregados || []).forEach(id => {
+        const div = mensajesContenedor.querySelector(`.mensaje.enviado[data-id="${id}"]`);
+        if (div && !div.classList.contains('leido')) div.classList.add('entregado');
+    });
+    const ultimoLeido = currentChat && (data.leidos || {})[currentChat.id];
+    if (ultimoLeido) {
+        mensajesContenedor.querySelectorAll('.mensaje.enviado[data-id]').forEach(div => {
+            if (Number(div.dataset.id) <= ultimoLeido) {
+                div.classList.remove('entregado');
+                div.classList.add('leido');
+            }
+        });
     }
 });
 
+// Lo que llegó sin ninguna sesión abierta, en un solo frame al unirse
+socket.on('pending_private_messages', (data, ack) => {
+    if (ack) ack();
+    const mensajes = data.mensajes || [];
+    const delChatActual = mensajes.filter(m => currentChat && m.remitente_id === currentChat.id);
+    delChatActual.forEach(agregarMensajeALaVista);
+    if (delChatActual.length) marcarComoLeidos(currentChat.id);
+    const otros = mensajes.length - delChatActual.length;
+    if (otros > 0) {
+        mostrarNotificacionToast(`Tienes ${otros} mensaje(s) nuevo(s)`);
+    }
+    programarSync();
+    if (data.mas) socket.emit('join_private_chat', {});
+});
+
+// Al reconectar el socket tiene otro sid: volver a registrarse y recibir pendientes
+socket.io.on('reconnect', () => {
+    socket.emit('join_private_chat', {});
+    programarSync();
+});
+
 // Marcar mensajes como leídos
 async function marcarComoLeidos(destinatarioId) {
     try {
@@ -248,7 +427,6 @@ async function marcarComoLeidos(destinatarioId) {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({
-                usuarioId: currentUser.id,
                 destinatarioId: destinatarioId
             })
         });
@@ -275,11 +453,12 @@ modalNuevoChat.addEventListener('click', (e) => {
 // Cargar usuarios disponibles
 async function cargarUsuariosDisponibles() {
     try {
-        const response = await fetch(`/api/usuarios?exclude=${currentUser.id}`);
+        // Lista completa (la misma para todos, el navegador la revalida por ETag)
+        const response = await fetch('/api/usuarios');
         const data = await response.json();
         
         if (data.success) {
-            renderUsuariosDisponibles(data.usuarios);
+            renderUsuariosDisponibles(data.usuarios.filter(u => u.id !== currentUser.id));
         }
     } catch (error) {
         console.error('Error cargando usuarios:', error);
@@ -433,18 +612,16 @@ function mostrarNotificacion(mensaje, conversacion) {
 
 // Función mejorada para agregar mensajes
 function agregarMensajeALaVista(data) {
-    // Verificar si el mensaje ya existe para evitar duplicados
-    const mensajesExistentes = mensajesContenedor.querySelectorAll('.mensaje');
-    for (let msg of mensajesExistentes) {
-        if (msg.textContent.includes(data.mensaje)) {
-            console.log('Mensaje duplicado detectado, ignorando');
-            return;
-        }
+    // El mismo mensaje puede llegar en vivo y otra vez como pendiente
+    if (data.id && mensajesContenedor.querySelector(`.mensaje[data-id="${data.id}"]`)) {
+        return;
     }
     
     const div = document.createElement('div');
     const esEnviado = data.remitente_id === currentUser.id;
     div.className = `mensaje ${esEnviado ? 'enviado' : 'recibido'}`;
+    if (data.id) div.dataset.id = data.id;
+    if (data.client_id) div.dataset.clientId = data.client_id;
     
     const fecha = new Date(data.fecha || new Date());
     const hora = fecha.toLocaleTimeString('es-ES', { hour: '2-digit', minute: '2-digit' });
@@ -456,17 +633,20 @@ function agregarMensajeALaVista(data) {
     
     mensajesContenedor.appendChild(div);
     mensajesContenedor.scrollTop = mensajesContenedor.scrollHeight;
+    return div;
 }
 // Evento para mensajes enviados por mí
 socket.on('message_sent', (data) => {
     if (currentChat && data.destinatario_id === currentChat.id) {
         agregarMensajeALaVista(data);
     }
-    cargarConversaciones();
+    programarSync();
 });
 
 // Evento para mensajes recibidos de otros
-socket.on('new_private_message', (data) => {
+socket.on('new_private_message', (data, ack) => {
+    // El ack le confirma al servidor que llegó (recibo de entrega)
+    if (ack) ack();
     // Solo procesar mensajes recibidos de otros
     if (data.remitente_id === currentUser.id) return;
     
@@ -479,7 +659,7 @@ socket.on('new_private_message', (data) => {
             mostrarNotificacion(data, conversacion);
         }
     }
-    cargarConversaciones();
+    programarSync();
 });
 
 // Solicitar permisos para notificaciones
@@ -503,7 +683,6 @@ window.addEventListener('beforeunload', () => {
     }
     if (currentChat) {
         socket.emit('stop_typing_private', {
-            userId: currentUser.id,
             destinatarioId: currentChat.id
         });
     }
@@ -515,13 +694,11 @@ messageInput.addEventListener('input', (e) => {
     if (e.target.value.trim()) {
         clearTimeout(typingTimer);
         socket.emit('typing_private', {
-            userId: currentUser.id,
             destinatarioId: currentChat.id
         });
         
         typingTimer = setTimeout(() => {
             socket.emit('stop_typing_private', {
-                userId: currentUser.id,
                 destinatarioId: currentChat.id
             });
         }, 1000);
@@ -6,6 +6,9 @@ let currentUser = null;
 let currentRoom = null;
 let isTyping = false;
 let typingTimer = null;
+let typingEnviado = 0;
+let cursorAnterior = null;     // historial más viejo que lo mostrado
+let cargandoAnteriores = false;
 
 // Elementos DOM
 const joinSection = document.getElementById('joinSection');
@@ -58,10 +61,11 @@ function configurarEventListeners() {
             return;
         }
         
-        // Indicador de escritura
-        if (!isTyping) {
+        // Indicador de escritura; se renueva cada 2s porque el servidor lo vence a los 5s
+        if (!isTyping || Date.now() - typingEnviado > 2000) {
             socket.emit('typing', { is_typing: true, room: currentRoom });
             isTyping = true;
+            typingEnviado = Date.now();
         }
         
         clearTimeout(typingTimer);
@@ -161,6 +165,7 @@ function cerrarSesion() {
         salirDeSala();
     }
     
+    fetch('/api/logout', { method: 'POST', keepalive: true });
     localStorage.removeItem('user');
     window.location.href = '/login';
 }
@@ -190,17 +195,48 @@ socket.on('new_message', (data) => {
     agregarMensajeChat(data, isOwnMessage);
 });
 
-// Usuarios en la sala
+// Varios mensajes juntos (difusión por lotes): un solo reflow y un solo scroll
+socket.on('new_messages', (data) => {
+    const fragmento = document.createDocumentFragment();
+    data.mensajes.forEach(msg => {
+        fragmento.appendChild(crearElementoMensaje(msg, msg.username === currentUser.nombre));
+    });
+    messagesContainer.appendChild(fragmento);
+    scrollToBottom();
+    typingIndicator.classList.add('hidden');
+});
+
+// Historial reciente de la sala (buffer del servidor), al entrar
+socket.on('room_history', (data) => {
+    cursorAnterior = data.anterior;
+    insertarMensajesArriba(data.mensajes);
+    scrollToBottom();
+});
+
+// Usuarios en la sala (snapshot completo al entrar)
 socket.on('room_users', (data) => {
     console.log('👥 Usuarios en sala:', data.users);
     userCountSpan.textContent = `${data.users.length} usuarios`;
 });
 
-// Usuario escribiendo
-socket.on('user_typing', (data) => {
-    console.log('⌨️ Usuario escribiendo:', data);
-    if (data.is_typing) {
-        typingText.textContent = data.username;
+// Deltas: el servidor ya manda cuántos quedan en la sala
+socket.on('user_joined', (data) => {
+    userCountSpan.textContent = `${data.count} usuarios`;
+});
+
+socket.on('user_left', (data) => {
+    userCountSpan.textContent = `${data.count} usuarios`;
+});
+
+// Usuarios escribiendo: lista completa de la sala, unida por worker de origen
+const typingPorOrigen = {};
+
+socket.on('room_typing', (data) => {
+    typingPorOrigen[data.origen] = data.users || [];
+    const otros = [...new Set(Object.values(typingPorOrigen).flat())]
+        .filter(u => u !== currentUser.nombre);
+    if (otros.length) {
+        typingText.textContent = otros.join(', ');
         typingIndicator.classList.remove('hidden');
     } else {
         typingIndicator.classList.add('hidden');
@@ -224,11 +260,11 @@ function agregarMensajeSistema(mensaje) {
 }
 
 // Agregar mensaje de chat
-function agregarMensajeChat(data, isOwnMessage) {
+function crearElementoMensaje(data, isOwnMessage) {
     const div = document.createElement('div');
     div.className = `message ${isOwnMessage ? 'own' : 'other'}`;
     
-    const tiempo = new Date().toLocaleTimeString('es-ES', { 
+    const tiempo = new Date(data.timestamp || Date.now()).toLocaleTimeString('es-ES', { 
         hour: '2-digit', 
         minute: '2-digit' 
     });
@@ -240,14 +276,56 @@ function agregarMensajeChat(data, isOwnMessage) {
         </div>
         <div class="message-text">${escapeHtml(data.message)}</div>
     `;
-    
-    messagesContainer.appendChild(div);
+    return div;
+}
+
+function agregarMensajeChat(data, isOwnMessage) {
+    messagesContainer.appendChild(crearElementoMensaje(data, isOwnMessage));
     scrollToBottom();
     
     // Ocultar indicador de escritura
     typingIndicator.classList.add('hidden');
 }
 
+// Mensajes más viejos arriba, manteniendo la posición visual
+function insertarMensajesArriba(mensajes) {
+    const alturaPrevia = messagesContainer.scrollHeight;
+    const fragmento = document.createDocumentFragment();
+    mensajes.forEach(msg => {
+        fragmento.appendChild(crearElementoMensaje(msg, msg.username === currentUser.nombre));
+    });
+    messagesContainer.insertBefore(fragmento, messagesContainer.firstChild);
+    messagesContainer.scrollTop += messagesContainer.scrollHeight - alturaPrevia;
+}
+
+// Páginas anteriores desde /api/salas/<sala>/mensajes al llegar arriba
+async function cargarMensajesAnteriores() {
+    if (!currentRoom || !cursorAnterior || cargandoAnteriores) return;
+    cargandoAnteriores = true;
+    const sala = currentRoom;
+    
+    try {
+        const response = await fetch(`/api/salas/${encodeURIComponent(sala)}/mensajes?before=${encodeURIComponent(cursorAnterior)}`);
+        const data = await response.json();
+        
+        // Ignorar la respuesta si mientras tanto se cambió de sala
+        if (data.success && currentRoom === sala) {
+            cursorAnterior = data.anterior;
+            insertarMensajesArriba(data.mensajes);
+        }
+    } catch (error) {
+        console.error('Error cargando mensajes anteriores:', error);
+    } finally {
+        cargandoAnteriores = false;
+    }
+}
+
+messagesContainer.addEventListener('scroll', () => {
+    if (messagesContainer.scrollTop < 80) {
+        cargarMensajesAnteriores();
+    }
+});
+
 // Scroll al final
 function scrollToBottom() {
     messagesContainer.scrollTop = messagesContainer.scrollHeight;
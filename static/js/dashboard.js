@@ -26,6 +26,7 @@ function configurarEventos() {
 }
 
 function cerrarSesion() {
+    fetch('/api/logout', { method: 'POST', keepalive: true });
     localStorage.removeItem('user');
     window.location.href = '/login';
 }
\ No newline at end of file
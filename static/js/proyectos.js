@@ -3,12 +3,23 @@
 // Variables globales
 let currentUser = null;
 let proyectos = [];
+// Cursor de la página siguiente del feed (null = no hay más)
+let cursorSiguiente = null;
+let filtroTimer = null;
+// Último seq del registro de cambios ya aplicado (ver /api/sync)
+let seqSync = null;
+// Las novedades llegan por el socket; la sincronización queda de respaldo
+const INTERVALO_SYNC_MS = 60000;
+const socketProyectos = io('/proyectos');
 
 // Inicialización
-document.addEventListener('DOMContentLoaded', function() {
+document.addEventListener('DOMContentLoaded', async function() {
     cargarUsuarioActual();
-    cargarProyectos();
     configurarEventos();
+    // Seq antes de la carga completa: desde ahí se piden sólo los cambios
+    await iniciarSync();
+    cargarProyectos();
+    setInterval(sincronizar, INTERVALO_SYNC_MS);
 });
 
 // Cargar usuario desde localStorage
@@ -30,16 +41,33 @@ function configurarEventos() {
     
     // Logout
     document.getElementById('logoutBtn').addEventListener('click', cerrarSesion);
+    
+    // Paginación y filtros del feed
+    document.getElementById('loadMoreBtn').addEventListener('click', () => cargarProyectos(false));
+    document.getElementById('filterArea').addEventListener('change', () => cargarProyectos());
+    document.getElementById('filterTech').addEventListener('input', () => {
+        clearTimeout(filtroTimer);
+        filtroTimer = setTimeout(() => cargarProyectos(), 300);
+    });
 }
 
-// Cargar proyectos desde la API
-async function cargarProyectos() {
+// Cargar proyectos desde la API; reiniciar=false agrega la página siguiente
+async function cargarProyectos(reiniciar = true) {
+    const params = new URLSearchParams();
+    const area = document.getElementById('filterArea').value;
+    const tecnologia = document.getElementById('filterTech').value.trim();
+    if (area) params.set('area', area);
+    if (tecnologia) params.set('tecnologia', tecnologia);
+    if (!reiniciar && cursorSiguiente) params.set('cursor', cursorSiguiente);
+    
     try {
-        const response = await fetch('/api/proyectos');
+        // El servidor responde con ETag; el navegador revalida y reutiliza su copia si no cambió
+        const response = await fetch(`/api/proyectos?${params}`);
         const data = await response.json();
         
         if (data.success) {
-            proyectos = data.proyectos;
+            proyectos = reiniciar ? data.proyectos : proyectos.concat(data.proyectos);
+            cursorSiguiente = data.siguiente;
             renderProyectos();
         } else {
             mostrarError('Error al cargar proyectos');
@@ -50,9 +78,159 @@ async function cargarProyectos() {
     }
 }
 
+// Seq actual del registro de cambios
+async function iniciarSync() {
+    try {
+        const response = await fetch('/api/sync');
+        const data = await response.json();
+        if (data.success) seqSync = data.seq;
+    } catch (error) {
+        console.error('Error iniciando sincronización:', error);
+    }
+}
+
+// Aplica los cambios desde seqSync en vez de volver a pedir el feed
+async function sincronizar() {
+    if (seqSync === null || document.hidden) return;
+    try {
+        let data;
+        do {
+            const response = await fetch(`/api/sync?since=${seqSync}`);
+            data = await response.json();
+            if (!data.success) return;
+            if (data.reiniciar) {
+                // El registro ya se compactó: recarga completa
+                seqSync = data.seq;
+                await cargarProyectos();
+                return;
+            }
+            aplicarCambios(data);
+            seqSync = data.seq;
+        } while (data.mas);
+    } catch (error) {
+        console.error('Error sincronizando:', error);
+    }
+}
+
+// Mismo criterio que los filtros del servidor
+function coincideConFiltros(proyecto) {
+    const area = document.getElementById('filterArea').value;
+    const tecnologia = document.getElementById('filterTech').value.replace(/ /g, '').toLowerCase();
+    if (area && proyecto.usuario_area !== area) return false;
+    if (!tecnologia) return true;
+    const tecnologias = `,${(proyecto.tecnologias || '').replace(/ /g, '').toLowerCase()},`;
+    return tecnologias.includes(`,${tecnologia},`);
+}
+
+// Orden del feed: fecha_publicacion y id descendentes
+function compararProyectos(a, b) {
+    return b.fecha_publicacion.localeCompare(a.fecha_publicacion) || b.id - a.id;
+}
+
+function aplicarCambios(data) {
+    let reordenar = false;
+    const borrados = new Set(data.borrados.proyectos);
+    if (proyectos.some(p => borrados.has(p.id))) {
+        proyectos = proyectos.filter(p => !borrados.has(p.id));
+        reordenar = true;
+    }
+    
+    data.proyectos.forEach(proyecto => {
+        reordenar = incorporarProyecto(proyecto) || reordenar;
+    });
+    
+    data.votos.forEach(voto => {
+        const actual = proyectos.find(p => p.id === voto.proyecto_id);
+        if (actual) {
+            actual.user_vote = voto.tipo;
+            actualizarVotos(actual);
+        }
+    });
+    
+    if (reordenar) {
+        proyectos.sort(compararProyectos);
+        renderProyectos();
+    }
+    
+    data.comentarios.forEach(agregarComentarioALaVista);
+    data.borrados.comentarios.forEach(id => {
+        const div = document.querySelector(`[data-comment-id="${id}"]`);
+        if (div) div.remove();
+    });
+}
+
+// Parchea un proyecto ya cargado o lo agrega; true si hay que volver a renderizar
+function incorporarProyecto(proyecto) {
+    const actual = proyectos.find(p => p.id === proyecto.id);
+    if (actual) {
+        // Cambio de un proyecto visible (p. ej. votos): sólo se parchea su tarjeta
+        Object.assign(actual, proyecto);
+        actualizarVotos(actual);
+        return false;
+    }
+    if (coincideConFiltros(proyecto) &&
+        (!cursorSiguiente || !proyectos.length ||
+         compararProyectos(proyecto, proyectos[proyectos.length - 1]) < 0)) {
+        // Nuevo dentro del rango ya cargado; los más viejos llegan al paginar
+        proyectos.push(proyecto);
+        return true;
+    }
+    return false;
+}
+
+// Comentario nuevo en la sección del proyecto, si está cargada y no lo tiene
+function agregarComentarioALaVista(comentario) {
+    const lista = document.getElementById(`comments-list-${comentario.proyecto_id}`);
+    if (!lista || lista.querySelector(`[data-comment-id="${comentario.id}"]`)) return;
+    // Sin cargar todavía: al abrirla se piden todos
+    if (lista.parentElement.style.display === 'none' && !lista.children.length) return;
+    if (!lista.querySelector('.comment')) lista.innerHTML = '';
+    lista.insertAdjacentHTML('beforeend', crearHtmlComentario(comentario));
+}
+
+// Novedades en vivo: se parchea la vista en lugar de recargar el feed
+socketProyectos.on('project_created', (proyecto) => {
+    if (incorporarProyecto(proyecto)) {
+        proyectos.sort(compararProyectos);
+        renderProyectos();
+    }
+});
+
+// Contadores agrupados: [[id, likes, dislikes], ...]
+socketProyectos.on('vote_counts', (data) => {
+    data.votos.forEach(([id, likes, dislikes]) => {
+        const proyecto = proyectos.find(p => p.id === id);
+        if (proyecto) {
+            proyecto.likes = likes;
+            proyecto.dislikes = dislikes;
+            actualizarVotos(proyecto);
+        }
+    });
+});
+
+socketProyectos.on('comment_added', agregarComentarioALaVista);
+
+// Lo que pasó mientras el socket estuvo caído llega por /api/sync
+socketProyectos.io.on('reconnect', sincronizar);
+
+// Contadores y voto propio de una tarjeta ya renderizada
+function actualizarVotos(proyecto) {
+    const projectCard = document.querySelector(`[data-project-id="${proyecto.id}"]`);
+    if (!projectCard) return;
+    const likeBtn = projectCard.querySelector('.like-btn');
+    const dislikeBtn = projectCard.querySelector('.dislike-btn');
+    likeBtn.querySelector('.vote-count').textContent = proyecto.likes || 0;
+    dislikeBtn.querySelector('.vote-count').textContent = proyecto.dislikes || 0;
+    if (proyecto.user_vote !== undefined) {
+        likeBtn.classList.toggle('active', proyecto.user_vote === 'like');
+        dislikeBtn.classList.toggle('active', proyecto.user_vote === 'dislike');
+    }
+}
+
 // Renderizar proyectos en el feed
 function renderProyectos() {
     const feed = document.getElementById('projectsFeed');
+    document.getElementById('loadMoreBtn').style.display = cursorSiguiente ? 'block' : 'none';
     
     if (proyectos.length === 0) {
         feed.innerHTML = `
@@ -167,7 +345,6 @@ async function votarProyecto(projectId, voteType) {
                 'Content-Type': 'application/json'
             },
             body: JSON.stringify({
-                usuario_id: currentUser.id,
                 tipo: voteType
             })
         });
@@ -176,18 +353,13 @@ async function votarProyecto(projectId, voteType) {
         
         if (data.success) {
             // Actualizar los contadores en la UI
-            const projectCard = document.querySelector(`[data-project-id="${projectId}"]`);
-            const likeBtn = projectCard.querySelector('.like-btn');
-            const dislikeBtn = projectCard.querySelector('.dislike-btn');
-            const likeCount = likeBtn.querySelector('.vote-count');
-            const dislikeCount = dislikeBtn.querySelector('.vote-count');
-            
-            likeCount.textContent = data.likes;
-            dislikeCount.textContent = data.dislikes;
-            
-            // Actualizar estado activo
-            likeBtn.classList.toggle('active', data.user_vote === 'like');
-            dislikeBtn.classList.toggle('active', data.user_vote === 'dislike');
+            const proyecto = proyectos.find(p => p.id === Number(projectId));
+            if (proyecto) {
+                Object.assign(proyecto, {
+                    likes: data.likes, dislikes: data.dislikes, user_vote: data.user_vote
+                });
+                actualizarVotos(proyecto);
+            }
             
         } else {
             mostrarError(data.message);
@@ -225,7 +397,6 @@ async function crearProyecto(e) {
                 'Content-Type': 'application/json'
             },
             body: JSON.stringify({
-                usuario_id: currentUser.id,
                 titulo: titulo,
                 descripcion: descripcion,
                 github_url: githubUrl,
@@ -237,8 +408,8 @@ async function crearProyecto(e) {
         
         if (data.success) {
             form.reset();
+            // El proyecto nuevo llega por project_created, sin recargar el feed
             mostrarExito('Proyecto publicado exitosamente');
-            cargarProyectos(); // Recargar el feed
         } else {
             mostrarError(data.message);
         }
@@ -285,15 +456,19 @@ function renderComentarios(projectId, comentarios) {
         return;
     }
     
-    commentsList.innerHTML = comentarios.map(comentario => `
-        <div class="comment">
+    commentsList.innerHTML = comentarios.map(crearHtmlComentario).join('');
+}
+
+function crearHtmlComentario(comentario) {
+    return `
+        <div class="comment" data-comment-id="${comentario.id}">
             <div class="comment-header">
                 <span class="comment-user">${escapeHtml(comentario.usuario_nombre)}</span>
                 <span class="comment-date">${new Date(comentario.fecha).toLocaleDateString('es-ES')}</span>
             </div>
             <div class="comment-text">${escapeHtml(comentario.comentario)}</div>
         </div>
-    `).join('');
+    `;
 }
 
 // Agregar nuevo comentario
@@ -318,7 +493,6 @@ async function agregarComentario(projectId) {
                 'Content-Type': 'application/json'
             },
             body: JSON.stringify({
-                usuario_id: currentUser.id,
                 comentario: comentario
             })
         });
@@ -327,21 +501,8 @@ async function agregarComentario(projectId) {
         
         if (data.success) {
             commentInput.value = '';
-            // Agregar el nuevo comentario a la lista
-            const commentsList = document.getElementById(`comments-list-${projectId}`);
-            const nuevoComentario = data.comentario;
-            
-            const commentHtml = `
-                <div class="comment">
-                    <div class="comment-header">
-                        <span class="comment-user">${escapeHtml(nuevoComentario.usuario_nombre)}</span>
-                        <span class="comment-date">${new Date(nuevoComentario.fecha).toLocaleDateString('es-ES')}</span>
-                    </div>
-                    <div class="comment-text">${escapeHtml(nuevoComentario.comentario)}</div>
-                </div>
-            `;
-            
-            commentsList.innerHTML += commentHtml;
+            // Agregar el nuevo comentario a la lista (si ya llegó por el socket no se repite)
+            agregarComentarioALaVista(data.comentario);
             
         } else {
             mostrarError(data.message);
@@ -369,6 +530,7 @@ function mostrarExito(mensaje) {
 }
 
 function cerrarSesion() {
+    fetch('/api/logout', { method: 'POST', keepalive: true });
     localStorage.removeItem('user');
     window.location.href = '/login';
 }
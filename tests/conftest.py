@@ -0,0 +1,56 @@
+"""Base temporal sembrada y app.py importado sobre ella.
+
+app.py lee la configuración al importarse, así que todos los tests que lo
+usan comparten una misma base por sesión de pytest.
+"""
+import os
+import sqlite3
+import sys
+
+import pytest
+
+RAIZ = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.join(RAIZ, "benchmarks"))
+
+from datos import sembrar  # noqa: E402
+from db import migrar  # noqa: E402
+
+
+@pytest.fixture
+def ruta_migrada(tmp_path):
+    """Base vacía con todas las migraciones, propia de cada test"""
+    ruta = str(tmp_path / "migrada.db")
+    conexion = sqlite3.connect(ruta)
+    migrar(conexion)
+    conexion.close()
+    return ruta
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    carpeta = tmp_path_factory.mktemp("app")
+    ruta = str(carpeta / "app.db")
+    conexion = sqlite3.connect(ruta)
+    sembrar(conexion, usuarios=20, proyectos=30, votos=50, comentarios=50, mensajes=2000)
+    conexion.close()
+
+    os.environ.update(
+        TECHPAINT_DB=ruta,
+        TECHPAINT_ARCHIVO_DIR=str(carpeta / "archivo"),
+        TECHPAINT_ARCHIVO_INTERVALO="0",
+        TECHPAINT_LOG_NIVEL="WARNING",
+        TECHPAINT_SECRETO="secreto-de-pruebas",
+    )
+    os.environ.pop("TECHPAINT_MQ", None)
+    import app as modulo
+    return modulo
+
+
+@pytest.fixture
+def cliente(app):
+    return app.app.test_client()
+
+
+def encabezados(app, usuario_id):
+    return {"Authorization": f"Bearer {app.sesiones.emitir(usuario_id)}"}
@@ -0,0 +1,129 @@
+"""Archivo de mensajes privados en particiones por año."""
+from datetime import datetime, timezone
+
+import pytest
+
+from archivo import COLUMNAS, ArchivoMensajes
+from pool import PoolConexiones
+
+AHORA = datetime(2025, 6, 1, tzinfo=timezone.utc)
+FINAL = "9999-12-31 23:59:59"
+
+
+@pytest.fixture
+def conn(ruta_migrada):
+    pool = PoolConexiones(ruta_migrada)
+    with pool.conexion() as conn:
+        yield conn
+    pool.cerrar()
+
+
+@pytest.fixture
+def archivo(tmp_path):
+    return ArchivoMensajes(str(tmp_path / "archivo"), dias=180)
+
+
+def enviar(conn, remitente, destinatario, fecha, mensaje="hola"):
+    return conn.execute("""
+        INSERT INTO mensajes_privados (remitente_id, destinatario_id, mensaje, leido, fecha, entregado)
+        VALUES (?, ?, ?, 1, ?, 1)
+    """, (remitente, destinatario, mensaje, fecha)).lastrowid
+
+
+@pytest.fixture
+def archivado(conn, archivo):
+    conn.execute("PRAGMA foreign_keys = OFF")
+    for fecha in ("2020-03-01 10:00:00", "2020-04-01 10:00:00"):
+        enviar(conn, 1, 2, fecha)
+        enviar(conn, 2, 1, fecha)
+    for anio in (2021, 2022):
+        enviar(conn, 3, 4, f"{anio}-05-01 10:00:00")
+        enviar(conn, 4, 3, f"{anio}-05-02 10:00:00")
+    # El último de cada conversación queda en la base viva
+    for remitente, destinatario in ((1, 2), (2, 1), (3, 4), (4, 3)):
+        enviar(conn, remitente, destinatario, "2025-05-30 10:00:00")
+    conn.commit()
+    assert archivo.archivar(conn, ahora=AHORA) == 8
+    return conn
+
+
+def nombres(particiones):
+    return [fila["particion"] for fila in particiones]
+
+
+def test_particiones_solo_de_la_conversacion(archivado, archivo):
+    assert nombres(archivo.particiones(archivado, 1, 2, FINAL, True)) == ["2020"]
+    assert nombres(archivo.particiones(archivado, 4, 3, FINAL, True)) == ["2022", "2021"]
+    assert nombres(archivo.particiones(archivado, 3, 4, "2022-01-01 00:00:00", True)) == ["2021"]
+    assert nombres(archivo.particiones(archivado, 3, 4, "2021-06-01 00:00:00", False)) == ["2022"]
+    assert archivo.particiones(archivado, 1, 5, FINAL, True) == []
+
+    rango = archivo.particiones(archivado, 1, 2, FINAL, True)[0]
+    assert (rango["desde"], rango["hasta"]) == ("2020-03-01 10:00:00", "2020-04-01 10:00:00")
+
+
+def test_particion_sin_indexar_se_recorre_hasta_indexarla(archivado, archivo):
+    # Como una partición archivada antes de archivo_conversaciones
+    archivado.execute("DELETE FROM archivo_conversaciones WHERE particion = '2021'")
+    archivado.execute("UPDATE archivos SET indexada = 0 WHERE particion = '2021'")
+    archivado.commit()
+    assert nombres(archivo.particiones(archivado, 1, 2, FINAL, True)) == ["2021", "2020"]
+
+    assert archivo.indexar(archivado) == 1
+    assert nombres(archivo.particiones(archivado, 1, 2, FINAL, True)) == ["2020"]
+    assert nombres(archivo.particiones(archivado, 3, 4, FINAL, True)) == ["2022", "2021"]
+
+
+def test_archivar_mueve_sin_registrar_bajas(archivado, archivo, tmp_path):
+    vivos = archivado.execute("SELECT COUNT(*) FROM mensajes_privados").fetchone()[0]
+    assert vivos == 4   # los últimos de cada conversación
+    assert sorted(p.name for p in (tmp_path / "archivo").glob("*.db")) == [
+        "mensajes_2020.db", "mensajes_2021.db", "mensajes_2022.db"]
+    assert [tuple(fila) for fila in archivado.execute(
+        "SELECT particion, filas FROM archivos ORDER BY particion")] == [
+        ("2020", 4), ("2021", 2), ("2022", 2)]
+    assert archivado.execute(
+        "SELECT COUNT(*) FROM cambios WHERE operacion = 'baja'").fetchone()[0] == 0
+    # Una segunda corrida no encuentra nada más que mover
+    assert archivo.archivar(archivado, ahora=AHORA) == 0
+
+
+def historial(app, conn, usuario_id, contacto_id, limite):
+    """Todas las páginas hacia atrás desde la más reciente, como las pide el cliente"""
+    paginas, cursor = [], app.CURSOR_FINAL
+    while True:
+        filas = [fila for lote in app.leer_pagina_mensajes(
+            conn, usuario_id, contacto_id, limite, cursor, True) for fila in lote]
+        if not filas:
+            return paginas
+        paginas.append([(fila["fecha"], fila["id"]) for fila in filas])
+        cursor = (filas[0]["fecha"], filas[0]["id"])
+
+
+def test_historial_recorre_base_viva_y_particiones(app, archivado, archivo, monkeypatch):
+    monkeypatch.setattr(app, "archivo", archivo)
+    paginas = historial(app, archivado, 3, 4, 3)
+    mensajes = [mensaje for pagina in reversed(paginas) for mensaje in pagina]
+    assert [fecha[:4] for fecha, _ in mensajes] == ["2021", "2021", "2022", "2022", "2025", "2025"]
+    assert mensajes == sorted(mensajes)
+    assert [len(pagina) for pagina in paginas] == [3, 3]
+
+    # Hacia adelante desde el archivo también cruza a la base viva
+    filas = [fila for lote in app.leer_pagina_mensajes(
+        archivado, 4, 3, 10, ("2021-05-01 10:00:00", 0), False) for fila in lote]
+    assert [(fila["fecha"], fila["id"]) for fila in filas] == mensajes
+
+
+def test_fila_repetida_por_un_archivado_cortado_sale_una_vez(app, archivado, archivo,
+                                                             monkeypatch):
+    monkeypatch.setattr(app, "archivo", archivo)
+    # Como si el corte hubiera sido entre la copia y el borrado
+    tabla = archivo.tabla(archivado, {"particion": "2020", "archivo": "mensajes_2020.db"})
+    archivado.execute(f"""
+        INSERT INTO main.mensajes_privados ({COLUMNAS})
+        SELECT {COLUMNAS} FROM {tabla}
+        WHERE fecha = '2020-04-01 10:00:00'
+    """)
+    archivado.commit()
+    ids = [mensaje_id for pagina in historial(app, archivado, 1, 2, 4) for _, mensaje_id in pagina]
+    assert len(ids) == len(set(ids)) == 6
@@ -0,0 +1,83 @@
+"""Registro de cambios de /api/sync: lectura por audiencia, piso y compactación."""
+import sqlite3
+
+import pytest
+
+import cambios
+
+
+@pytest.fixture
+def conn(ruta_migrada):
+    conexion = sqlite3.connect(ruta_migrada)
+    yield conexion
+    conexion.close()
+
+
+def registrar(conn, *filas, fecha="now"):
+    conn.executemany("INSERT INTO cambios (tabla, fila_id, operacion, usuario_id, fecha) "
+                     "VALUES (?, ?, ?, ?, datetime(?))",
+                     [(*fila, fecha) for fila in filas])
+    conn.commit()
+
+
+def test_leer_por_audiencia_con_la_ultima_operacion_de_cada_fila(conn):
+    registrar(conn, ("proyectos", 1, "alta", None), ("mensajes_privados", 5, "alta", 1),
+              ("mensajes_privados", 5, "alta", 2), ("proyectos", 1, "cambio", None))
+
+    assert cambios.leer(conn, 1, 0, 100) == (
+        4, False, {"proyectos": {1: "cambio"}, "mensajes_privados": {5: "alta"}})
+    assert cambios.leer(conn, 3, 0, 100) == (4, False, {"proyectos": {1: "cambio"}})
+    assert cambios.leer(conn, 3, 4, 100) == (4, False, {})
+
+
+def test_leer_con_limite_corta_en_el_ultimo_seq_devuelto(conn):
+    registrar(conn, *[("comentarios", n, "alta", None) for n in range(1, 6)])
+    hasta, mas, leidos = cambios.leer(conn, 1, 0, 2)
+    assert (hasta, mas, leidos) == (2, True, {"comentarios": {1: "alta", 2: "alta"}})
+    assert cambios.leer(conn, 1, hasta, 10) == (
+        5, False, {"comentarios": {3: "alta", 4: "alta", 5: "alta"}})
+
+
+def test_compactar_por_cantidad_sube_el_piso(conn):
+    registrar(conn, *[("comentarios", n, "alta", None) for n in range(1, 11)])
+    assert cambios.compactar(conn, max_filas=3) == 7
+    conn.commit()
+
+    # Piso 8: quien vio hasta el 7 no perdió nada; uno más atrasado recarga todo
+    assert cambios.leer(conn, 1, 7, 100)[0] == 10
+    assert cambios.leer(conn, 1, 6, 100) is None
+
+
+def test_compactar_por_antiguedad_deja_siempre_la_ultima_fila(conn):
+    registrar(conn, *[("comentarios", n, "alta", None) for n in range(1, 4)], fecha="-5 days")
+    registrar(conn, ("comentarios", 4, "alta", None))
+    assert cambios.compactar(conn, horas=72) == 3
+
+    registrar(conn, ("comentarios", 5, "alta", None), fecha="-5 days")
+    conn.execute("DELETE FROM cambios WHERE seq = 4")
+    assert cambios.compactar(conn, horas=72) == 0   # la única que queda marca el piso
+    assert cambios.ultimo_seq(conn) == 5
+
+
+def test_reiniciar_obliga_a_recargar_a_todos(conn):
+    registrar(conn, *[("proyectos", n, "alta", None) for n in range(1, 4)])
+    cambios.reiniciar(conn)
+    conn.commit()
+    assert cambios.leer(conn, 1, 3, 100) is None
+    assert cambios.leer(conn, 1, cambios.ultimo_seq(conn), 100) == (5, False, {})
+
+
+def test_triggers_de_mensajes_privados(conn):
+    conn.execute("PRAGMA foreign_keys = OFF")
+    conn.execute("INSERT INTO mensajes_privados (id, remitente_id, destinatario_id, mensaje) "
+                 "VALUES (7, 1, 2, 'hola')")
+    conn.execute("UPDATE mensajes_privados SET entregado = 1 WHERE id = 7")   # no se registra
+    conn.execute("UPDATE mensajes_privados SET leido = 1 WHERE id = 7")
+    # El archivado borra sin dejar baja
+    conn.execute("INSERT INTO archivando DEFAULT VALUES")
+    conn.execute("DELETE FROM mensajes_privados WHERE id = 7")
+    conn.execute("DELETE FROM archivando")
+    conn.commit()
+
+    filas = conn.execute("SELECT operacion, usuario_id FROM cambios ORDER BY seq").fetchall()
+    assert filas == [("alta", 1), ("alta", 2), ("cambio", 1), ("cambio", 2)]
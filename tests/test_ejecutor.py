@@ -0,0 +1,41 @@
+"""Hilos en los que EjecutorDB corre lecturas y escrituras."""
+import sqlite3
+import threading
+
+import pytest
+
+from ejecutor import EjecutorDB
+
+
+def hilo_actual():
+    return threading.current_thread().name
+
+
+@pytest.mark.parametrize("modo", ["threading", "eventlet"])
+def test_escrituras_en_un_unico_hilo_escritor(modo):
+    ejecutor = EjecutorDB(lectores=2, modo=modo)
+    conn = ejecutor.envolver(sqlite3.connect(":memory:", check_same_thread=False))
+    conn.execute("CREATE TABLE t (x)")
+
+    hilos = set()
+    for x in range(20):
+        conn.execute("INSERT INTO t VALUES (?)", (x,))
+        hilos.add(ejecutor.escribir(conn.conn, hilo_actual))
+        conn.commit()
+    assert hilos == {"db-escritor_0"}
+
+    lector = ejecutor.leer(conn.conn, hilo_actual)
+    assert not lector.startswith("db-escritor")
+    assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 20
+
+
+@pytest.mark.parametrize("modo", ["threading", "eventlet"])
+def test_escribe_con_los_hilos_ya_cerrados(modo):
+    # Como en los atexit que vacían las colas: los executors ya no aceptan trabajo
+    ejecutor = EjecutorDB(lectores=2, modo=modo)
+    conn = ejecutor.envolver(sqlite3.connect(":memory:", check_same_thread=False))
+    ejecutor._escritor.shutdown()
+    conn.execute("CREATE TABLE t (x)")
+    conn.execute("INSERT INTO t VALUES (1)")
+    conn.commit()
+    assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 1
@@ -0,0 +1,107 @@
+"""Escritura diferida de mensajes privados y reserva de ids por bloques."""
+import queue
+import sqlite3
+
+import pytest
+
+from escritura import _FIN, EscrituraDiferida, Secuencia
+from pool import PoolConexiones
+
+
+@pytest.fixture
+def pool(ruta_migrada):
+    pool = PoolConexiones(ruta_migrada)
+    with pool.conexion() as conn:
+        conn.executemany("INSERT INTO usuarios (id, nombre, email, password, area) "
+                         "VALUES (?, ?, ?, 'x', 'backend')",
+                         [(1, "ana", "ana@x"), (2, "beto", "beto@x")])
+        conn.commit()
+    yield pool
+    pool.cerrar()
+
+
+def escritura_sin_socketio(pool, avisos):
+    """EscrituraDiferida con su cola, sin hub: el test corre _bucle a mano"""
+    escritura = EscrituraDiferida(pool, al_guardar=lambda sid, aviso: avisos.append((sid, aviso)))
+    escritura.secuencia = Secuencia(pool, "mensajes_privados")
+    escritura._cola = queue.Queue(escritura.maximo)
+    return escritura
+
+
+def guardados(pool):
+    with pool.conexion() as conn:
+        return [tuple(fila) for fila in conn.execute(
+            "SELECT id, destinatario_id, mensaje FROM mensajes_privados ORDER BY id")]
+
+
+def test_lo_acumulado_se_guarda_en_un_solo_lote(pool):
+    avisos = []
+    escritura = escritura_sin_socketio(pool, avisos)
+    ids = [escritura.encolar(1, 2, f"m{n}", sid="s1")["id"] for n in range(50)]
+    escritura._cola.put(_FIN)
+    escritura._bucle()
+
+    assert [fila[0] for fila in guardados(pool)] == ids
+    metricas = escritura.metricas()
+    assert (metricas["lotes"], metricas["lote_max"], metricas["guardados"]) == (1, 50, 50)
+    assert [aviso["id"] for _, aviso in avisos] == ids
+
+
+def test_un_mensaje_invalido_no_tira_el_lote(pool):
+    avisos = []
+    escritura = escritura_sin_socketio(pool, avisos)
+    bueno = escritura.encolar(1, 2, "hola", sid="s1")
+    malo = escritura.encolar(1, 99, "a nadie", sid="s1")   # viola la FK de destinatario
+    otro = escritura.encolar(2, 1, "chau", sid="s2")
+    escritura._cola.put(_FIN)
+    escritura._bucle()
+
+    assert guardados(pool) == [(bueno["id"], 2, "hola"), (otro["id"], 1, "chau")]
+    resultado = {aviso["id"]: aviso["success"] for _, aviso in avisos}
+    assert resultado == {bueno["id"]: True, malo["id"]: False, otro["id"]: True}
+    assert "error" in next(aviso for _, aviso in avisos if aviso["id"] == malo["id"])
+    assert escritura.metricas()["fallidos"] == 1
+
+
+def test_el_aviso_llega_con_el_mensaje_ya_en_la_base(pool):
+    visto = []
+
+    def al_guardar(sid, aviso):
+        # Otra conexión: sólo ve el mensaje si ya se commiteó
+        conexion = sqlite3.connect(pool.ruta)
+        visto.append(conexion.execute("SELECT COUNT(*) FROM mensajes_privados WHERE id = ?",
+                                      (aviso["id"],)).fetchone()[0])
+        conexion.close()
+
+    escritura = escritura_sin_socketio(pool, [])
+    escritura.al_guardar = al_guardar
+    for n in range(3):
+        escritura.encolar(1, 2, f"m{n}", sid="s1")
+    escritura._cola.put(_FIN)
+    escritura._bucle()
+    assert visto == [1, 1, 1]
+
+
+def test_secuencias_de_dos_pools_no_se_pisan(ruta_migrada):
+    pools = [PoolConexiones(ruta_migrada) for _ in range(2)]
+    try:
+        a, b = (Secuencia(pool, "mensajes_sala", bloque=10) for pool in pools)
+        ids_a, ids_b = [], []
+        for _ in range(25):
+            ids_a.append(a.siguiente())
+            ids_b.append(b.siguiente())
+        assert not set(ids_a) & set(ids_b)
+        # Cada worker asigna en memoria dentro de bloques contiguos de 10
+        assert ids_a[:10] == list(range(ids_a[0], ids_a[0] + 10))
+        assert ids_b[:10] == list(range(ids_b[0], ids_b[0] + 10))
+
+        # Una fila insertada por fuera de la secuencia queda por debajo del próximo bloque
+        with pools[0].conexion() as conn:
+            conn.execute("INSERT INTO mensajes_sala (id, sala, username, mensaje, fecha) "
+                         "VALUES (1000, 'general', 'ana', 'hola', '2025-01-01 00:00:00')")
+            conn.commit()
+        c = Secuencia(pools[1], "mensajes_sala", bloque=10)
+        assert c.siguiente() == 1001
+    finally:
+        for pool in pools:
+            pool.cerrar()
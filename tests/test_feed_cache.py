@@ -0,0 +1,45 @@
+"""Cache del feed con escrituras hechas por otro worker."""
+import sqlite3
+
+import cambios
+from cache import CacheVersionada
+
+
+def test_sincronizar_vacia_solo_si_cambia_la_version():
+    cache = CacheVersionada()
+    cache.sincronizar(1)
+    cache.guardar("pagina", "{}", cache.version)
+    cache.sincronizar(1)
+    assert cache.obtener("pagina") is not None
+    cache.sincronizar(2)
+    assert cache.obtener("pagina") is None
+
+
+def test_version_publica_ignora_mensajes_privados(app):
+    with app.db_pool.conexion() as conn:
+        antes = cambios.version_publica(conn)
+        conn.execute("INSERT INTO mensajes_privados (remitente_id, destinatario_id, mensaje, fecha) "
+                     "VALUES (1, 2, 'hola', '2025-06-01 00:00:00')")
+        conn.commit()
+        assert cambios.version_publica(conn) == antes
+        conn.execute("UPDATE proyectos SET titulo = titulo || '!' WHERE id = 1")
+        conn.commit()
+        assert cambios.version_publica(conn) > antes
+
+
+def test_feed_ve_escrituras_de_otro_worker(app, cliente, monkeypatch):
+    monkeypatch.setattr(app, "MQ_URL", "memoria://")
+    primera = cliente.get("/api/proyectos")
+    etag = primera.headers["ETag"]
+    assert cliente.get("/api/proyectos", headers={"If-None-Match": etag}).status_code == 304
+
+    # Otro proceso cambia un proyecto sin pasar por feed_cache.invalidar()
+    otro = sqlite3.connect(app.DB_PATH)
+    proyecto_id = primera.get_json()["proyectos"][0]["id"]
+    otro.execute("UPDATE proyectos SET titulo = 'Cambiado por otro worker' WHERE id = ?", (proyecto_id,))
+    otro.commit()
+    otro.close()
+
+    respuesta = cliente.get("/api/proyectos", headers={"If-None-Match": etag})
+    assert respuesta.status_code == 200
+    assert respuesta.get_json()["proyectos"][0]["titulo"] == "Cambiado por otro worker"
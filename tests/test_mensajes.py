@@ -0,0 +1,30 @@
+"""Historial de mensajes privados en streaming y su conexión del pool."""
+from conftest import encabezados
+
+
+def en_uso(app):
+    return app.db_pool.metricas()["en_uso"]
+
+
+def test_conexion_vuelve_al_pool_tras_leer_todo(app, cliente):
+    antes = en_uso(app)
+    respuesta = cliente.get("/api/mensajes/1/2", headers=encabezados(app, 1))
+    assert respuesta.status_code == 200
+    assert respuesta.get_json()["success"]
+    respuesta.close()
+    assert en_uso(app) == antes
+
+
+def test_conexion_vuelve_al_pool_si_se_cierra_sin_leer(app, cliente):
+    antes = en_uso(app)
+    respuesta = cliente.get("/api/mensajes/1/2", headers=encabezados(app, 1))
+    assert en_uso(app) == antes + 1
+    respuesta.close()
+    assert en_uso(app) == antes
+
+
+def test_pool_no_se_agota_con_muchas_paginas(app, cliente):
+    for _ in range(app.db_pool.tamano_max * 3):
+        with cliente.get("/api/mensajes/1/2", headers=encabezados(app, 1)) as respuesta:
+            assert respuesta.status_code == 200
+    assert en_uso(app) == 0
@@ -0,0 +1,46 @@
+"""Las consultas críticas de db.CONSULTAS_CRITICAS se resuelven con índices.
+
+    python -m pytest -q tests
+"""
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import db  # noqa: E402
+
+
+def base_migrada(carpeta):
+    conexion = sqlite3.connect(os.path.join(carpeta, "planes.db"))
+    db.migrar(conexion)
+    return conexion
+
+
+def test_consultas_criticas_usan_indices(tmp_path):
+    conexion = base_migrada(tmp_path)
+    try:
+        assert db.verificar_planes(conexion) == []
+    finally:
+        conexion.close()
+
+
+def test_detecta_indice_faltante(tmp_path):
+    conexion = base_migrada(tmp_path)
+    try:
+        conexion.execute("DROP INDEX idx_comentarios_proyecto_fecha")
+        problemas = db.verificar_planes(conexion)
+        assert "comentarios_proyecto" in {nombre for nombre, _ in problemas}
+    finally:
+        conexion.close()
+
+
+def test_toda_consulta_de_la_app_esta_verificada():
+    import consultas
+    verificadas = {sql for sql, _, _ in db.CONSULTAS_CRITICAS.values()}
+    for nombre in dir(consultas):
+        if nombre.startswith("SQL_"):
+            sql = getattr(consultas, nombre)
+            if "{tabla}" in sql:
+                sql = sql.format(op="<", orden="DESC", tabla="mensajes_privados")
+            assert sql in verificadas, nombre
@@ -0,0 +1,28 @@
+"""Presencia compartida y historial de salas sobre la conexión del evento."""
+import pytest
+
+from pool import PoolAgotado, PoolConexiones
+from presencia import PresenciaCompartida
+from salas import HistorialSalas
+
+
+@pytest.fixture
+def pool_de_uno(ruta_migrada):
+    pool = PoolConexiones(ruta_migrada, tamano_max=1, timeout=0.2)
+    yield pool
+    pool.cerrar()
+
+
+def test_join_con_una_sola_conexion(pool_de_uno):
+    presencia = PresenciaCompartida(pool_de_uno)
+    historial = HistorialSalas(pool_de_uno, compartido=True)
+    with pool_de_uno.conexion() as conn:
+        # Con el pool agotado por el propio evento, todo pasa por `conn`
+        presencia.unir_sala("sid1", "ana", "general", conn=conn)
+        presencia.unir_sala("sid2", "beto", "general", conn=conn)
+        assert presencia.usuarios_en_sala("general", conn=conn) == ["ana", "beto"]
+        assert presencia.cantidad_en_sala("general", conn=conn) == 2
+        assert historial.recientes("general", conn=conn) == []
+        with pytest.raises(PoolAgotado):
+            presencia.usuarios_en_sala("general")
+    assert presencia.usuarios_en_sala("general") == ["ana", "beto"]
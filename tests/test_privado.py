@@ -0,0 +1,27 @@
+"""Eventos del chat privado por Socket.IO."""
+
+
+def conectar(app, usuario_id):
+    return app.socketio.test_client(app.app, auth={"token": app.sesiones.emitir(usuario_id)})
+
+
+def test_typing_ignora_destinatario_invalido(app):
+    socket = conectar(app, 1)
+    antes = app.escribiendo_privado.metricas()["eventos"]
+    for destinatario in ("2", None, True, 2.5, [2], -3):
+        socket.emit("typing_private", {"destinatarioId": destinatario})
+        socket.emit("stop_typing_private", {"destinatarioId": destinatario})
+    assert app.escribiendo_privado.metricas()["eventos"] == antes
+
+    socket.emit("typing_private", {"destinatarioId": 2})
+    assert app.escribiendo_privado.metricas()["eventos"] == antes + 1
+    socket.emit("stop_typing_private", {"destinatarioId": 2})
+    socket.disconnect()
+
+
+def test_send_private_message_rechaza_destinatario_no_entero(app):
+    socket = conectar(app, 1)
+    ack = socket.emit("send_private_message", {"destinatarioId": "2", "mensaje": "hola"},
+                      callback=True)
+    assert ack == {"success": False, "error": "Faltan datos del mensaje"}
+    socket.disconnect()
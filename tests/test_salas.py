@@ -0,0 +1,49 @@
+"""Escritura por lotes del historial de salas."""
+import pytest
+
+from escritura import Secuencia, fecha_actual
+from pool import PoolConexiones
+from salas import HistorialSalas
+
+
+@pytest.fixture
+def historial(ruta_migrada):
+    pool = PoolConexiones(ruta_migrada)
+    historial = HistorialSalas(pool)
+    historial.secuencia = Secuencia(pool, "mensajes_sala")
+    yield historial
+    pool.cerrar()
+
+
+def guardados(historial):
+    with historial.pool.conexion() as conn:
+        return [fila["mensaje"] for fila in conn.execute("SELECT mensaje FROM mensajes_sala ORDER BY id")]
+
+
+def test_una_fila_invalida_no_frena_el_lote(historial):
+    historial.registrar("general", "ana", "hola", fecha_actual())
+    malo = dict(historial.registrar("general", "ana", "repetido", fecha_actual()))
+    historial._pendientes.pop()
+    malo["username"] = None   # viola NOT NULL
+    historial._pendientes.append(("general", malo, 0))
+    historial.registrar("general", "beto", "chau", fecha_actual())
+    historial.guardar_pendientes()
+
+    assert guardados(historial) == ["hola", "chau"]
+    metricas = historial.metricas()
+    assert metricas["pendientes"] == 0
+    assert metricas["guardados"] == 2
+    assert metricas["descartados"] == 1
+
+
+def test_error_pasajero_se_reintenta_y_despues_se_descarta(historial, monkeypatch):
+    historial.registrar("general", "ana", "hola", fecha_actual())
+    with historial.pool.conexion() as conn:
+        conn.execute("DROP TABLE mensajes_sala")   # OperationalError en cada intento
+        conn.commit()
+    for vuelta in range(1, HistorialSalas.REINTENTOS):
+        historial.guardar_pendientes()
+        assert historial.metricas()["pendientes"] == 1, vuelta
+    historial.guardar_pendientes()
+    assert historial.metricas()["pendientes"] == 0
+    assert historial.metricas()["descartados"] == 1
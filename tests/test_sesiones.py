@@ -0,0 +1,67 @@
+"""Tokens de sesión firmados y su uso por cookie, Bearer y handshake de Socket.IO."""
+from datos import PASSWORD
+from sesiones import COOKIE_SESION, FirmadorSesiones
+
+from conftest import encabezados
+
+
+def test_token_firmado_ida_y_vuelta():
+    firmador = FirmadorSesiones("secreto")
+    token = firmador.emitir(7)
+    assert firmador.verificar(token) == 7
+
+    assert firmador.verificar(token[:-2] + ("A" if token[-2] != "A" else "B") + token[-1]) is None
+    assert FirmadorSesiones("otro secreto").verificar(token) is None
+    assert FirmadorSesiones("secreto", duracion=-1).verificar(token) is None
+    for invalido in (None, "", 7, {"uid": 7}):
+        assert firmador.verificar(invalido) is None
+
+
+def test_login_deja_la_cookie_y_la_cookie_alcanza(app, cliente):
+    assert cliente.get("/api/conversaciones/3").status_code == 401
+
+    respuesta = cliente.post("/api/login", json={"email": "usuario3@techpaint.com",
+                                                 "password": PASSWORD})
+    assert respuesta.get_json()["success"]
+    cookie = next(valor for valor in respuesta.headers.getlist("Set-Cookie")
+                  if valor.startswith(COOKIE_SESION + "="))
+    assert "HttpOnly" in cookie and "SameSite=Lax" in cookie
+    assert app.sesiones.verificar(respuesta.get_json()["token"]) == 3
+
+    assert cliente.get("/api/conversaciones/3").status_code == 200
+    # El id de la URL tiene que ser el de la sesión
+    assert cliente.get("/api/conversaciones/4").status_code == 403
+
+    cliente.post("/api/logout")
+    assert cliente.get("/api/conversaciones/3").status_code == 401
+
+
+def test_bearer_y_token_alterado(app, cliente):
+    assert cliente.get("/api/conversaciones/5", headers=encabezados(app, 5)).status_code == 200
+    alterado = {"Authorization": "Bearer " + app.sesiones.emitir(5) + "x"}
+    assert cliente.get("/api/conversaciones/5", headers=alterado).status_code == 401
+
+
+def test_el_socket_queda_ligado_al_usuario_del_token(app, cliente):
+    cliente.post("/api/login", json={"email": "usuario6@techpaint.com", "password": PASSWORD})
+    por_cookie = app.socketio.test_client(app.app, flask_test_client=cliente)
+    por_auth = app.socketio.test_client(app.app, auth={"token": app.sesiones.emitir(8)})
+    falsificado = app.socketio.test_client(app.app, auth={"token": "uid-8"})
+    try:
+        por_cookie.emit("join_private_chat", {})
+        por_cookie.get_received()
+        ack = por_auth.emit("send_private_message", {"destinatarioId": 6, "mensaje": "hola"},
+                            callback=True)
+        assert ack["success"]
+        recibidos = [r["args"][0] for r in por_cookie.get_received()
+                     if r["name"] == "new_private_message"]
+        # El remitente sale del token del handshake, no de lo que manda el cliente
+        assert [(m["remitente_id"], m["destinatario_id"]) for m in recibidos] == [(8, 6)]
+
+        # Sin token válido el socket conecta pero no es nadie
+        ack = falsificado.emit("send_private_message", {"destinatarioId": 6, "mensaje": "hola"},
+                               callback=True)
+        assert ack == {"success": False, "error": "Sesión requerida"}
+    finally:
+        for socket in (por_cookie, por_auth, falsificado):
+            socket.disconnect()
@@ -0,0 +1,84 @@
+"""Exportar e importar ida y vuelta, con los mensajes del archivo."""
+import sqlite3
+from datetime import datetime, timezone
+
+import pytest
+
+import volcado
+from archivo import ArchivoMensajes
+from datos import sembrar
+
+
+SQL_BUSCAR = "SELECT rowid FROM proyectos_fts WHERE proyectos_fts MATCH 'python' ORDER BY rowid"
+
+
+def contenido(conn, tabla):
+    nombres = ", ".join(volcado.columnas(conn, tabla))
+    return conn.execute(f"SELECT {nombres} FROM {tabla} ORDER BY id").fetchall()
+
+
+@pytest.fixture
+def origen(tmp_path, monkeypatch):
+    """Base sembrada con parte de los mensajes ya archivados; devuelve (ruta, tablas)"""
+    monkeypatch.setenv("TECHPAINT_ARCHIVO_DIR", str(tmp_path / "archivo"))
+    ruta = str(tmp_path / "origen.db")
+    conn = sqlite3.connect(ruta)
+    conn.row_factory = sqlite3.Row
+    sembrar(conn, usuarios=15, proyectos=20, votos=120, comentarios=60, mensajes=400)
+    tablas = {tabla: [tuple(fila) for fila in contenido(conn, tabla)] for tabla in volcado.TABLAS}
+    tablas["conversaciones"] = conn.execute(
+        "SELECT * FROM conversaciones ORDER BY usuario_id, contacto_id").fetchall()
+    tablas["contadores"] = conn.execute("SELECT id, likes, dislikes FROM proyectos ORDER BY id").fetchall()
+    tablas["busqueda"] = conn.execute(SQL_BUSCAR).fetchall()
+
+    movidos = ArchivoMensajes(str(tmp_path / "archivo"), dias=180).archivar(
+        conn, ahora=datetime(2026, 3, 1, tzinfo=timezone.utc))
+    assert movidos > 0
+    conn.close()
+    return ruta, tablas
+
+
+@pytest.mark.parametrize("formato,comprimido", [("ndjson", True), ("csv", False)])
+def test_exportar_importar_ida_y_vuelta(origen, tmp_path, formato, comprimido):
+    ruta, esperado = origen
+    carpeta = str(tmp_path / "volcado")
+    volcado.exportar(ruta, carpeta, formato, comprimido)
+    destino = str(tmp_path / "destino.db")
+    volcado.importar(destino, carpeta, formato)
+
+    conn = sqlite3.connect(destino)
+    try:
+        for tabla in volcado.TABLAS:
+            # Los mensajes archivados vuelven a la base viva
+            assert [tuple(fila) for fila in contenido(conn, tabla)] == esperado[tabla], tabla
+        assert conn.execute("SELECT * FROM conversaciones ORDER BY usuario_id, contacto_id"
+                            ).fetchall() == [tuple(fila) for fila in esperado["conversaciones"]]
+        assert conn.execute("SELECT id, likes, dislikes FROM proyectos ORDER BY id"
+                            ).fetchall() == [tuple(fila) for fila in esperado["contadores"]]
+        # Búsqueda reconstruida y registro de cambios reiniciado
+        assert conn.execute(SQL_BUSCAR).fetchall() == [tuple(fila) for fila in esperado["busqueda"]]
+        assert conn.execute("SELECT tabla FROM cambios").fetchall() == [("reinicio",)]
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+        assert conn.execute("PRAGMA foreign_key_check").fetchall() == []
+    finally:
+        conn.close()
+
+
+def test_importar_no_deja_nada_a_medias(origen, tmp_path):
+    ruta, _ = origen
+    carpeta = tmp_path / "volcado"
+    volcado.exportar(ruta, str(carpeta))
+    with open(carpeta / "mensajes_privados.ndjson", "a", encoding="utf-8") as salida:
+        salida.write('{"id": 1, "remitente_id": 1}\n')   # id repetido: falla al final de la carga
+
+    destino = str(tmp_path / "destino.db")
+    with pytest.raises(sqlite3.IntegrityError):
+        volcado.importar(destino, str(carpeta))
+    conn = sqlite3.connect(destino)
+    try:
+        for tabla in volcado.TABLAS:
+            assert conn.execute(f"SELECT COUNT(*) FROM {tabla}").fetchone()[0] == 0, tabla
+        assert conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger'"
+                            ).fetchone()[0] > 0
+    finally:
+        conn.close()
@@ -0,0 +1,86 @@
+"""Levanta varios workers de Socket.IO en una sola máquina.
+
+Arranca el broker local de bus.py y N procesos de app.py, cada uno en su
+propio puerto (puerto, puerto+1, ...), conectados por TECHPAINT_MQ=local://.
+Un cliente conectado a cualquier worker recibe los emits de todos:
+
+    python trabajadores.py --workers 4 --host 127.0.0.1 --puerto 5050
+"""
+import argparse
+import os
+import secrets
+import subprocess
+import sys
+import time
+
+from bus import RUTA_BUS_POR_DEFECTO
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+
+
+def correr_worker(host, puerto):
+    from app import app, socketio
+    print(f"Worker {os.getpid()} en http://{host}:{puerto}")
+    socketio.run(app, host=host, port=puerto)
+
+
+def esperar_socket(ruta, timeout=5.0):
+    limite = time.time() + timeout
+    while not os.path.exists(ruta):
+        if time.time() > limite:
+            raise RuntimeError(f"El bus no creó {ruta}")
+        time.sleep(0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Varios workers de Socket.IO con bus local")
+    sub = parser.add_subparsers(dest="comando")
+    worker = sub.add_parser("worker", help="uso interno: un solo worker")
+    worker.add_argument("--host", default="127.0.0.1")
+    worker.add_argument("--puerto", type=int, required=True)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=5050)
+    parser.add_argument("--socket", default=RUTA_BUS_POR_DEFECTO)
+    args = parser.parse_args()
+
+    if args.comando == "worker":
+        correr_worker(args.host, args.puerto)
+        return
+
+    # Migrar una vez antes de levantar los workers
+    subprocess.run([sys.executable, "db.py", "migrar"], cwd=RAIZ, check=True)
+
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+    procesos = [subprocess.Popen([sys.executable, "bus.py", "--socket", args.socket], cwd=RAIZ)]
+    esperar_socket(args.socket)
+
+    entorno = dict(os.environ, TECHPAINT_MQ="local://" + args.socket)
+    if not entorno.get("TECHPAINT_SECRETO"):
+        # Todos los workers firman las sesiones con la misma clave; sin
+        # TECHPAINT_SECRETO las sesiones no sobreviven a un reinicio
+        print("TECHPAINT_SECRETO sin definir: se genera uno para esta corrida")
+        entorno["TECHPAINT_SECRETO"] = secrets.token_hex(32)
+    for i in range(args.workers):
+        procesos.append(subprocess.Popen(
+            [sys.executable, os.path.basename(__file__), "worker",
+             "--host", args.host, "--puerto", str(args.puerto + i)],
+            cwd=RAIZ, env=entorno,
+        ))
+
+    try:
+        while all(p.poll() is None for p in procesos):
+            time.sleep(0.5)
+        print("Un proceso terminó; deteniendo el resto")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in reversed(procesos):
+            p.terminate()
+        for p in procesos:
+            p.wait()
+
+
+if __name__ == "__main__":
+    main()
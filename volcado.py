@@ -0,0 +1,296 @@
+"""Exportación, importación y respaldo de la base sin cargarla en memoria.
+
+    python volcado.py exportar volcado/ --formato ndjson --gzip
+    python volcado.py importar volcado/ --base nueva.db
+    python volcado.py respaldo copia.db
+
+- exportar: una foto consistente (una sola transacción de lectura) de
+  usuarios, proyectos, votos, comentarios y mensajes_privados, fila por fila,
+  en `carpeta/<tabla>.ndjson` o `.csv` (NULL se escribe \\N en CSV). Incluye
+  los mensajes del archivo (archivo.py) salvo con --sin-archivo.
+- importar: migra la base destino y carga todo en una única transacción, con
+  executemany de a --lote filas. Los índices y triggers de cada tabla se
+  borran antes de cargarla y se recrean al final; lo que mantenían (FTS,
+  contadores de votos, conversaciones, registro de cambios) se reconstruye
+  una vez. Si algo falla no queda nada a medias. El WAL crece hasta el
+  tamaño de lo importado mientras dura.
+- respaldo: copia en caliente con la API de backup de SQLite, de a --paginas
+  páginas, sin frenar a los escritores. Las particiones del archivo son
+  archivos aparte y se copian tal cual.
+"""
+import argparse
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import time
+
+import archivo
+import busqueda
+import cambios
+import conversaciones
+import votos
+from db import DB_PATH, migrar
+
+# En orden de claves foráneas: se importa de arriba hacia abajo
+TABLAS = ("usuarios", "proyectos", "votos", "comentarios", "mensajes_privados")
+# Columnas que mantienen los triggers: se recalculan, no se exportan
+DERIVADAS = {"proyectos": ("likes", "dislikes")}
+NULO_CSV = "\\N"
+LOTE = 5000
+
+
+def columnas(conn, tabla):
+    return [fila[1] for fila in conn.execute(f"PRAGMA table_info({tabla})")
+            if fila[1] not in DERIVADAS.get(tabla, ())]
+
+
+def ruta_tabla(carpeta, tabla, formato, comprimido):
+    return os.path.join(carpeta, f"{tabla}.{formato}" + (".gz" if comprimido else ""))
+
+
+def abrir(ruta, modo):
+    if ruta.endswith(".gz"):
+        return gzip.open(ruta, modo + "t", encoding="utf-8", newline="")
+    return open(ruta, modo, encoding="utf-8", newline="")
+
+
+def informar(tabla, filas, segundos, accion):
+    print(f"{tabla}: {filas:,} filas {accion} en {segundos:.1f}s "
+          f"({filas / max(segundos, 1e-9):,.0f} filas/s)")
+
+
+# --- exportar --------------------------------------------------------------
+
+def _escribir(salida, formato, nombres, lotes):
+    filas = 0
+    if formato == "csv":
+        escritor = csv.writer(salida)
+        for lote in lotes:
+            escritor.writerows([NULO_CSV if v is None else v for v in fila] for fila in lote)
+            filas += len(lote)
+    else:
+        for lote in lotes:
+            salida.write("".join(json.dumps(dict(zip(nombres, fila)), ensure_ascii=False) + "\n"
+                                 for fila in lote))
+            filas += len(lote)
+    return filas
+
+
+def _lotes(cur):
+    while True:
+        lote = cur.fetchmany(LOTE)
+        if not lote:
+            return
+        yield lote
+
+
+def exportar(ruta_db, carpeta, formato="ndjson", comprimido=False, tablas=TABLAS, con_archivo=True):
+    os.makedirs(carpeta, exist_ok=True)
+    conn = sqlite3.connect(ruta_db, isolation_level=None)
+    # ATTACH no se puede dentro de una transacción: las particiones van antes
+    particiones = []
+    if con_archivo and "mensajes_privados" in tablas and conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'archivos'").fetchone():
+        carpeta_archivo = archivo.carpeta_por_defecto(ruta_db)
+        for particion, nombre in conn.execute("SELECT particion, archivo FROM archivos ORDER BY particion"):
+            alias = archivo.PREFIJO_ALIAS + particion
+            conn.execute(f"ATTACH DATABASE ? AS {alias}", (os.path.join(carpeta_archivo, nombre),))
+            particiones.append(alias)
+
+    conn.execute("BEGIN")   # misma foto para todas las tablas
+    try:
+        for tabla in tablas:
+            nombres = columnas(conn, tabla)
+            lista = ", ".join(nombres)
+            inicio = time.perf_counter()
+            with abrir(ruta_tabla(carpeta, tabla, formato, comprimido), "w") as salida:
+                if formato == "csv":
+                    csv.writer(salida).writerow(nombres)
+                filas = _escribir(salida, formato, nombres,
+                                  _lotes(conn.execute(f"SELECT {lista} FROM {tabla} ORDER BY rowid")))
+                if tabla == "mensajes_privados":
+                    for alias in particiones:
+                        # Un archivado cortado puede dejar la fila en las dos bases
+                        filas += _escribir(salida, formato, nombres, _lotes(conn.execute(f"""
+                            SELECT {lista} FROM {alias}.mensajes_privados a
+                            WHERE NOT EXISTS (SELECT 1 FROM main.mensajes_privados m WHERE m.id = a.id)
+                            ORDER BY a.id
+                        """)))
+            informar(tabla, filas, time.perf_counter() - inicio, "exportadas")
+    finally:
+        conn.execute("COMMIT")
+        conn.close()
+
+
+# --- importar --------------------------------------------------------------
+
+def _leer(ruta, formato):
+    """(columnas, iterador de tuplas) leyendo el archivo de a una línea"""
+    entrada = abrir(ruta, "r")
+    if formato == "csv":
+        lector = csv.reader(entrada)
+        nombres = next(lector, [])
+        filas = (tuple(None if v == NULO_CSV else v for v in fila) for fila in lector)
+        return nombres, filas, entrada
+
+    primera = entrada.readline()
+    if not primera.strip():
+        return [], iter(()), entrada
+    primero = json.loads(primera)
+    nombres = list(primero)
+
+    def filas():
+        yield tuple(primero.values())
+        for linea in entrada:
+            if linea.strip():
+                objeto = json.loads(linea)
+                yield tuple(objeto.get(nombre) for nombre in nombres)
+    return nombres, filas(), entrada
+
+
+def _esquema_de(conn, tabla):
+    """Índices (sin los de PRIMARY KEY/UNIQUE) y triggers de la tabla, con su SQL"""
+    return conn.execute("""
+        SELECT type, name, sql FROM sqlite_master
+        WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL
+    """, (tabla,)).fetchall()
+
+
+def importar(ruta_db, carpeta, formato="ndjson", lote=LOTE, tablas=TABLAS, vaciar=False):
+    conn = sqlite3.connect(ruta_db, isolation_level=None)
+    migrar(conn)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA cache_size = -262144")   # ~256 MB para reconstruir índices
+    conn.execute("PRAGMA temp_store = MEMORY")
+    # Las tablas se cargan en orden; los huérfanos se informan al final
+    conn.execute("PRAGMA foreign_keys = OFF")
+
+    rutas = {}
+    for tabla in tablas:
+        for comprimido in (False, True):
+            ruta = ruta_tabla(carpeta, tabla, formato, comprimido)
+            if os.path.exists(ruta):
+                rutas[tabla] = ruta
+    if not rutas:
+        conn.close()
+        raise SystemExit(f"No hay archivos .{formato} en {carpeta}")
+
+    total = time.perf_counter()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        quitados = []
+        for tabla in rutas:
+            for tipo, nombre, sql in _esquema_de(conn, tabla):
+                conn.execute(f"DROP {tipo.upper()} {nombre}")
+                quitados.append((tipo, sql))
+        if vaciar:
+            for tabla in reversed(TABLAS):
+                if tabla in rutas:
+                    conn.execute(f"DELETE FROM {tabla}")
+
+        for tabla in TABLAS:
+            if tabla not in rutas:
+                continue
+            nombres, filas, entrada = _leer(rutas[tabla], formato)
+            validas = set(columnas(conn, tabla))
+            desconocidas = [nombre for nombre in nombres if nombre not in validas]
+            if desconocidas:
+                raise ValueError(f"{tabla}: columnas desconocidas {desconocidas}")
+            sql = (f"INSERT INTO {tabla} ({', '.join(nombres)}) "
+                   f"VALUES ({', '.join('?' * len(nombres))})")
+            inicio = time.perf_counter()
+            cargadas = 0
+            with entrada:
+                while True:
+                    tanda = [fila for _, fila in zip(range(lote), filas)]
+                    if not tanda:
+                        break
+                    conn.executemany(sql, tanda)
+                    cargadas += len(tanda)
+            informar(tabla, cargadas, time.perf_counter() - inicio, "importadas")
+
+        inicio = time.perf_counter()
+        for _, sql in quitados:
+            conn.execute(sql)
+        print(f"índices y triggers recreados en {time.perf_counter() - inicio:.1f}s")
+
+        inicio = time.perf_counter()
+        for fts, base, _ in busqueda.INDICES_FTS:
+            if base in rutas:
+                conn.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+        if "proyectos" in rutas or "votos" in rutas:
+            votos.reconciliar(conn)
+        if "mensajes_privados" in rutas:
+            conversaciones.backfill(conn)
+        cambios.reiniciar(conn)
+        print(f"búsqueda, contadores y conversaciones reconstruidos en {time.perf_counter() - inicio:.1f}s")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        conn.close()
+        raise
+
+    huerfanos = conn.execute("PRAGMA foreign_key_check").fetchall()
+    conn.close()
+    print(f"importación completa en {time.perf_counter() - total:.1f}s"
+          + (f"; {len(huerfanos)} filas con claves foráneas rotas" if huerfanos else ""))
+
+
+# --- respaldo --------------------------------------------------------------
+
+def respaldo(ruta_db, destino, paginas=1000):
+    origen = sqlite3.connect(ruta_db)
+    copia = sqlite3.connect(destino)
+    inicio = time.perf_counter()
+
+    def progreso(estado, restantes, total):
+        print(f"\r{total - restantes}/{total} páginas", end="", flush=True)
+
+    # De a `paginas` por paso: entre pasos los escritores de la base viva siguen
+    origen.backup(copia, pages=paginas, progress=progreso)
+    segundos = time.perf_counter() - inicio
+    tamano = copia.execute("PRAGMA page_count").fetchone()[0] * copia.execute("PRAGMA page_size").fetchone()[0]
+    revision = copia.execute("PRAGMA quick_check").fetchone()[0]
+    copia.close()
+    origen.close()
+    print(f"\n{destino}: {tamano / 1e6:.1f} MB en {segundos:.1f}s "
+          f"({tamano / 1e6 / max(segundos, 1e-9):.0f} MB/s), quick_check {revision}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base", default=DB_PATH, help="base de datos (TECHPAINT_DB)")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    exp = sub.add_parser("exportar", help="tablas a archivos NDJSON/CSV")
+    exp.add_argument("carpeta")
+    exp.add_argument("--formato", choices=("ndjson", "csv"), default="ndjson")
+    exp.add_argument("--gzip", action="store_true")
+    exp.add_argument("--tablas", nargs="+", choices=TABLAS, default=list(TABLAS))
+    exp.add_argument("--sin-archivo", action="store_true", help="sólo los mensajes de la base viva")
+
+    imp = sub.add_parser("importar", help="archivos NDJSON/CSV a la base (migrada si hace falta)")
+    imp.add_argument("carpeta")
+    imp.add_argument("--formato", choices=("ndjson", "csv"), default="ndjson")
+    imp.add_argument("--tablas", nargs="+", choices=TABLAS, default=list(TABLAS))
+    imp.add_argument("--lote", type=int, default=LOTE, help="filas por executemany")
+    imp.add_argument("--vaciar", action="store_true", help="borrar antes lo que haya en esas tablas")
+
+    res = sub.add_parser("respaldo", help="copia en caliente con la API de backup")
+    res.add_argument("destino")
+    res.add_argument("--paginas", type=int, default=1000, help="páginas por paso (-1 = todo de una vez)")
+    args = parser.parse_args()
+
+    if args.comando == "exportar":
+        exportar(args.base, args.carpeta, args.formato, args.gzip, args.tablas,
+                 con_archivo=not args.sin_archivo)
+    elif args.comando == "importar":
+        importar(args.base, args.carpeta, args.formato, args.lote, args.tablas, args.vaciar)
+    else:
+        respaldo(args.base, args.destino, args.paginas)
+
+
+if __name__ == "__main__":
+    main()
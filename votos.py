@@ -0,0 +1,71 @@
+"""Contadores materializados de likes/dislikes en proyectos.
+
+Los triggers de la migración 4 mantienen proyectos.likes/dislikes en la misma
+transacción que cada cambio en votos. Un voto retirado queda con tipo NULL
+para que votar, cambiar y retirar sean el mismo upsert.
+"""
+
+
+# Mismo tipo que el voto actual: se retira (NULL). Otro tipo o sin voto: se aplica.
+SQL_VOTAR = """
+    INSERT INTO votos (proyecto_id, usuario_id, tipo) VALUES (?, ?, ?)
+    ON CONFLICT(proyecto_id, usuario_id) DO UPDATE SET
+        tipo = CASE WHEN votos.tipo IS excluded.tipo THEN NULL ELSE excluded.tipo END,
+        fecha = CURRENT_TIMESTAMP
+    RETURNING tipo
+"""
+
+TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_votos_insert AFTER INSERT ON votos
+    BEGIN
+        UPDATE proyectos
+        SET likes = likes + (NEW.tipo IS 'like'),
+            dislikes = dislikes + (NEW.tipo IS 'dislike')
+        WHERE id = NEW.proyecto_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_votos_update AFTER UPDATE OF tipo ON votos
+    BEGIN
+        UPDATE proyectos
+        SET likes = likes - (OLD.tipo IS 'like') + (NEW.tipo IS 'like'),
+            dislikes = dislikes - (OLD.tipo IS 'dislike') + (NEW.tipo IS 'dislike')
+        WHERE id = NEW.proyecto_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS trg_votos_delete AFTER DELETE ON votos
+    BEGIN
+        UPDATE proyectos
+        SET likes = likes - (OLD.tipo IS 'like'),
+            dislikes = dislikes - (OLD.tipo IS 'dislike')
+        WHERE id = OLD.proyecto_id;
+    END
+    """,
+]
+
+
+def votar(conn, proyecto_id, usuario_id, tipo):
+    """Aplica el voto y devuelve (likes, dislikes, voto_actual_del_usuario)"""
+    voto_actual = conn.execute(SQL_VOTAR, (proyecto_id, usuario_id, tipo)).fetchone()[0]
+    fila = conn.execute("SELECT likes, dislikes FROM proyectos WHERE id = ?",
+                        (proyecto_id,)).fetchone()
+    return fila[0], fila[1], voto_actual
+
+
+def reconciliar(conn):
+    """Recalcula los contadores desde votos; devuelve cuántos proyectos corrigió"""
+    cur = conn.execute("""
+        UPDATE proyectos
+        SET likes = c.likes, dislikes = c.dislikes
+        FROM (
+            SELECT p.id,
+                   (SELECT COUNT(*) FROM votos WHERE proyecto_id = p.id AND tipo = 'like') AS likes,
+                   (SELECT COUNT(*) FROM votos WHERE proyecto_id = p.id AND tipo = 'dislike') AS dislikes
+            FROM proyectos p
+        ) c
+        WHERE proyectos.id = c.id
+          AND (proyectos.likes != c.likes OR proyectos.dislikes != c.dislikes)
+    """)
+    return cur.rowcount